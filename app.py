@@ -1,47 +1,326 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, make_response, render_template, request, jsonify
+import gc
+import hmac
+import json
 import os
+import re
 import sys
+import time
 import traceback
+import uuid
 import pandas as pd
 
 # Add the project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import from your existing modules
-from chatbot import create_rolplay_analyzer, generate_response
-from core.query_processor import process_query
-from core.config import FACT_FILE_PATH, STORAGE_PATH
+from chatbot import start_rolplay_analyzer, generate_response
+from core.query_processor import process_query, query_single_flight
+from core.admission import admission_controller, AdmissionRejected
+from core.resilience import Deadline, openai_breaker
+from core.config import (
+    FACT_FILE_PATH,
+    STORAGE_PATH,
+    RAG_BACKGROUND_STARTUP,
+    QUERY_DEADLINE_SECONDS,
+    ADMIN_TOKEN,
+    TRACE_DEBUG_HEADER_ENABLED
+)
+from core.memory_report import memory_summary
+from core.memory_introspection import (
+    dataframe_memory,
+    deep_sizeof,
+    memory_registry,
+    total_accounted,
+    tracemalloc_differ
+)
+from core.metrics import registry, REQUEST_DURATION, REQUESTS, time_stage
+from core.tracing import set_trace_attributes, slow_query_log, start_trace
+from core.profiling import request_profiler
+from core.session_store import get_session_store
+from querys.querys_Fact_RolPlay_Sim import frame_cache_entries
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
-# Initialize the RAG engine
-try:
-    df, rag_engine = create_rolplay_analyzer(FACT_FILE_PATH)
-    if df is None or rag_engine is None:
-        print("Error initializing RAG engine")
-except Exception as e:
-    print(f"Error initializing app: {str(e)}")
-    traceback.print_exc()
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+# Same charset for a caller-supplied X-Request-Id reused as the trace id
+TRACE_ID_PATTERN = SESSION_ID_PATTERN
+
+rag_engine = None
+startup_error = None
+
+
+def initialize(background: bool = RAG_BACKGROUND_STARTUP) -> bool:
+    """
+    Staged startup: the dataset is loaded first (structured queries are served right away)
+    and the RAG index is built or loaded, on a background thread unless background=False.
+    Under gunicorn (preload_app) this runs once in the master with background=False, so
+    workers inherit the loaded data copy-on-write.
+    The current engine is only replaced if the new dataset loads; returns True on success.
+    """
+    global rag_engine, startup_error
+    try:
+        _, new_engine = start_rolplay_analyzer(FACT_FILE_PATH, background=background)
+        if new_engine is None:
+            if rag_engine is None:
+                startup_error = "Error loading dataset"
+            print("Error initializing RAG engine")
+            return False
+    except Exception as e:
+        if rag_engine is None:
+            startup_error = str(e)
+        print(f"Error initializing app: {str(e)}")
+        traceback.print_exc()
+        return False
+    rag_engine = new_engine
+    startup_error = None
+    return True
+
+
+def reload_data() -> bool:
+    """Reload the dataset and index synchronously (gunicorn master on SIGHUP)"""
+    return initialize(background=False)
+
+
+initialize()
+
+
+def component_status():
+    """Per-component readiness, shared by /healthz and /readyz"""
+    if rag_engine is None:
+        return {
+            "dataset": {"status": "error", "error": startup_error},
+            "structured_handlers": {"status": "unavailable"},
+            "rag_index": {"status": "unavailable"}
+        }
+    return rag_engine.readiness()
 
 @app.route('/')
 def index():
     """Render the main dashboard page with chat interface"""
     return render_template('index.html')
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up; includes component status for diagnostics"""
+    return jsonify({"status": "ok", "components": component_status()})
+
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness: 200 once structured queries can be served (dataset loaded).
+    While the RAG index is still loading the status is "degraded" (exploratory
+    queries answer with a warming-up message); 503 if the dataset is not available.
+    """
+    components = component_status()
+    if components["structured_handlers"]["status"] != "ready":
+        return jsonify({"status": "not_ready", "components": components}), 503
+    status = "ready" if components["rag_index"]["status"] == "ready" else "degraded"
+    return jsonify({"status": status, "components": components})
+
+@app.route('/stats')
+def stats():
+    """Runtime statistics (semantic cache hit rate, etc.)"""
+    cache = rag_engine.semantic_cache if rag_engine is not None else None
+    return jsonify({
+        "semantic_cache": cache.stats() if cache is not None else {"enabled": False},
+        "single_flight": query_single_flight.stats(),
+        "admission": admission_controller.stats(),
+        "openai_breaker": openai_breaker.stats(),
+        "sessions": get_session_store().stats(),
+        "profiling": request_profiler.stats(),
+        "memory": memory_summary(),
+        "pid": os.getpid()
+    })
+
+BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def runtime_metrics():
+    """Gauges/counters computed at scrape time from the components' own stats"""
+    admission = admission_controller.stats()["stages"]
+    yield ("rolplay_admission_queue_depth", "gauge", "Requests waiting for an LLM slot",
+           [({"stage": name}, s["queue_depth"]) for name, s in admission.items()])
+    yield ("rolplay_admission_in_flight", "gauge", "LLM calls in flight",
+           [({"stage": name}, s["in_flight"]) for name, s in admission.items()])
+    yield ("rolplay_admission_wait_seconds_avg", "gauge", "Average wait for an LLM slot",
+           [({"stage": name}, s["wait_avg_s"]) for name, s in admission.items()])
+    yield ("rolplay_admission_rejected_total", "counter", "Requests rejected by admission control",
+           [({"stage": name, "reason": reason}, count)
+            for name, s in admission.items() for reason, count in s["rejected"].items()])
+    yield ("rolplay_openai_breaker_state", "gauge", "OpenAI circuit breaker (0 closed, 1 half-open, 2 open)",
+           [({}, BREAKER_STATE_VALUES[openai_breaker.state])])
+    flights = query_single_flight.stats()
+    yield ("rolplay_single_flight_coalesced_total", "counter", "Queries served by an identical in-flight query",
+           [({}, flights["coalesced"])])
+    cache = rag_engine.semantic_cache if rag_engine is not None else None
+    if cache is not None:
+        yield ("rolplay_semantic_cache_entries", "gauge", "Entries in the semantic answer cache",
+               [({}, cache.stats()["entries"])])
+
+
+registry.register_collector(runtime_metrics)
+
+
+def _index_part(name):
+    """Provider for a part of the loaded RAG index (None until the index is ready)"""
+    def provider():
+        index = rag_engine.index if rag_engine is not None else None
+        if index is None:
+            return None
+        if name == "vector_store":
+            return index.vector_store
+        if name == "docstore":
+            return index.docstore
+        return index.storage_context.index_store
+    return provider
+
+
+def _frame_cache_memory():
+    """Structures cached per DataFrame by frame_cache, with their count per kind"""
+    entries = frame_cache_entries()
+    report = deep_sizeof(list(entries.values()))
+    report["entries"] = {kind: len(values) for kind, values in entries.items()}
+    return report
+
+
+# Components reported by /admin/memory; providers read the globals on each call
+# because a reload replaces the engine
+memory_registry.register(
+    "raw_data",
+    lambda: dataframe_memory(rag_engine.raw_data) if rag_engine is not None and rag_engine.raw_data is not None else None
+)
+memory_registry.register("vector_store", _index_part("vector_store"))
+memory_registry.register("docstore", _index_part("docstore"))
+memory_registry.register("index_store", _index_part("index_store"))
+memory_registry.register("semantic_cache", lambda: rag_engine.semantic_cache if rag_engine is not None else None)
+memory_registry.register("gazetteer", lambda: rag_engine.gazetteer if rag_engine is not None else None)
+memory_registry.register("frame_cache", _frame_cache_memory)
+memory_registry.register("sessions", get_session_store)
+memory_registry.register("single_flight", lambda: query_single_flight)
+memory_registry.register("metrics_registry", lambda: registry)
+
+
+def _admin_authorized() -> bool:
+    """ADMIN_TOKEN as a bearer token or X-Admin-Token; without a token only loopback callers"""
+    if not ADMIN_TOKEN:
+        return request.remote_addr in ("127.0.0.1", "::1")
+    auth = request.headers.get("Authorization", "")
+    supplied = auth[7:] if auth.startswith("Bearer ") else request.headers.get("X-Admin-Token", "")
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+@app.route('/admin/memory')
+def admin_memory():
+    """
+    Deep memory use per component of this worker (dataset per column, vector store,
+    docstore, caches, sessions) next to the process RSS/PSS. Query parameters:
+    - gc=1: run a full garbage collection first.
+    - tracemalloc=diff: start tracemalloc on the first call (baseline) and return the
+      top allocation growth since the previous call on later ones; tracemalloc=stop ends it.
+      Optional limit (default 25) and group_by (lineno, filename, traceback).
+    Walking the object graph takes a while on large datasets; meant for occasional use.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if request.args.get("gc") == "1":
+        gc.collect()
+    components = memory_registry.report()
+    body = {
+        "pid": os.getpid(),
+        "process": memory_summary(),
+        "accounted": total_accounted(components),
+        "components": components
+    }
+    mode = request.args.get("tracemalloc")
+    if mode == "diff":
+        group_by = request.args.get("group_by", "lineno")
+        if group_by not in ("lineno", "filename", "traceback"):
+            return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+        body["tracemalloc"] = tracemalloc_differ.diff(limit=request.args.get("limit", 25, type=int), group_by=group_by)
+    elif mode == "stop":
+        body["tracemalloc"] = tracemalloc_differ.stop()
+    return jsonify(body)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition (per worker process)"""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    if request.path == '/query':
+        status = str(response.status_code)
+        REQUEST_DURATION.observe(time.perf_counter() - g.request_start, status=status)
+        REQUESTS.inc(status=status)
+    return response
+
+
 @app.route('/query', methods=['POST'])
 def query():
-    """Process user queries and return responses"""
+    """
+    Process user queries and return responses. Every request is traced: the trace id
+    is returned in X-Trace-Id; with the X-Debug-Trace request header the span tree is
+    returned too (Server-Timing and X-Trace). Slow requests go to the slow-query log.
+    """
+    request_id = request.headers.get("X-Request-Id", "")
+    trace_id = request_id if TRACE_ID_PATTERN.match(request_id) else None
+    with start_trace("query", trace_id=trace_id) as trace:
+        response = make_response(_handle_query())
+        set_trace_attributes(response_bytes=response.calculate_content_length())
+
+    response.headers["X-Trace-Id"] = trace.trace_id
+    if trace.attributes.get("profile"):
+        response.headers["X-Profile-File"] = os.path.basename(trace.attributes["profile"])
+    if TRACE_DEBUG_HEADER_ENABLED and request.headers.get("X-Debug-Trace"):
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace"] = json.dumps(trace.to_dict(), separators=(",", ":"), default=str)
+    slow_query_log.maybe_record(trace, status=response.status_code)
+    return response
+
+
+def _handle_query():
     try:
         user_query = request.json.get('query', '')
         if not user_query:
             return jsonify({"error": "Query is required"}), 400
+
+        # Conversation context is scoped to the widget's session; without a valid id
+        # the query gets a fresh session (no follow-up context, nothing leaks between users)
+        session_id = request.json.get('session_id')
+        if not isinstance(session_id, str) or not SESSION_ID_PATTERN.match(session_id):
+            session_id = uuid.uuid4().hex
+        set_trace_attributes(query=user_query, session_id=session_id)
             
         # Process the query using your existing backend
-        response = process_query(rag_engine, user_query, generate_response)
+        # Time budget for the whole request; every LLM call and retry must fit inside it
+        deadline = Deadline(QUERY_DEADLINE_SECONDS)
+        # Opt-in profiling (sampled, or on demand with a signed X-Profile header)
+        with request_profiler.maybe_profile(request.headers.get("X-Profile")):
+            response = process_query(rag_engine, user_query, generate_response,
+                                     session_id=session_id, deadline=deadline)
         
+        with time_stage("serialization"):
+            body = jsonify({
+                "response": response,
+                "session_id": session_id
+            })
+        return body
+    except AdmissionRejected as e:
+        # Over capacity: fail fast so clients back off instead of piling up
         return jsonify({
-            "response": response
-        })
+            "error": "El servicio está saturado, intenta de nuevo en unos segundos.",
+            "stage": e.stage,
+            "reason": e.reason,
+            "retry_after": e.retry_after
+        }), 429, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         print(f"Error processing query: {str(e)}")
         traceback.print_exc()
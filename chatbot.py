@@ -8,11 +8,12 @@ import pandas as pd
 from datetime import datetime
 from llama_index.core import Settings
 from llama_index.llms.openai import OpenAI
-from openai import OpenAI as ClientOpenAI
+from openai import APIStatusError, OpenAI as ClientOpenAI
 
 # Config y utils
 from core.config import (
     OPENAI_API_KEY,
+    OPENAI_BASE_URL,
     DEFAULT_OPENAI_MODEL,
     OPENAI_TIMEOUT,
     STORAGE_PATH,
@@ -32,6 +33,11 @@ from core.text_processing import (
 
 # (NUEVO) Importamos process_query desde core/query_processor
 from core.query_processor import process_query
+from core.admission import AdmissionRejected, STAGE_GENERATION
+from core.fallback_response import templated_response
+from core.keyword_matcher import QUERY_KEYWORDS
+from core.metrics import FALLBACKS
+from core.resilience import Deadline, ProviderUnavailable, call_llm
 
 # Import engine RAG
 from rag_engine import RolPlayRAG
@@ -57,20 +63,18 @@ from prompts.analyst_prompt import (
     ANALYST_SYSTEM_PROMPT_DATA_ADDITION
 )
 
-client = ClientOpenAI(api_key=OPENAI_API_KEY)
+# Los reintentos los controla call_llm (backoff dentro del presupuesto de la solicitud)
+client = ClientOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
 
 conversation_history = []
 
-def generate_response(query: str, data: dict = None, query_type: str = "conversation") -> str:
+def generate_response(query: str, data: dict = None, query_type: str = "conversation",
+                      deadline: Deadline = None) -> str:
     """
-    Genera una respuesta natural utilizando GPT-4.
+    Genera una respuesta natural utilizando GPT-4. Si GPT-4 no está disponible
+    (errores, `deadline` agotado o circuit breaker abierto) responde con una plantilla.
     """
-    is_asking_for_data = any(keyword in query.lower() for keyword in [
-        "qué datos", "que datos", "cuáles datos", "cuales datos",
-        "qué información", "que información", "qué registros", "que registros",
-        "cómo lo calculaste", "como lo calculaste", "cómo lo obtuviste",
-        "como lo obtuviste", "de dónde", "de donde", "qué usaste", "que usaste"
-    ])
+    is_asking_for_data = QUERY_KEYWORDS.has(query, "data_question")
 
     if data and isinstance(data, dict) and "error" in data:
         messages = [
@@ -116,35 +120,89 @@ Responde SIEMPRE en **Markdown** con formato claro:
         ]
 
     try:
-        response = client.chat.completions.create(
-            model=DEFAULT_OPENAI_MODEL,
-            messages=messages,
-            temperature=0.3
+        response = call_llm(
+            lambda timeout: client.chat.completions.create(
+                model=DEFAULT_OPENAI_MODEL,
+                messages=messages,
+                temperature=0.3,
+                timeout=timeout
+            ),
+            stage=STAGE_GENERATION,
+            deadline=deadline,
+            max_attempts=2
         )
         return response.choices[0].message.content
 
+    except (ProviderUnavailable, APIStatusError) as e:
+        # APIStatusError: la API rechazó la petición (p. ej. contexto excedido por un
+        # payload grande); call_llm no la reintenta, pero la plantilla sigue sirviendo
+        print(f"GPT-4 no disponible para generate_response ({str(e)}); usando plantilla")
+        FALLBACKS.inc(kind="template_response")
+        return templated_response(query, data, query_type)
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Error en generate_response: {str(e)}")
         traceback.print_exc()
         return f"Lo siento, hubo un error al generar la respuesta. Detalles: {str(e)}"
 
+def load_dataset(excel_path: str) -> pd.DataFrame:
+    """
+    Carga el archivo Excel de hechos. Es la única etapa que necesitan los handlers estructurados.
+    """
+    df = pd.read_excel(excel_path)
+    print("\nEstructura del DataFrame:")
+    print("Columnas:", df.columns.tolist())
+    return df
+
 def create_rolplay_analyzer(excel_path: str):
     """
     Crea y configura el analizador RAG a partir de un archivo Excel.
+    Bloquea hasta que el índice vectorial está listo (uso en consola).
     """
     try:
-        df = pd.read_excel(excel_path)
-        print("\nEstructura del DataFrame:")
-        print("Columnas:", df.columns.tolist())
+        df = load_dataset(excel_path)
         
         rag_engine = RolPlayRAG(persist_dir=STORAGE_PATH)
-        rag_engine.build_index(df)
-        return df, rag_engine
+        rag_engine.load_data(df)
+        rag_engine.build_index(rag_engine.raw_data, source_path=excel_path)
+        return rag_engine.raw_data, rag_engine
+    except Exception as e:
+        print(f"Error creando el analizador: {str(e)}")
+        traceback.print_exc()
+        return None, None
+
+def start_rolplay_analyzer(excel_path: str, background: bool = True):
+    """
+    Arranque por etapas para el servidor:
+    1. Carga el dataset y deja listos los handlers estructurados.
+    2. Construye o carga el índice vectorial, en un hilo de fondo (background=True)
+       o antes de retornar (background=False, p. ej. en el master de gunicorn antes
+       del fork: los hilos no sobreviven al fork).
+    Un error en la etapa 2 no invalida la 1; el estado del índice se consulta
+    con rag_engine.readiness().
+    """
+    try:
+        rag_engine = RolPlayRAG(persist_dir=STORAGE_PATH)
+        # load_data guarda su propia copia: el DataFrame leído no se retiene
+        rag_engine.load_data(load_dataset(excel_path))
+        df = rag_engine.raw_data
     except Exception as e:
         print(f"Error creando el analizador: {str(e)}")
         traceback.print_exc()
         return None, None
 
+    if background:
+        print("Datos cargados: consultas estructuradas disponibles. Cargando índice RAG en segundo plano...")
+        rag_engine.build_index_async(df, source_path=excel_path)
+    else:
+        try:
+            rag_engine.build_index(df, source_path=excel_path)
+        except Exception:
+            # build_index ya registró el error; las consultas estructuradas siguen disponibles
+            pass
+    return df, rag_engine
+
 if __name__ == "__main__":
     if DEBUG_MODE:
         log_config()
@@ -161,7 +219,10 @@ if __name__ == "__main__":
                 if query.lower() == 'q':
                     break
                 # Llamamos a process_query y le pasamos generate_response como 3er arg
-                response = process_query(rag_engine, query, generate_response)
+                try:
+                    response = process_query(rag_engine, query, generate_response)
+                except AdmissionRejected as e:
+                    response = f"El sistema está saturado; intenta de nuevo en {e.retry_after} segundos."
                 print("\nRespuesta:")
                 print(response)
                 
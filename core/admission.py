@@ -0,0 +1,178 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from core.rate_limit import TokenBucket
+
+# Etapas que llaman al LLM
+STAGE_INTENT = "intent"
+STAGE_RAG = "rag"
+STAGE_GENERATION = "generation"
+
+
+class AdmissionRejected(Exception):
+    """
+    La solicitud no fue admitida (cola llena, espera agotada o límite de tasa).
+    Debe propagarse hasta la capa HTTP, que responde 429 con Retry-After.
+    """
+
+    def __init__(self, stage: str, reason: str, retry_after: float):
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        super().__init__(f"Capacidad agotada en la etapa '{stage}' ({reason}); reintentar en {self.retry_after}s")
+
+
+class StageLimiter:
+    """
+    Límite de concurrencia de una etapa con cola acotada:
+    - max_concurrency llamadas en curso a la vez.
+    - Hasta max_queue solicitudes esperando un lugar; si la cola está llena se
+      rechaza de inmediato, y si la espera supera queue_timeout también.
+    Registra profundidad de cola, tiempos de espera y duración de cada llamada.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._admitted = 0
+        self._rejected = {"queue_full": 0, "queue_timeout": 0, "rate_limited": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._service_avg = 1.0  # media móvil de la duración de una llamada (s)
+
+    def _retry_after(self, queued: int) -> float:
+        return self._service_avg * (queued + 1) / self.max_concurrency
+
+    def reserve(self):
+        """Ocupa un lugar en la cola o rechaza si está llena."""
+        with self._lock:
+            if self._queued >= self.max_queue and self._in_flight >= self.max_concurrency:
+                self._rejected["queue_full"] += 1
+                raise AdmissionRejected(self.name, "queue_full", self._retry_after(self._queued))
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Espera un lugar de ejecución (la solicitud ya reservó su lugar en la cola)."""
+        start = time.monotonic()
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        acquired = self._slots.acquire(timeout=timeout)
+        waited = time.monotonic() - start
+        with self._lock:
+            self._queued -= 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if not acquired:
+                self._rejected["queue_timeout"] += 1
+                raise AdmissionRejected(self.name, "queue_timeout", self._retry_after(self._queued))
+            self._in_flight += 1
+            self._admitted += 1
+
+    def leave_queue(self, reason: str):
+        with self._lock:
+            self._queued -= 1
+            self._rejected[reason] += 1
+
+    def release(self, duration: float):
+        with self._lock:
+            self._in_flight -= 1
+            self._service_avg = 0.8 * self._service_avg + 0.2 * duration
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = self._admitted + self._rejected["queue_timeout"]
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queued,
+                "admitted": self._admitted,
+                "rejected": dict(self._rejected),
+                "wait_avg_s": round(self._wait_total / waits, 4) if waits else 0.0,
+                "wait_max_s": round(self._wait_max, 4),
+                "service_avg_s": round(self._service_avg, 4),
+            }
+
+
+class AdmissionController:
+    """
+    Control de admisión de las llamadas al LLM: un StageLimiter por etapa más un
+    token bucket global (compartido por todas las etapas) que respeta el límite de
+    solicitudes por minuto del proveedor. Los límites son por proceso: con N workers
+    de gunicorn la capacidad total es N veces la configurada.
+    """
+
+    def __init__(self, stages: Dict[str, StageLimiter], bucket: Optional[TokenBucket] = None,
+                 enabled: bool = True):
+        self.stages = stages
+        self.bucket = bucket
+        self.enabled = enabled
+
+    @contextmanager
+    def admit(self, stage: str, deadline=None):
+        """La espera en cola también queda acotada por el `deadline` de la solicitud, si se pasa."""
+        limiter = self.stages.get(stage)
+        if not self.enabled or limiter is None:
+            yield
+            return
+
+        limiter.reserve()
+        if self.bucket is not None and not self.bucket.try_acquire():
+            limiter.leave_queue("rate_limited")
+            raise AdmissionRejected(stage, "rate_limited", self.bucket.time_until_available())
+        limiter.wait(deadline.remaining() if deadline is not None else None)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        result = {"enabled": self.enabled, "stages": {name: s.stats() for name, s in self.stages.items()}}
+        if self.bucket is not None:
+            result["token_bucket"] = {
+                "capacity": self.bucket.capacity,
+                "refill_per_s": round(self.bucket.refill_rate, 4),
+                "available": round(self.bucket.available, 2),
+            }
+        return result
+
+
+def create_admission_controller() -> AdmissionController:
+    from core.config import (
+        ADMISSION_ENABLED,
+        ADMISSION_INTENT_CONCURRENCY,
+        ADMISSION_RAG_CONCURRENCY,
+        ADMISSION_GENERATION_CONCURRENCY,
+        ADMISSION_QUEUE_SIZE,
+        ADMISSION_QUEUE_TIMEOUT,
+        LLM_REQUESTS_PER_MINUTE,
+        LLM_REQUESTS_BURST
+    )
+    limits = {
+        STAGE_INTENT: ADMISSION_INTENT_CONCURRENCY,
+        STAGE_RAG: ADMISSION_RAG_CONCURRENCY,
+        STAGE_GENERATION: ADMISSION_GENERATION_CONCURRENCY,
+    }
+    stages = {
+        name: StageLimiter(name, concurrency, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+        for name, concurrency in limits.items()
+    }
+    bucket = TokenBucket.per_minute(LLM_REQUESTS_PER_MINUTE, LLM_REQUESTS_BURST) if LLM_REQUESTS_PER_MINUTE > 0 else None
+    return AdmissionController(stages, bucket, enabled=ADMISSION_ENABLED)
+
+
+# Controlador del proceso, compartido por intent_detection, chatbot y rag_engine
+admission_controller = create_admission_controller()
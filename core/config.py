@@ -22,6 +22,10 @@ DEFAULT_OPENAI_MODEL = "gpt-4"
 # O algún parámetro de timeout:
 OPENAI_TIMEOUT = int(os.getenv("OPENAI_TIMEOUT", "30"))
 
+# Endpoint compatible con OpenAI (p. ej. tools/mock_openai_server.py para pruebas de carga);
+# vacío usa la API oficial
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "") or None
+
 # Si deseas centralizar rutas
 BASE_DATA_PATH = "data/raw/"
 FACT_FILE_PATH = os.path.join(BASE_DATA_PATH, "Fact_RolPlay_Sim.xlsx")
@@ -29,6 +33,75 @@ FACT_FILE_PATH = os.path.join(BASE_DATA_PATH, "Fact_RolPlay_Sim.xlsx")
 # También puedes poner parámetros de persistencia
 STORAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "storage")
 
+# Arranque: índice RAG en segundo plano (servidor de desarrollo) o bloqueante
+# (gunicorn con preload_app, donde el master carga todo antes del fork)
+RAG_BACKGROUND_STARTUP = os.getenv("RAG_BACKGROUND_STARTUP", "True").lower() == "true"
+
+# Contexto conversacional por sesión: "memory" (LRU por proceso), "redis" (compartido) o "kv-memory"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "7200"))
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# Construcción de embeddings: tamaño de lote, lotes concurrentes y límites del proveedor
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "3000"))
+EMBED_TOKENS_PER_MINUTE = float(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+
+# Vector store binario (memmap): float32, float16 o int8; IVF a partir de cierto tamaño
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+VECTOR_STORE_IVF_MIN_SIZE = int(os.getenv("VECTOR_STORE_IVF_MIN_SIZE", "50000"))
+VECTOR_STORE_NPROBE = int(os.getenv("VECTOR_STORE_NPROBE", "8"))
+
+# Índice jerárquico: resúmenes recuperados por similitud y actividades hijas que se expanden
+RAG_SUMMARY_TOP_K = int(os.getenv("RAG_SUMMARY_TOP_K", "4"))
+RAG_CHILDREN_PER_SUMMARY = int(os.getenv("RAG_CHILDREN_PER_SUMMARY", "5"))
+RAG_MAX_CHILDREN = int(os.getenv("RAG_MAX_CHILDREN", "15"))
+RAG_MAX_CHILD_IDS = int(os.getenv("RAG_MAX_CHILD_IDS", "200"))
+
+# Caché semántica de respuestas del RAG (similitud coseno entre preguntas)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "True").lower() == "true"
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Control de admisión de llamadas al LLM (límites por proceso/worker)
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+ADMISSION_INTENT_CONCURRENCY = int(os.getenv("ADMISSION_INTENT_CONCURRENCY", "8"))
+ADMISSION_RAG_CONCURRENCY = int(os.getenv("ADMISSION_RAG_CONCURRENCY", "4"))
+ADMISSION_GENERATION_CONCURRENCY = int(os.getenv("ADMISSION_GENERATION_CONCURRENCY", "8"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_REQUESTS_BURST = float(os.getenv("LLM_REQUESTS_BURST", "50"))
+
+# Resiliencia frente a la API de OpenAI
+QUERY_DEADLINE_SECONDS = float(os.getenv("QUERY_DEADLINE_SECONDS", "60"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+OPENAI_BREAKER_RECOVERY_SECONDS = float(os.getenv("OPENAI_BREAKER_RECOVERY_SECONDS", "30"))
+
+# Trazas por solicitud: header de depuración y log de consultas lentas (-1 lo desactiva)
+TRACE_DEBUG_HEADER_ENABLED = os.getenv("TRACE_DEBUG_HEADER_ENABLED", "True").lower() == "true"
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "5000"))
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "logs/slow_queries.jsonl")
+
+# Agrupar consultas idénticas concurrentes en una sola ejecución (single-flight)
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+
+# Perfilado por solicitud: muestreo aleatorio (PROFILING_ENABLED + tasa) o bajo demanda con
+# un header X-Profile firmado con PROFILING_SECRET (vacío desactiva el header)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_MODE = os.getenv("PROFILING_MODE", "sampling")  # sampling | cprofile
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+
+# Token de los endpoints /admin/* (vacío: solo se aceptan solicitudes desde localhost)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 def log_config():
     """
     Muestra la configuración actual por consola. Ideal para depurar.
@@ -37,5 +110,17 @@ def log_config():
     logging.info(f"DEBUG_MODE: {DEBUG_MODE}")
     logging.info(f"DEFAULT_OPENAI_MODEL: {DEFAULT_OPENAI_MODEL}")
     logging.info(f"OPENAI_TIMEOUT: {OPENAI_TIMEOUT}")
+    logging.info(f"OPENAI_BASE_URL: {OPENAI_BASE_URL or '(API oficial)'}")
     logging.info(f"FACT_FILE_PATH: {FACT_FILE_PATH}")
     logging.info(f"STORAGE_PATH: {STORAGE_PATH}")
+    logging.info(f"VECTOR_STORE_DTYPE: {VECTOR_STORE_DTYPE}")
+    logging.info(f"EMBED_BATCH_SIZE: {EMBED_BATCH_SIZE} (concurrencia: {EMBED_MAX_CONCURRENCY})")
+    logging.info(f"SESSION_BACKEND: {SESSION_BACKEND} (máx: {SESSION_MAX_ENTRIES}, TTL: {SESSION_TTL_SECONDS}s)")
+    logging.info(f"SEMANTIC_CACHE: {SEMANTIC_CACHE_ENABLED} (umbral: {SEMANTIC_CACHE_THRESHOLD}, máx: {SEMANTIC_CACHE_MAX_ENTRIES})")
+    logging.info(f"ADMISSION_ENABLED: {ADMISSION_ENABLED} (intent/rag/generation: {ADMISSION_INTENT_CONCURRENCY}/{ADMISSION_RAG_CONCURRENCY}/{ADMISSION_GENERATION_CONCURRENCY}, cola: {ADMISSION_QUEUE_SIZE}, LLM RPM: {LLM_REQUESTS_PER_MINUTE})")
+    logging.info(f"QUERY_DEADLINE_SECONDS: {QUERY_DEADLINE_SECONDS} (breaker: {OPENAI_BREAKER_FAILURES} fallos, {OPENAI_BREAKER_RECOVERY_SECONDS}s)")
+    logging.info(f"SLOW_QUERY_THRESHOLD_MS: {SLOW_QUERY_THRESHOLD_MS} ({SLOW_QUERY_LOG_PATH})")
+    logging.info(f"SINGLE_FLIGHT_ENABLED: {SINGLE_FLIGHT_ENABLED}")
+    logging.info(f"PROFILING_ENABLED: {PROFILING_ENABLED} (tasa: {PROFILING_SAMPLE_RATE}, modo: {PROFILING_MODE}, header firmado: {'sí' if PROFILING_SECRET else 'no'}, {PROFILING_DIR})")
+    logging.info(f"ADMIN_TOKEN: {'***HIDDEN***' if ADMIN_TOKEN else '(not set, solo localhost)'}")
+    logging.info(f"RAG_SUMMARY_TOP_K: {RAG_SUMMARY_TOP_K} (hijos por resumen: {RAG_CHILDREN_PER_SUMMARY})")
@@ -0,0 +1,292 @@
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from core.text_processing import clean_text
+
+# (patrón, formato) en el orden de prioridad histórico de parse_flexible_date;
+# el patrón elige el formato sin intentar y descartar los demás
+DATE_FORMATS = [
+    (r"\d{1,2}/\d{1,2}/\d{2} \d{1,2}:\d{1,2}", "%d/%m/%y %H:%M"),
+    (r"\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{1,2}", "%d/%m/%Y %H:%M"),
+    (r"\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}", "%Y-%m-%d %H:%M:%S"),
+    (r"\d{1,2}/\d{1,2}/\d{2}", "%d/%m/%y"),
+    (r"\d{1,2}/\d{1,2}/\d{4}", "%d/%m/%Y"),
+    (r"\d{4}-\d{1,2}-\d{1,2}", "%Y-%m-%d"),
+    (r"\d{1,2}-\d{1,2}-\d{4} \d{1,2}:\d{1,2}", "%d-%m-%Y %H:%M"),
+    (r"\d{1,2}-\d{1,2}-\d{4}", "%d-%m-%Y"),
+    (r"\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{1,2}", "%Y/%m/%d %H:%M"),
+    (r"\d{1,2}\.\d{1,2}\.\d{4} \d{1,2}:\d{1,2}", "%d.%m.%Y %H:%M"),
+]
+_FORMAT_RULES = [(re.compile(pattern), fmt) for pattern, fmt in DATE_FORMATS]
+
+# Meses en español -> inglés, para la interpretación libre ("1 de octubre de 2024")
+_MONTH_NAMES = {
+    "enero": "january", "febrero": "february", "marzo": "march", "abril": "april",
+    "mayo": "may", "junio": "june", "julio": "july", "agosto": "august",
+    "septiembre": "september", "setiembre": "september", "octubre": "october",
+    "noviembre": "november", "diciembre": "december",
+}
+_SPANISH_MONTHS = re.compile(r"\b(" + "|".join(_MONTH_NAMES) + r")\b")
+
+DateRange = Tuple[pd.Timestamp, pd.Timestamp]  # (primer día, último día), ambos incluidos
+
+_NUMBERS = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "quince": 15, "treinta": 30,
+}
+_WEEKDAYS = {"lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3, "viernes": 4, "sabado": 5, "domingo": 6}
+_WEEKDAY = "|".join(_WEEKDAYS)
+_NUMBER = r"(?P<n>\d+|" + "|".join(_NUMBERS) + r")"
+_UNIT = r"(?P<unit>dias?|semanas?|mes|meses)"
+# Trimestres por ordinal ("primer trimestre") -> número de trimestre
+_QUARTER_ORDINALS = {
+    "primer": 1, "primero": 1, "1er": 1, "segundo": 2, "2do": 2,
+    "tercer": 3, "tercero": 3, "3er": 3, "cuarto": 4, "4to": 4,
+}
+# Un año precedido por un mes es parte de una fecha completa ("15 de octubre de 2024")
+_AFTER_MONTH = "".join(f"(?<!{month} de )(?<!{month} )" for month in _MONTH_NAMES)
+
+# Expresiones relativas sobre texto normalizado con clean_text (sin tildes, minúsculas)
+_RELATIVE = re.compile(
+    r"\b(?:"
+    r"(?P<today>(?<!por )hoy(?! en dia| dia| por hoy))"
+    r"|(?P<before_yesterday>anteayer|antier|antes de ayer)"
+    r"|(?P<yesterday>ayer)"
+    r"|hace " + _NUMBER + " " + _UNIT +
+    r"|(?:(?:en )?(?:los|las) )?ultim[oa]s (?P<last_n>\d+|" + "|".join(_NUMBERS) + r") (?P<last_unit>dias|semanas|meses)"
+    r"|(?:(?:en )?(?:la|el) )?ultim[oa] (?P<last_one>semana|mes|trimestre|ano)"
+    r"|(?:(?:la|el) )?(?P<previous>semana|mes|trimestre|ano) (?:pasad[oa]|anterior)"
+    r"|(?:(?:la|el) )?pasad[oa] (?P<previous_pre>semana|mes|trimestre|ano)"
+    r"|(?P<current>esta semana|este mes|este trimestre|este ano)"
+    r"|(?P<ordinal>" + "|".join(_QUARTER_ORDINALS) + r") trimestre"
+    r"(?: (?:de |del )?(?P<ordinal_year>(?:19|20)\d{2}))?"
+    r"|(?P<quarter>(?<!por )(?<!cada )trimestre)"
+    # Año suelto ("en 2024"); no dentro de una fecha (15/10/2024, 2024-10-15,
+    # "1 de octubre de 2024") ni como id
+    r"|(?<![/.-])(?<!user )(?<!usuario )(?<!representante )(?<!sucursal )" + _AFTER_MONTH +
+    r"(?P<year>(?:19|20)\d{2})(?![/.:-]\d)"
+    # Un día de la semana solo es fecha con artículo o "pasado" ("el lunes", "lunes
+    # pasado"): "compara lunes vs viernes" habla de días de la semana, no de una fecha
+    r"|el (?P<weekday>" + _WEEKDAY + r")(?P<weekday_past> pasado)?"
+    r"|(?P<weekday_bare>" + _WEEKDAY + r") pasado"
+    r")\b"
+)
+
+
+def detect_format(text: str) -> Optional[str]:
+    """Formato strptime del texto según su forma, o None si no es uno de DATE_FORMATS."""
+    for pattern, fmt in _FORMAT_RULES:
+        if pattern.fullmatch(text):
+            return fmt
+    return None
+
+
+def _parse_free_text(fecha_str: str) -> pd.Timestamp:
+    """Interpretación libre (dateutil) para textos fuera de DATE_FORMATS."""
+    try:
+        fecha_str = fecha_str.lower()
+        fecha_str = re.sub(r'del?', '', fecha_str)
+        fecha_str = re.sub(r'año', '', fecha_str)
+        fecha_str = re.sub(r'a las', '', fecha_str)
+        fecha_str = _SPANISH_MONTHS.sub(lambda m: _MONTH_NAMES[m.group(0)], fecha_str)
+        fecha_str = fecha_str.strip()
+        if 'pm' in fecha_str or 'p.m' in fecha_str:
+            fecha_str = re.sub(r'pm|p.m', '', fecha_str).strip()
+            hora_obj = pd.to_datetime(fecha_str)
+            if hora_obj.hour < 12:
+                hora_obj += timedelta(hours=12)
+            return hora_obj
+        else:
+            fecha_str = re.sub(r'am|a.m', '', fecha_str).strip()
+            return pd.to_datetime(fecha_str)
+    except Exception:
+        raise ValueError(f"No se pudo interpretar la fecha: {fecha_str}")
+
+
+@lru_cache(maxsize=4096)
+def _parse_cached(text: str) -> pd.Timestamp:
+    fmt = detect_format(text.strip())
+    if fmt is not None:
+        try:
+            return pd.Timestamp(datetime.strptime(text.strip(), fmt))
+        except ValueError:
+            pass  # p. ej. 31/02/2024: lo decide la interpretación libre
+    return _parse_free_text(text)
+
+
+def parse_date(value: Any) -> pd.Timestamp:
+    """
+    Fecha (con hora si la tiene) de un texto en cualquiera de DATE_FORMATS o en
+    texto libre. Los resultados se memorizan: las mismas fechas se repiten entre
+    consultas y entre filtros de una misma consulta. ValueError si no se interpreta.
+    """
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return pd.Timestamp(value)
+    if not isinstance(value, str):
+        raise ValueError(f"No se pudo interpretar la fecha: {value}")
+    return _parse_cached(value)
+
+
+def parse_dates(values: Iterable[Any]) -> List[pd.Timestamp]:
+    """
+    Varias fechas a la vez: las que comparten formato se convierten con una sola
+    llamada vectorizada a pd.to_datetime; el resto, una por una con parse_date.
+    """
+    values = list(values)
+    result: List[Optional[pd.Timestamp]] = [None] * len(values)
+    groups: Dict[str, List[int]] = {}
+    for i, value in enumerate(values):
+        fmt = detect_format(value.strip()) if isinstance(value, str) else None
+        if fmt is None:
+            result[i] = parse_date(value)
+        else:
+            groups.setdefault(fmt, []).append(i)
+    for fmt, positions in groups.items():
+        texts = [values[i].strip() for i in positions]
+        parsed = pd.to_datetime(pd.Series(texts), format=fmt, errors="coerce")
+        for i, text, stamp in zip(positions, texts, parsed):
+            result[i] = parse_date(text) if pd.isna(stamp) else stamp
+    return result
+
+
+def dataset_anchor(raw_data: pd.DataFrame, column: str = "Fecha_y_Hora") -> Optional[pd.Timestamp]:
+    """Día de referencia para las fechas relativas: la fecha más reciente del dataset."""
+    latest = pd.to_datetime(raw_data[column]).max()
+    return None if pd.isna(latest) else latest.normalize()
+
+
+def find_relative_expression(text: str) -> Optional[str]:
+    """Primera expresión de fecha relativa del texto (normalizada), p. ej. "hace 3 dias"."""
+    match = _RELATIVE.search(clean_text(text or ""))
+    return match.group(0) if match else None
+
+
+def _number(token: str) -> int:
+    return int(token) if token.isdigit() else _NUMBERS[token]
+
+
+def _month_start(day: pd.Timestamp, months_back: int = 0) -> pd.Timestamp:
+    return (day.replace(day=1) - pd.DateOffset(months=months_back)).normalize()
+
+
+def _period_start(day: pd.Timestamp, unit: str) -> pd.Timestamp:
+    """Primer día de la semana (lunes), mes, trimestre o año que contiene `day`."""
+    if unit == "semana":
+        return day - pd.Timedelta(days=day.weekday())
+    if unit == "trimestre":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if unit == "ano":
+        return day.replace(month=1, day=1)
+    return _month_start(day)
+
+
+# Duración de cada unidad para "el último ..." (rango móvil que termina en anchor)
+_UNIT_LENGTH = {
+    "semana": pd.Timedelta(weeks=1),
+    "mes": pd.DateOffset(months=1),
+    "trimestre": pd.DateOffset(months=3),
+    "ano": pd.DateOffset(years=1),
+}
+
+
+def resolve_relative_date(text: str, anchor: pd.Timestamp) -> Optional[DateRange]:
+    """
+    Rango de días de una expresión relativa en español, contado desde `anchor`
+    (normalmente la fecha más reciente del dataset, no la fecha actual: los datos
+    son históricos). None si el texto no tiene una expresión reconocida.
+    Semanas de lunes a domingo. Ejemplos con anchor = jueves 17/10/2024:
+    "ayer" -> 16/10; "el lunes" -> 14/10; "la semana pasada" -> 07/10..13/10;
+    "los últimos 7 días" -> 11/10..17/10; "hace 2 meses" -> 01/08..31/08;
+    "este trimestre" -> 01/10..17/10; "el trimestre pasado" -> 01/07..30/09;
+    "el último trimestre" -> 18/07..17/10; "este año" -> 01/01..17/10; "2023" -> todo 2023;
+    "el primer trimestre de 2023" -> 01/01/2023..31/03/2023; "el segundo trimestre" ->
+    01/04..30/06 (sin año, el más reciente que empieza antes de anchor).
+    """
+    if anchor is None or not text:
+        return None
+    match = _RELATIVE.search(clean_text(text))
+    if match is None:
+        return None
+    day = pd.Timestamp(anchor).normalize()
+    week_start = day - pd.Timedelta(days=day.weekday())
+    g = match.groupdict()
+    if g["today"]:
+        return day, day
+    if g["before_yesterday"]:
+        start = day - pd.Timedelta(days=2)
+        return start, start
+    if g["yesterday"]:
+        start = day - pd.Timedelta(days=1)
+        return start, start
+    if g["unit"]:
+        n = _number(g["n"])
+        if g["unit"].startswith("dia"):
+            start = day - pd.Timedelta(days=n)
+            return start, start
+        if g["unit"].startswith("semana"):
+            start = week_start - pd.Timedelta(weeks=n)
+            return start, start + pd.Timedelta(days=6)
+        start = _month_start(day, n)
+        return start, start + pd.offsets.MonthEnd(0)
+    if g["last_n"]:
+        n = _number(g["last_n"])
+        if g["last_unit"] == "dias":
+            return day - pd.Timedelta(days=n - 1), day
+        if g["last_unit"] == "semanas":
+            return day - pd.Timedelta(weeks=n) + pd.Timedelta(days=1), day
+        return day - pd.DateOffset(months=n) + pd.Timedelta(days=1), day
+    if g["last_one"]:
+        return day - _UNIT_LENGTH[g["last_one"]] + pd.Timedelta(days=1), day
+    previous = g["previous"] or g["previous_pre"]
+    if previous:
+        current_start = _period_start(day, previous)
+        start = _period_start(current_start - pd.Timedelta(days=1), previous)
+        return start, current_start - pd.Timedelta(days=1)
+    if g["current"]:
+        return _period_start(day, g["current"].split()[1]), day
+    if g["ordinal"]:
+        month = (_QUARTER_ORDINALS[g["ordinal"]] - 1) * 3 + 1
+        start = pd.Timestamp(year=int(g["ordinal_year"] or day.year), month=month, day=1)
+        if not g["ordinal_year"] and start > day:
+            start -= pd.DateOffset(years=1)
+        return start, start + pd.offsets.QuarterEnd(0)
+    if g["quarter"]:
+        return _period_start(day, "trimestre"), day
+    if g["year"]:
+        start = pd.Timestamp(year=int(g["year"]), month=1, day=1)
+        return start, start + pd.offsets.YearEnd(0)
+    # Día de la semana: el más reciente hasta anchor ("pasado": estrictamente anterior)
+    back = (day.weekday() - _WEEKDAYS[g["weekday"] or g["weekday_bare"]]) % 7
+    if back == 0 and (g["weekday_past"] or g["weekday_bare"]):
+        back = 7
+    start = day - pd.Timedelta(days=back)
+    return start, start
+
+
+def relative_range_in(raw_data: pd.DataFrame, text: Any) -> Optional[DateRange]:
+    """resolve_relative_date anclado en el dataset; la fecha máxima solo se calcula si hay expresión."""
+    if not isinstance(text, str) or _RELATIVE.search(clean_text(text)) is None:
+        return None
+    return resolve_relative_date(text, dataset_anchor(raw_data))
+
+
+def resolve_date_range(text: Any, raw_data: pd.DataFrame = None) -> DateRange:
+    """
+    Rango de días de una fecha absoluta (un solo día) o relativa (anclada en
+    `raw_data`). ValueError si no se interpreta.
+    """
+    relative = relative_range_in(raw_data, text) if raw_data is not None else None
+    if relative is not None:
+        return relative
+    day = parse_date(text).normalize()
+    return day, day
+
+
+def in_date_range(dates: pd.Series, date_range: DateRange) -> pd.Series:
+    """Máscara de las fechas (con hora) que caen en los días del rango."""
+    start, end = date_range
+    return (dates >= start) & (dates < end + pd.Timedelta(days=1))
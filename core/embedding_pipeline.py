@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Sequence
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from core.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata de tokens (~4 caracteres por token) para el rate limiter."""
+    return max(1, len(text) // 4)
+
+
+class EmbeddingBuildPipeline:
+    """
+    Genera embeddings para la construcción del índice:
+    1. Agrupa los textos en lotes grandes para el proveedor.
+    2. Ejecuta varios lotes en paralelo bajo un token bucket (requests y tokens por minuto).
+    3. Reintenta cada lote fallido por separado con backoff exponencial.
+    4. Guarda cada lote terminado en un checkpoint JSONL, de modo que una
+       construcción interrumpida se reanuda sin volver a pagar esos embeddings.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        checkpoint_path: str,
+        batch_size: int = 512,
+        max_concurrency: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 4,
+    ):
+        self.embed_model = embed_model
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket.per_minute(requests_per_minute, burst=max_concurrency)
+        self.token_bucket = TokenBucket.per_minute(tokens_per_minute)
+        self._model_name = str(getattr(embed_model, "model_name", type(embed_model).__name__))
+        self._checkpoint_lock = threading.Lock()
+        self._progress_lock = threading.Lock()
+        self._done = 0
+        self._start = 0.0
+
+    def _text_key(self, text: str) -> str:
+        return hashlib.sha1(f"{self._model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _load_checkpoint(self) -> Dict[str, List[float]]:
+        """Carga los embeddings ya calculados; ignora líneas truncadas por una interrupción."""
+        cached = {}
+        if not os.path.exists(self.checkpoint_path):
+            return cached
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    cached[entry["k"]] = entry["e"]
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        return cached
+
+    def _append_checkpoint(self, keys: List[str], embeddings: List[List[float]]):
+        lines = "".join(json.dumps({"k": k, "e": e}) + "\n" for k, e in zip(keys, embeddings))
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+
+    def clear_checkpoint(self):
+        """Elimina el checkpoint una vez que el índice quedó persistido."""
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _report_progress(self, batch_len: int, total: int):
+        with self._progress_lock:
+            self._done += batch_len
+            elapsed = max(time.monotonic() - self._start, 1e-6)
+            logger.info(
+                "Embeddings: %d/%d (%.1f emb/s)", self._done, total, self._done / elapsed
+            )
+
+    def _embed_batch(self, keys: List[str], texts: List[str], total: int) -> List[List[float]]:
+        tokens = sum(estimate_tokens(t) for t in texts)
+        for attempt in range(self.max_retries + 1):
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            try:
+                embeddings = self.embed_model.get_text_embedding_batch(texts)
+                self._append_checkpoint(keys, embeddings)
+                self._report_progress(len(texts), total)
+                return embeddings
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                logger.warning(
+                    "Lote de %d embeddings falló (intento %d/%d): %s. Reintentando en %.1fs",
+                    len(texts), attempt + 1, self.max_retries + 1, str(e), wait
+                )
+                time.sleep(wait)
+
+    def embed_nodes(self, nodes: Sequence[BaseNode]) -> None:
+        """Asigna `node.embedding` a cada nodo, reutilizando el checkpoint si existe."""
+        cached = self._load_checkpoint()
+        keyed = []
+        pending = []
+        for node in nodes:
+            if node.embedding is not None:
+                continue
+            text = node.get_content(metadata_mode=MetadataMode.EMBED)
+            key = self._text_key(text)
+            keyed.append((node, key))
+            if key not in cached:
+                pending.append((key, text))
+
+        # Textos repetidos se embeben una sola vez
+        pending = list(dict(pending).items())
+        if cached:
+            logger.info("Checkpoint: %d embeddings reutilizados, %d pendientes", len(keyed) - len(pending), len(pending))
+
+        self._done = 0
+        self._start = time.monotonic()
+        total = len(pending)
+        batches = [pending[i:i + self.batch_size] for i in range(0, total, self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(self._embed_batch, [k for k, _ in batch], [t for _, t in batch], total): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                for (key, _), embedding in zip(batch, future.result()):
+                    cached[key] = embedding
+
+        for node, key in keyed:
+            node.embedding = cached[key]
+
+        if total:
+            elapsed = max(time.monotonic() - self._start, 1e-6)
+            logger.info("Embeddings generados: %d en %.1fs (%.1f emb/s)", total, elapsed, total / elapsed)
@@ -0,0 +1,71 @@
+from typing import Any, List
+
+# Respuestas sin LLM, para cuando la API de OpenAI no está disponible
+UNAVAILABLE_NOTE = (
+    "_El asistente de redacción no está disponible en este momento; "
+    "estos son los resultados directos de la consulta._"
+)
+
+CONVERSATION_UNAVAILABLE = (
+    "En este momento no puedo mantener una conversación general (el servicio de "
+    "lenguaje no está disponible). Puedo seguir respondiendo consultas sobre "
+    "**usuarios**, **sucursales**, **actividades**, **rankings** y **tendencias**."
+)
+
+MAX_TABLE_ROWS = 20
+MAX_DEPTH = 3
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if value is None:
+        return "-"
+    return str(value)
+
+
+def _table(rows: List[dict]) -> List[str]:
+    columns = list(rows[0].keys())
+    lines = [
+        "| " + " | ".join(str(c) for c in columns) + " |",
+        "|" + "---|" * len(columns),
+    ]
+    for row in rows[:MAX_TABLE_ROWS]:
+        lines.append("| " + " | ".join(_format_value(row.get(c)) for c in columns) + " |")
+    if len(rows) > MAX_TABLE_ROWS:
+        lines.append(f"\n_… y {len(rows) - MAX_TABLE_ROWS} filas más._")
+    return lines
+
+
+def _render(data: Any, depth: int = 0) -> List[str]:
+    indent = "  " * depth
+    if isinstance(data, dict):
+        lines = []
+        for key, value in data.items():
+            if isinstance(value, list) and value and all(isinstance(v, dict) for v in value) and depth < MAX_DEPTH:
+                lines.append(f"\n**{key}**\n")
+                lines.extend(_table(value))
+                lines.append("")
+            elif isinstance(value, (dict, list)) and depth < MAX_DEPTH:
+                lines.append(f"{indent}- **{key}**:")
+                lines.extend(_render(value, depth + 1))
+            else:
+                lines.append(f"{indent}- **{key}**: {_format_value(value)}")
+        return lines
+    if isinstance(data, list):
+        if data and all(isinstance(v, dict) for v in data):
+            return _table(data)
+        return [f"{indent}- {_format_value(v)}" for v in data[:MAX_TABLE_ROWS]]
+    return [f"{indent}{_format_value(data)}"]
+
+
+def templated_response(query: str, data: dict = None, query_type: str = "conversation") -> str:
+    """Convierte el resultado de un handler en Markdown sin pasar por el LLM."""
+    if data and isinstance(data, dict) and "error" in data:
+        return f"**No se pudo procesar la consulta:** {data['error']}"
+    if query_type == "conversation" or not data:
+        return CONVERSATION_UNAVAILABLE
+    # Respuesta del RAG: ya viene sintetizada
+    if isinstance(data, dict) and isinstance(data.get("response"), str):
+        return data["response"]
+    return "\n".join([UNAVAILABLE_NOTE, ""] + _render(data))
@@ -0,0 +1,91 @@
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FINGERPRINT_VERSION = 1
+DEFAULT_CHUNK_ROWS = 65536
+
+
+def file_signature(path: str) -> Optional[Dict[str, int]]:
+    """Firma barata del archivo fuente (tamaño y mtime) para evitar re-hashear datos sin cambios."""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"size": int(stat.st_size), "mtime_ns": int(stat.st_mtime_ns)}
+
+
+def same_file_signature(a: Optional[Dict[str, int]], b: Optional[Dict[str, int]]) -> bool:
+    return bool(a) and bool(b) and a.get("size") == b.get("size") and a.get("mtime_ns") == b.get("mtime_ns")
+
+
+def _schema_digest(df: pd.DataFrame) -> str:
+    schema = "\x00".join(f"{col}:{dtype}" for col, dtype in zip(map(str, df.columns), map(str, df.dtypes)))
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Hash uint64 por fila, calculado columna por columna de forma vectorizada.
+    Columnas object con tipos mezclados (p. ej. float y 'No aplica') se hashean
+    por su representación en texto.
+    """
+    combined = np.zeros(len(df), dtype=np.uint64)
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        try:
+            hashed = pd.util.hash_pandas_object(column, index=False).to_numpy()
+        except TypeError:
+            hashed = pd.util.hash_pandas_object(column.astype(str), index=False).to_numpy()
+        # Mezcla dependiente de la posición: columnas intercambiadas producen otro hash
+        combined = (combined * np.uint64(1000003)) ^ hashed
+    return combined
+
+
+def compute_fingerprint(df: pd.DataFrame, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Huella del DataFrame: un digest por bloque de `chunk_rows` filas y un hash global
+    que combina el esquema con todos los digests de bloque.
+    """
+    hashes = row_hashes(df)
+    chunk_digests = [
+        hashlib.sha256(hashes[start:start + chunk_rows].tobytes()).hexdigest()
+        for start in range(0, len(hashes), chunk_rows)
+    ]
+    schema = _schema_digest(df)
+    overall = hashlib.sha256()
+    overall.update(schema.encode("ascii"))
+    for digest in chunk_digests:
+        overall.update(digest.encode("ascii"))
+    return {
+        "version": FINGERPRINT_VERSION,
+        "data_hash": overall.hexdigest(),
+        "schema": schema,
+        "rows": int(len(df)),
+        "chunk_rows": int(chunk_rows),
+        "chunk_digests": chunk_digests,
+    }
+
+
+def changed_row_ranges(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """
+    Rangos [inicio, fin) de filas (en el dataset nuevo) cuyo bloque cambió entre dos huellas.
+    Si el esquema o el tamaño de bloque difieren, se considera cambiado todo el dataset.
+    Filas eliminadas al final solo se reflejan en `rows`.
+    """
+    if not old or old.get("schema") != new["schema"] or old.get("chunk_rows") != new["chunk_rows"]:
+        return [(0, new["rows"])] if new["rows"] else []
+
+    chunk_rows = new["chunk_rows"]
+    old_digests = old.get("chunk_digests", [])
+    ranges = []
+    for i, digest in enumerate(new["chunk_digests"]):
+        if i >= len(old_digests) or old_digests[i] != digest:
+            start, end = i * chunk_rows, min((i + 1) * chunk_rows, new["rows"])
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+    return ranges
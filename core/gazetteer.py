@@ -0,0 +1,115 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from core.text_processing import clean_text
+
+# Columna del dataset -> parámetro de la intención que completa
+ENTITY_COLUMNS = {
+    "Usuario": "usuario",
+    "Usuario Nombre": "usuario",
+    "Sucursal": "sucursal",
+    "Actividad_Nombre": "actividad",
+}
+# Ordinales escritos con palabras ("segunda ronda" -> "2da ronda")
+TOKEN_ALIASES = {
+    "primera": "1ra", "primer": "1ra", "1a": "1ra",
+    "segunda": "2da", "2a": "2da",
+    "tercera": "3ra", "3a": "3ra",
+    "cuarta": "4ta", "4a": "4ta",
+    "quinta": "5ta", "5a": "5ta",
+}
+_USER_ID = re.compile(r"^user\s*(\d+)$", re.IGNORECASE)
+_REPRESENTANTE = re.compile(r"^representante\s+(\d+)$", re.IGNORECASE)
+_TOKEN = re.compile(r"\w+")
+
+Mention = Tuple[str, Any, int, int]  # (parámetro, valor, token inicial, token final)
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens sin tildes, en minúsculas y con los ordinales normalizados."""
+    return [TOKEN_ALIASES.get(token, token) for token in _TOKEN.findall(clean_text(str(text)))]
+
+
+class Gazetteer:
+    """
+    Diccionario de entidades conocidas del dataset (usuarios, sucursales, actividades)
+    compilado en un trie de tokens. `find` recorre la consulta una sola vez y en cada
+    posición se queda con la mención más larga, así "Sucursal 4" no coincide dentro de
+    "Sucursal 48" y "user 5" no coincide con "user 51".
+    Los usuarios "userN"/"Representante N" se devuelven como "N": es el formato con
+    coincidencia exacta de get_user_activity_history y demás handlers de usuarios.
+    """
+
+    _END = "$"
+
+    def __init__(self):
+        self._root: Dict[str, Any] = {}
+        self.size = 0
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "Gazetteer":
+        gazetteer = cls()
+        for column, parameter in ENTITY_COLUMNS.items():
+            if column in df.columns:
+                for value in df[column].dropna().unique():
+                    gazetteer.add_entity(parameter, str(value))
+        return gazetteer
+
+    def add_entity(self, parameter: str, value: str):
+        """Agrega un valor del dataset y sus formas habituales de mencionarlo."""
+        if parameter == "usuario":
+            number = _USER_ID.match(value) or _REPRESENTANTE.match(value)
+            if number:
+                digits = number.group(1)
+                for surface in (f"user{digits}", f"user {digits}", f"usuario {digits}", f"representante {digits}"):
+                    self.add(parameter, digits, surface)
+                return
+        self.add(parameter, value, value)
+
+    def add(self, parameter: str, value: Any, surface: str):
+        tokens = tokenize(surface)
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if self._END not in node:
+            self.size += 1
+        # Ante una misma forma para dos entidades, gana la primera registrada
+        node.setdefault(self._END, (parameter, value))
+
+    def find(self, text: str) -> List[Mention]:
+        """Menciones de entidades en orden de aparición, sin solapamientos."""
+        tokens = tokenize(text)
+        mentions: List[Mention] = []
+        i = 0
+        while i < len(tokens):
+            node, best, j = self._root, None, i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if self._END in node:
+                    best = (node[self._END], j)
+            if best is None:
+                i += 1
+                continue
+            (parameter, value), end = best
+            mentions.append((parameter, value, i, end))
+            i = end
+        return mentions
+
+    def extract(self, text: str) -> Dict[str, List[Any]]:
+        """Valores distintos mencionados por parámetro, en orden de aparición."""
+        found: Dict[str, List[Any]] = {}
+        for parameter, value, _, _ in self.find(text):
+            values = found.setdefault(parameter, [])
+            if value not in values:
+                values.append(value)
+        return found
+
+    def first(self, text: str, parameters: Iterable[str] = ("usuario", "sucursal", "actividad")) -> Dict[str, Optional[Any]]:
+        """Primera mención de cada parámetro (None si no hay)."""
+        found = self.extract(text)
+        return {parameter: found[parameter][0] if found.get(parameter) else None for parameter in parameters}
@@ -0,0 +1,77 @@
+from typing import List
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+from core.text_processing import clean_text
+
+CHILD_IDS_KEY = "child_ids"
+
+
+def _terms(text: str) -> set:
+    # clean_text elimina los saltos de línea sin reemplazarlos; se normalizan antes
+    return {t.strip(".,;:!?¿¡()-") for t in clean_text(" ".join(text.split())).split() if len(t) > 2}
+
+
+class HierarchicalRetriever(BaseRetriever):
+    """
+    Recuperación en dos niveles:
+    1. Busca por similitud solo entre los nodos de resumen (usuario, usuario-mes,
+       sucursal, sucursal-mes, actividad), que son los únicos con embedding.
+    2. Para cada resumen seleccionado trae de la docstore sus actividades hijas
+       (metadata `child_ids`), ordenadas por coincidencia de términos con la
+       consulta y, a igualdad, por recencia.
+    Los hijos se agregan después de su resumen, con un score derivado del padre.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        docstore: BaseDocumentStore,
+        children_per_summary: int = 5,
+        max_children: int = 20,
+        child_score_factor: float = 0.9,
+    ):
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._docstore = docstore
+        self.children_per_summary = children_per_summary
+        self.max_children = max_children
+        self.child_score_factor = child_score_factor
+
+    def _rank_children(self, children, query_terms: set):
+        # Orden estable: los child_ids ya vienen del más reciente al más antiguo
+        scored = [
+            (len(query_terms & _terms(child.get_content(metadata_mode=MetadataMode.NONE))), position, child)
+            for position, child in enumerate(children)
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [child for _, _, child in scored]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        summaries = self._vector_retriever.retrieve(query_bundle)
+        results = list(summaries)
+        seen = {summary.node.node_id for summary in summaries}
+        query_terms = _terms(query_bundle.query_str)
+        budget = self.max_children
+
+        for summary in summaries:
+            if budget <= 0:
+                break
+            child_ids = [
+                child_id for child_id in summary.node.metadata.get(CHILD_IDS_KEY, [])
+                if child_id not in seen
+            ]
+            if not child_ids:
+                continue
+            children = [
+                child for child in self._docstore.get_nodes(child_ids, raise_error=False)
+                if child is not None
+            ]
+            parent_score = summary.score or 0.0
+            for child in self._rank_children(children, query_terms)[:min(self.children_per_summary, budget)]:
+                results.append(NodeWithScore(node=child, score=parent_score * self.child_score_factor))
+                seen.add(child.node_id)
+                budget -= 1
+        return results
@@ -5,9 +5,16 @@ import logging
 from openai import OpenAI as ClientOpenAI
 from core.config import (
     OPENAI_API_KEY,
+    OPENAI_BASE_URL,
     DEFAULT_OPENAI_MODEL,
 )
 from core.text_processing import clean_text  # para limpiar el query si lo deseas
+from core.keyword_matcher import QUERY_KEYWORDS
+from core.gazetteer import Gazetteer
+from core.date_parsing import find_relative_expression
+from core.admission import AdmissionRejected, STAGE_INTENT
+from core.resilience import Deadline, ProviderUnavailable, call_llm
+from core.metrics import FALLBACKS
 from prompts.determine_intent_prompt import DETERMINE_INTENT_SYSTEM_PROMPT
 
 # Configurar el logger para enviar los logs a la terminal
@@ -18,13 +25,17 @@ formatter = logging.Formatter('[%(levelname)s] %(asctime)s - %(name)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-client = ClientOpenAI(api_key=OPENAI_API_KEY)
+# Los reintentos los controla call_llm (backoff dentro del presupuesto de la solicitud)
+client = ClientOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
 
 
-def determine_intent(query: str) -> dict:
+def determine_intent(query: str, deadline: Deadline = None, gazetteer: Gazetteer = None) -> dict:
     """
     Determina la intención de la consulta del usuario usando GPT-4.
-    Si hay un error, deriva a una consulta exploratoria que utilizará RAG.
+    Si GPT-4 no está disponible (errores, `deadline` agotado o circuit breaker
+    abierto), deriva a una intención local por palabras clave.
+    Con `gazetteer` (entidades del dataset) completa localmente los parámetros
+    usuario/sucursal/actividad que GPT-4 deje vacíos.
     """
     logger.debug("Analizando consulta: '%s'", query)
     
@@ -34,41 +45,16 @@ def determine_intent(query: str) -> dict:
     # Extraer entidades entre comillas (nombres de usuarios, actividades, etc.)
     quoted_entities = re.findall(r'"([^"]+)"', query)
     
-    # Palabras clave para preguntas sobre datos
-    data_question_keywords = [
-        "qué datos", "que datos", "cuáles datos", "cuales datos",
-        "qué información", "que información", "qué registros", "que registros",
-        "cómo lo calculaste", "como lo calculaste", "cómo lo obtuviste",
-        "como lo obtuviste", "de dónde", "de donde", "qué usaste", "que usaste"
-    ]
-
-    # Palabras que indican referencia a consultas previas
-    context_reference_words = [
-        "mismo", "misma", "mismos", "mismas", 
-        "esa", "ese", "esos", "esas", 
-        "esta", "este", "estos", "estas",
-        "aquella", "aquel", "aquellos", "aquellas",
-        "dicha", "dicho", "dichos", "dichas",
-        "anterior", "previo", "previa", "mencionado", "mencionada"
-    ]
-
-    # Keywords para diferentes entidades
-    entity_keywords = {
-        "sucursal": ["sucursal", "branch", "sede", "oficina"],
-        "usuario": ["usuario", "user", "empleado", "vendedor", "representante"],
-        "actividad": ["actividad", "activity", "tarea", "ejercicio", "ronda"],
-        "progreso": ["progreso", "evolución", "avance", "trayectoria", "desarrollo", "tendencia", "cambiado"],
-        "recomendación": ["recomendación", "recomendaciones", "sugerencia", "sugerencias", "ayúdame", "mejorar"],
-        "lista": ["quiénes", "quienes", "cuáles", "cuales", "lista", "nombres", "listado", "dame", "darme", "mostrar", "ver"]
-    }
+    # Categorías de palabras clave presentes (una sola pasada, ver core/keyword_matcher.py)
+    keyword_categories = QUERY_KEYWORDS.match(cleaned_query)
 
     # Verificar si hay referencia a contexto previo
-    has_context_reference = any(word in cleaned_query.lower() for word in context_reference_words)
-    
+    has_context_reference = "context_reference" in keyword_categories
+
     # Determinar entidades mencionadas
     mentioned_entities = {
-        entity: any(keyword in cleaned_query.lower() for keyword in keywords)
-        for entity, keywords in entity_keywords.items()
+        entity: entity in keyword_categories
+        for entity in ("sucursal", "usuario", "actividad", "progreso", "recomendación", "lista")
     }
 
     # Procesar entidades entre comillas
@@ -77,11 +63,12 @@ def determine_intent(query: str) -> dict:
     sucursal_value = None
     
     for entity in quoted_entities:
-        if any(kw in entity.lower() for kw in ["representante", "usuario", "user"]):
+        entity_categories = QUERY_KEYWORDS.match(entity)
+        if "usuario" in entity_categories:
             usuario_value = entity
-        elif any(kw in entity.lower() for kw in ["ronda", "actividad"]):
+        elif "actividad" in entity_categories:
             actividad_value = entity
-        elif "sucursal" in entity.lower():
+        elif "sucursal" in entity_categories:
             sucursal_value = entity
     
     # Si no se encontró una entidad específica pero hay entidades entre comillas
@@ -93,6 +80,16 @@ def determine_intent(query: str) -> dict:
         elif mentioned_entities["sucursal"]:
             sucursal_value = quoted_entities[0]
 
+    # Entidades conocidas del dataset mencionadas sin comillas ("el usuario user7",
+    # "la sucursal 48", "la segunda ronda"); lo extraído entre comillas tiene prioridad
+    if gazetteer is not None:
+        mentioned = gazetteer.first(query)
+        usuario_value = usuario_value or mentioned["usuario"]
+        actividad_value = actividad_value or mentioned["actividad"]
+        sucursal_value = sucursal_value or mentioned["sucursal"]
+        if any(mentioned.values()):
+            logger.debug("Entidades del diccionario del dataset: %s", mentioned)
+
     # NUEVO: Extraer fechas directamente del texto para mantener el formato original
     date_patterns = [
         r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',  # formatos DD/MM/YYYY o DD-MM-YYYY
@@ -107,80 +104,93 @@ def determine_intent(query: str) -> dict:
             logger.debug(f"Fecha extraída directamente del texto: {fecha_value}")
             break
 
-    # Intentar con GPT-4 con hasta 3 intentos
-    max_attempts = 3
-    
-    for attempt in range(max_attempts):
-        try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": DETERMINE_INTENT_SYSTEM_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": cleaned_query
-                }
-            ]
-            
-            response = client.chat.completions.create(
+    # Fechas relativas ("ayer", "la semana pasada", "hace 3 días"): se resuelven sin GPT;
+    # los handlers las convierten en días contando desde la fecha más reciente del dataset
+    relative_fecha = None
+    if fecha_value is None:
+        relative_fecha = find_relative_expression(query)
+        if relative_fecha:
+            logger.debug(f"Fecha relativa extraída del texto: {relative_fecha}")
+
+    # Intentar con GPT-4 (hasta 3 intentos con backoff dentro del presupuesto de la
+    # solicitud); con el circuit breaker abierto se usa directamente la intención local
+    messages = [
+        {
+            "role": "system",
+            "content": DETERMINE_INTENT_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": cleaned_query
+        }
+    ]
+    try:
+        intent = call_llm(
+            lambda timeout: client.chat.completions.create(
                 model=DEFAULT_OPENAI_MODEL,
                 messages=messages,
-                temperature=0.3
-            )
+                temperature=0.3,
+                timeout=timeout
+            ),
+            stage=STAGE_INTENT,
+            deadline=deadline,
+            max_attempts=3,
+            # Un JSON inválido se reintenta, pero no cuenta como fallo del proveedor
+            validate=lambda response: json.loads(response.choices[0].message.content)
+        )
+
+        # Si se detectó una referencia a contexto, forzar el uso de contexto
+        if has_context_reference:
+            intent["use_context"] = True
+        
+        # Añadir entidades extraídas si no están ya en los parámetros
+        if "parameters" in intent:
+            # (también si GPT omitió la clave: la entidad se mencionó explícitamente)
+            for key, value in (("usuario", usuario_value), ("actividad", actividad_value), ("sucursal", sucursal_value)):
+                if value is not None and intent["parameters"].get(key) is None:
+                    intent["parameters"][key] = value
             
-            try:
-                intent = json.loads(response.choices[0].message.content)
-                
-                # Si se detectó una referencia a contexto, forzar el uso de contexto
-                if has_context_reference:
-                    intent["use_context"] = True
-                
-                # Añadir entidades extraídas si no están ya en los parámetros
-                if "parameters" in intent:
-                    if "usuario" in intent["parameters"] and intent["parameters"]["usuario"] is None:
-                        intent["parameters"]["usuario"] = usuario_value
-                    if "actividad" in intent["parameters"] and intent["parameters"]["actividad"] is None:
-                        intent["parameters"]["actividad"] = actividad_value
-                    if "sucursal" in intent["parameters"] and intent["parameters"]["sucursal"] is None:
-                        intent["parameters"]["sucursal"] = sucursal_value
-                    
-                    # NUEVO: Reemplazar el formato de fecha de GPT con el extraído directamente del texto
-                    if "fecha" in intent["parameters"] and fecha_value:
-                        # Si GPT encontró una fecha pero con formato incorrecto, reemplazarla
-                        intent["parameters"]["fecha"] = fecha_value
-                        logger.debug(f"Reemplazando fecha de GPT con fecha extraída: {fecha_value}")
-                    elif "fecha" in intent["parameters"] and intent["parameters"]["fecha"]:
-                        # Si no extrajimos la fecha pero GPT sí, verificar su formato
-                        gpt_fecha = intent["parameters"]["fecha"]
-                        # Corregir formato si es necesario (por ejemplo, si es solo números sin separadores)
-                        if re.match(r'^\d{8}$', gpt_fecha):  # formato DDMMYYYY o YYYYMMDD
-                            if int(gpt_fecha[:2]) <= 31 and int(gpt_fecha[2:4]) <= 12:
-                                # Probable formato DDMMYYYY
-                                intent["parameters"]["fecha"] = f"{gpt_fecha[:2]}/{gpt_fecha[2:4]}/{gpt_fecha[4:]}"
-                                logger.debug(f"Reformateando fecha de GPT de {gpt_fecha} a {intent['parameters']['fecha']}")
-                            elif int(gpt_fecha[:4]) >= 2000 and int(gpt_fecha[4:6]) <= 12:
-                                # Probable formato YYYYMMDD
-                                intent["parameters"]["fecha"] = f"{gpt_fecha[6:]}/{gpt_fecha[4:6]}/{gpt_fecha[:4]}"
-                                logger.debug(f"Reformateando fecha de GPT de {gpt_fecha} a {intent['parameters']['fecha']}")
-
-                logger.debug("Intención detectada por GPT-4: %s", intent)
-                return intent
-                
-            except json.JSONDecodeError:
-                logger.warning(f"Intento {attempt+1}/{max_attempts}: GPT-4 no devolvió un JSON válido. Reintentando...")
-                if attempt == max_attempts - 1:
-                    raise
-                
-        except Exception as e:
-            error_msg = f"Intento {attempt+1}/{max_attempts}: Error en GPT-4: {str(e)}"
-            logger.warning(error_msg)
-            if attempt == max_attempts - 1:
-                logger.error(f"Todos los intentos con GPT-4 fallaron: {str(e)}. Derivando a RAG.")
-                traceback.print_exc()
+            # NUEVO: Reemplazar el formato de fecha de GPT con el extraído directamente del texto
+            if "fecha" in intent["parameters"] and fecha_value:
+                # Si GPT encontró una fecha pero con formato incorrecto, reemplazarla
+                intent["parameters"]["fecha"] = fecha_value
+                logger.debug(f"Reemplazando fecha de GPT con fecha extraída: {fecha_value}")
+            elif "fecha" in intent["parameters"] and intent["parameters"]["fecha"]:
+                # Si no extrajimos la fecha pero GPT sí, verificar su formato
+                gpt_fecha = intent["parameters"]["fecha"]
+                # Corregir formato si es necesario (por ejemplo, si es solo números sin separadores)
+                if re.match(r'^\d{8}$', gpt_fecha):  # formato DDMMYYYY o YYYYMMDD
+                    if int(gpt_fecha[:2]) <= 31 and int(gpt_fecha[2:4]) <= 12:
+                        # Probable formato DDMMYYYY
+                        intent["parameters"]["fecha"] = f"{gpt_fecha[:2]}/{gpt_fecha[2:4]}/{gpt_fecha[4:]}"
+                        logger.debug(f"Reformateando fecha de GPT de {gpt_fecha} a {intent['parameters']['fecha']}")
+                    elif int(gpt_fecha[:4]) >= 2000 and int(gpt_fecha[4:6]) <= 12:
+                        # Probable formato YYYYMMDD
+                        intent["parameters"]["fecha"] = f"{gpt_fecha[6:]}/{gpt_fecha[4:6]}/{gpt_fecha[:4]}"
+                        logger.debug(f"Reformateando fecha de GPT de {gpt_fecha} a {intent['parameters']['fecha']}")
+            elif relative_fecha:
+                # La expresión relativa solo completa una fecha que GPT dejó vacía: no
+                # reemplaza su interpretación (queda guardada en el contexto de la sesión)
+                intent["parameters"]["fecha"] = relative_fecha
+                logger.debug(f"Completando fecha con la expresión relativa: {relative_fecha}")
+
+        logger.debug("Intención detectada por GPT-4: %s", intent)
+        return intent
+
+    except AdmissionRejected:
+        # Sin capacidad: se rechaza la solicitud (429) en lugar de usar la alternativa
+        raise
+    except ProviderUnavailable as e:
+        logger.error(f"GPT-4 no disponible ({str(e)}). Usando intención local.")
+        FALLBACKS.inc(kind="intent_local")
+    except Exception as e:
+        logger.error(f"Respuesta de GPT-4 no utilizable: {str(e)}. Usando intención local.")
+        FALLBACKS.inc(kind="intent_local")
+        traceback.print_exc()
 
     # Si todos los intentos fallaron, derivar a RAG (modo exploratorio)
     # Extraer parámetros potenciales de las entidades detectadas
+    fecha_value = fecha_value or relative_fecha
     params = {}
     if usuario_value:
         params["usuario"] = usuario_value
@@ -196,7 +206,7 @@ def determine_intent(query: str) -> dict:
         query_type = "user_performance"
     elif mentioned_entities["sucursal"] and not mentioned_entities["lista"] and not mentioned_entities["usuario"]:
         query_type = "branch_performance"
-    elif mentioned_entities["actividad"] and not any(kw in cleaned_query.lower() for kw in ["ranking", "mejor", "peor"]):
+    elif mentioned_entities["actividad"] and "ranking" not in keyword_categories:
         query_type = "activity_analysis"
     elif fecha_value:  # NUEVO: Si encontramos una fecha, probablemente es una consulta de fecha específica
         query_type = "specific_date"
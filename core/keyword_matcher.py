@@ -0,0 +1,116 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+from core.text_processing import clean_text
+
+# Un "*" final marca un prefijo: "usuario*" acepta "usuario", "usuarios", ...
+PREFIX_MARK = "*"
+
+
+class KeywordMatcher:
+    """
+    Detector de palabras clave de varias categorías en una sola pasada.
+
+    Las palabras clave y el texto se normalizan igual (clean_text: sin tildes, en
+    minúsculas, espacios colapsados) y se comparan por palabra completa, así "esta"
+    no coincide dentro de "estadísticas". Todas las palabras clave se compilan en una
+    sola expresión regular (las más largas primero) que se evalúa como lookahead,
+    de modo que una coincidencia no oculta a otra que empieza más adelante.
+    Los resultados por texto se guardan en un LRU: intent_detection, query_processor
+    y chatbot consultan la misma pregunta y solo la primera la recorre.
+    """
+
+    def __init__(self, categories: Dict[str, Iterable[str]], cache_size: int = 1024):
+        self._exact: Dict[str, set] = {}
+        self._prefixes: List[Tuple[str, set]] = []
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                is_prefix = keyword.endswith(PREFIX_MARK)
+                folded = clean_text(keyword.rstrip(PREFIX_MARK))
+                if not folded:
+                    continue
+                if is_prefix:
+                    for prefix, owners in self._prefixes:
+                        if prefix == folded:
+                            owners.add(category)
+                            break
+                    else:
+                        self._prefixes.append((folded, {category}))
+                else:
+                    self._exact.setdefault(folded, set()).add(category)
+        self.categories = tuple(categories)
+
+        alternatives = [(k, False) for k in self._exact] + [(p, True) for p, _ in self._prefixes]
+        alternatives.sort(key=lambda item: len(item[0]), reverse=True)
+        body = "|".join(
+            r"\s+".join(map(re.escape, keyword.split())) + (r"\w*" if is_prefix else "")
+            for keyword, is_prefix in alternatives
+        )
+        self._pattern = re.compile(rf"(?=\b({body})\b)") if body else None
+        self._scan = lru_cache(maxsize=cache_size)(self._scan_uncached)
+
+    def _categories_of(self, word: str) -> set:
+        owners = set(self._exact.get(word, ()))
+        for prefix, prefix_owners in self._prefixes:
+            if word.startswith(prefix):
+                owners |= prefix_owners
+        return owners
+
+    def _scan_uncached(self, folded: str) -> Tuple[Tuple[str, FrozenSet[str]], ...]:
+        if self._pattern is None:
+            return ()
+        found = []
+        for match in self._pattern.finditer(folded):
+            word = " ".join(match.group(1).split())
+            found.append((word, frozenset(self._categories_of(word))))
+        return tuple(found)
+
+    def find(self, text: str) -> Dict[str, List[str]]:
+        """Palabras encontradas (normalizadas) por categoría, en orden de aparición."""
+        result: Dict[str, List[str]] = {}
+        for word, owners in self._scan(clean_text(text or "")):
+            for category in owners:
+                result.setdefault(category, []).append(word)
+        return result
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Categorías con al menos una palabra clave en el texto."""
+        owners = frozenset()
+        for _, categories in self._scan(clean_text(text or "")):
+            owners |= categories
+        return owners
+
+    def has(self, text: str, category: str) -> bool:
+        return category in self.match(text)
+
+
+# Categorías compartidas por intent_detection, query_processor y chatbot
+QUERY_KEYWORDS = KeywordMatcher({
+    # Preguntas sobre los datos usados para responder
+    "data_question": [
+        "qué datos", "cuáles datos", "qué información", "qué registros",
+        "cómo lo calculaste", "cómo lo obtuviste", "de dónde", "qué usaste"
+    ],
+    # Referencias a consultas previas
+    "context_reference": [
+        "mismo", "misma", "mismos", "mismas",
+        "esa", "ese", "esos", "esas",
+        "esta", "este", "estos", "estas",
+        "aquella", "aquel", "aquellos", "aquellas",
+        "dicha", "dicho", "dichos", "dichas",
+        "anterior", "previo", "previa", "mencionado", "mencionada"
+    ],
+    # Entidades
+    "sucursal": ["sucursal*", "branch*", "sede*", "oficina*"],
+    "usuario": ["usuario*", "user*", "empleado*", "vendedor*", "representante*"],
+    "actividad": ["actividad*", "activit*", "tarea*", "ejercicio*", "ronda*"],
+    "progreso": ["progreso*", "evolución", "evoluciona*", "avance*", "trayectoria*", "desarrollo*",
+                 "tendencia*", "cambiado"],
+    "recomendación": ["recomendación", "recomendaciones", "recomienda*", "sugerencia*", "ayúdame", "mejorar"],
+    "lista": ["quiénes", "cuáles", "lista*", "nombres", "listado*", "dame", "darme", "mostrar", "ver"],
+    # Dirección de un ranking
+    "ranking": ["ranking*", "mejor", "mejores", "peor", "peores"],
+    "worst": ["peor", "peores", "menor", "más bajo", "más baja", "mala", "malas"],
+    "representante": ["representante*"],
+})
@@ -0,0 +1,178 @@
+import gc
+import mmap
+import sys
+import threading
+import tracemalloc
+import types
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Tope de objetos recorridos por componente (acota el costo de una medición)
+DEFAULT_MAX_OBJECTS = 2_000_000
+# Objetos compartidos por todo el proceso: no se atribuyen a ningún componente
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+               types.MethodType, types.CodeType, types.FrameType)
+
+
+def _is_mapped(array: np.ndarray) -> bool:
+    """True si el arreglo (o su base) está respaldado por un archivo con mmap."""
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, "base", None)
+    return False
+
+
+def deep_sizeof(root: Any, max_objects: int = DEFAULT_MAX_OBJECTS) -> Dict[str, Any]:
+    """
+    Memoria alcanzable desde `root`, recorriendo referencias con gc.get_referents:
+    - heap_bytes: objetos de Python y buffers de numpy/pandas propios.
+    - mapped_bytes: arreglos respaldados por mmap (páginas de archivo, compartidas
+      entre workers; no cuentan como memoria privada).
+    Los DataFrame/Series se miden con memory_usage(deep=True) sin recorrer su interior.
+    Un objeto alcanzable desde varios componentes se cuenta en cada uno.
+    """
+    seen = set()
+    stack = [root]
+    heap = mapped = objects = 0
+    truncated = False
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP_TYPES):
+            continue
+        seen.add(id(obj))
+        objects += 1
+        if objects > max_objects:
+            truncated = True
+            break
+        if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+            usage = obj.memory_usage(deep=True)
+            heap += int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+            continue
+        if isinstance(obj, np.ndarray):
+            if _is_mapped(obj):
+                mapped += obj.nbytes
+                continue
+            heap += sys.getsizeof(obj) if obj.base is None else obj.nbytes
+            if obj.dtype == object:
+                stack.extend(obj.ravel().tolist())
+            continue
+        heap += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return {"heap_bytes": heap, "mapped_bytes": mapped, "objects": objects, "truncated": truncated}
+
+
+def dataframe_memory(df: pd.DataFrame) -> Dict[str, Any]:
+    """Memoria profunda de un DataFrame por columna (bytes), de mayor a menor."""
+    usage = df.memory_usage(deep=True)
+    columns = {str(column): int(size) for column, size in usage.sort_values(ascending=False).items()}
+    return {
+        "rows": int(len(df)),
+        "heap_bytes": int(usage.sum()),
+        "columns": columns,
+        "dtypes": {str(column): str(dtype) for column, dtype in df.dtypes.items()},
+    }
+
+
+class MemoryRegistry:
+    """
+    Componentes cuyo uso de memoria se reporta en /admin/memory. Cada proveedor
+    retorna el objeto a medir (se mide con deep_sizeof), un dict ya medido o None
+    si el componente no existe todavía. Las mediciones son por proceso (worker).
+    """
+
+    def __init__(self):
+        self._providers: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, provider: Callable[[], Any]):
+        with self._lock:
+            self._providers[name] = provider
+
+    def report(self, max_objects: int = DEFAULT_MAX_OBJECTS) -> Dict[str, Any]:
+        with self._lock:
+            providers = list(self._providers.items())
+        components = {}
+        for name, provider in providers:
+            try:
+                target = provider()
+                if target is None:
+                    components[name] = {"status": "unavailable"}
+                elif isinstance(target, dict):
+                    components[name] = target
+                else:
+                    components[name] = deep_sizeof(target, max_objects)
+            except Exception as e:
+                components[name] = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        for entry in components.values():
+            for key in ("heap_bytes", "mapped_bytes"):
+                if key in entry:
+                    entry[key.replace("_bytes", "_mb")] = round(entry[key] / (1024 * 1024), 2)
+        return components
+
+
+class TracemallocDiffer:
+    """
+    Diferencias de tracemalloc entre llamadas sucesivas: la primera inicia el
+    seguimiento y toma la línea base; cada llamada siguiente compara contra la
+    anterior. Crecimiento que se repite entre llamadas separadas por tráfico apunta
+    a una fuga. tracemalloc agrega costo a cada asignación mientras está activo.
+    """
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    def diff(self, limit: int = 25, group_by: str = "lineno") -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._snapshot = None
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            previous, self._snapshot = self._snapshot, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        result = {"tracing": True, "traced_mb": round(current / 1e6, 2), "peak_mb": round(peak / 1e6, 2)}
+        if previous is None:
+            result["status"] = "baseline"
+            return result
+        stats = snapshot.compare_to(previous, group_by)
+        result["status"] = "diff"
+        result["size_diff_mb"] = round(sum(s.size_diff for s in stats) / 1e6, 3)
+        result["top"] = [self._format(s, group_by) for s in stats[:limit]]
+        return result
+
+    @staticmethod
+    def _format(stat: tracemalloc.StatisticDiff, group_by: str) -> Dict[str, Any]:
+        # Los frames van del más antiguo al más reciente (donde ocurrió la asignación)
+        return {
+            "location": str(stat.traceback[-1]) if len(stat.traceback) else "?",
+            "traceback": stat.traceback.format() if group_by == "traceback" else None,
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+        }
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            self._snapshot = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+        return {"tracing": False}
+
+
+def total_accounted(components: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    heap = sum(c.get("heap_bytes", 0) for c in components.values())
+    mapped = sum(c.get("mapped_bytes", 0) for c in components.values())
+    return {"heap_mb": round(heap / (1024 * 1024), 2), "mapped_mb": round(mapped / (1024 * 1024), 2)}
+
+
+# Registro del proceso; app.py registra dataset, índices, cachés y sesiones
+memory_registry = MemoryRegistry()
+tracemalloc_differ = TracemallocDiffer()
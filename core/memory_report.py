@@ -0,0 +1,56 @@
+import os
+from typing import Dict, Optional
+
+# Campos de /proc/<pid>/smaps_rollup que interesan para ver páginas compartidas (copy-on-write)
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def read_smaps_rollup(pid="self") -> Optional[Dict[str, int]]:
+    """Lee smaps_rollup (Linux >= 4.14) y retorna los campos en bytes; None si no está disponible."""
+    path = f"/proc/{pid}/smaps_rollup"
+    if not os.path.exists(path):
+        return None
+    values = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in SMAPS_FIELDS:
+                    values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return values
+
+
+def memory_summary(pid="self") -> Dict[str, float]:
+    """
+    Resumen de memoria del proceso en MB:
+    - rss: memoria residente total (cuenta las páginas compartidas completas).
+    - pss: RSS proporcional (las páginas compartidas se dividen entre los procesos que las usan).
+    - shared / private: páginas compartidas con otros procesos vs propias.
+    Sin smaps_rollup (macOS, contenedores antiguos) solo se informa el RSS máximo.
+    """
+    smaps = read_smaps_rollup(pid)
+    if smaps is None:
+        import resource
+        # ru_maxrss está en KB en Linux
+        return {"rss_max_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), "source": "getrusage"}
+    mb = lambda key: round(smaps.get(key, 0) / (1024 * 1024), 1)
+    return {
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "shared_mb": round(mb("Shared_Clean") + mb("Shared_Dirty"), 1),
+        "private_mb": round(mb("Private_Clean") + mb("Private_Dirty"), 1),
+        "swap_mb": mb("Swap"),
+        "source": "smaps_rollup",
+    }
+
+
+def format_memory_summary(label: str, summary: Dict[str, float]) -> str:
+    if summary.get("source") != "smaps_rollup":
+        return f"{label}: RSS máx {summary.get('rss_max_mb')} MB (sin smaps_rollup)"
+    shared_pct = 100.0 * summary["shared_mb"] / summary["rss_mb"] if summary["rss_mb"] else 0.0
+    return (
+        f"{label}: RSS {summary['rss_mb']} MB, PSS {summary['pss_mb']} MB, "
+        f"compartida {summary['shared_mb']} MB ({shared_pct:.0f}%), privada {summary['private_mb']} MB"
+    )
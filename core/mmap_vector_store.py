@@ -0,0 +1,475 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore, _build_metadata_filter_fn
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = "rolplay-mmap"
+DEFAULT_NAMESPACE = "default"
+VECTOR_STORE_FNAME = "vector_store.json"
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+# Filas procesadas por bloque al des-cuantizar, para acotar la memoria temporal
+SCORE_CHUNK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    """Convierte vectores normalizados (float32) al dtype de almacenamiento."""
+    if dtype == "float32":
+        return vectors.astype(np.float32), None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k mayores puntajes, ordenados de mayor a menor."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means sobre vectores normalizados (similitud coseno) para los centroides IVF."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=nlist) == 0
+        sums[empty] = centroids[empty]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store binario respaldado por archivos .npy abiertos con memmap.
+
+    - Los vectores se guardan normalizados en float32, float16 o int8 (con una
+      escala por fila), así que la similitud coseno es un producto punto.
+    - Los IDs se guardan como un arreglo de ancho fijo (también memmap) y la
+      metadata en un JSONL lateral que solo se lee si una consulta usa filtros
+      o si se borran/persisten nodos.
+    - Cargar es O(1): no se parsea nada, y como las páginas son de solo lectura
+      el sistema operativo las comparte entre procesos worker.
+    - La búsqueda es fuerza bruta vectorizada o, si se construyó, IVF
+      (centroides k-means + listas invertidas, se revisan `nprobe` listas).
+
+    Los nodos agregados después de cargar viven en memoria hasta el próximo
+    `persist`, que reescribe los archivos de forma atómica.
+    """
+
+    stores_text: bool = False
+    dtype: str = "float32"
+    ivf_min_size: int = 50000
+    nprobe: int = 8
+
+    _vectors: Optional[np.ndarray] = PrivateAttr(default=None)
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ivf: Optional[Dict[str, np.ndarray]] = PrivateAttr(default=None)
+    _base_path: Optional[str] = PrivateAttr(default=None)
+    _sidecar: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+    _id_to_row: Optional[Dict[str, int]] = PrivateAttr(default=None)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _replaced: set = PrivateAttr(default_factory=set)
+    _pending_pos: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _pending_ids: List[str] = PrivateAttr(default_factory=list)
+    _pending_vectors: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _pending_refs: List[str] = PrivateAttr(default_factory=list)
+    _pending_metadata: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+
+    def __init__(self, dtype: str = "float32", ivf_min_size: int = 50000, nprobe: int = 8, **kwargs: Any):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype no soportado: {dtype}. Opciones: {SUPPORTED_DTYPES}")
+        super().__init__(dtype=dtype, ivf_min_size=ivf_min_size, nprobe=nprobe, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    # ------------------------------------------------------------------
+    # Carga y persistencia
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _files(base_path: str) -> Dict[str, str]:
+        return {
+            "vectors": f"{base_path}.vectors.npy",
+            "scales": f"{base_path}.scales.npy",
+            "ids": f"{base_path}.ids.npy",
+            "sidecar": f"{base_path}.meta.jsonl",
+            "ivf_centroids": f"{base_path}.ivf_centroids.npy",
+            "ivf_order": f"{base_path}.ivf_order.npy",
+            "ivf_offsets": f"{base_path}.ivf_offsets.npy",
+        }
+
+    @staticmethod
+    def is_mmap_store(persist_path: str) -> bool:
+        """Indica si `persist_path` es el encabezado de un MmapVectorStore (y no un JSON de SimpleVectorStore)."""
+        if not os.path.exists(persist_path):
+            return False
+        with open(persist_path, "rb") as f:
+            head = f.read(256)
+        return STORE_FORMAT.encode() in head
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: str, namespace: str = DEFAULT_NAMESPACE, **kwargs: Any
+    ) -> "MmapVectorStore":
+        return cls.from_persist_path(os.path.join(persist_dir, f"{namespace}__{VECTOR_STORE_FNAME}"), **kwargs)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, **kwargs: Any) -> "MmapVectorStore":
+        """Abre los archivos con memmap; no lee los vectores ni la metadata."""
+        with open(persist_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != STORE_FORMAT:
+            raise ValueError(f"{persist_path} no es un {cls.class_name()}")
+
+        store = cls(dtype=header["dtype"], **kwargs)
+        base_path = persist_path[:-len(".json")] if persist_path.endswith(".json") else persist_path
+        files = cls._files(base_path)
+        store._base_path = base_path
+        if header["count"] > 0:
+            store._vectors = np.load(files["vectors"], mmap_mode="r")
+            store._ids = np.load(files["ids"], mmap_mode="r")
+            if header["dtype"] == "int8":
+                store._scales = np.load(files["scales"], mmap_mode="r")
+            if header.get("ivf"):
+                store._ivf = {
+                    "centroids": np.load(files["ivf_centroids"], mmap_mode="r"),
+                    "order": np.load(files["ivf_order"], mmap_mode="r"),
+                    "offsets": np.load(files["ivf_offsets"], mmap_mode="r"),
+                }
+        return store
+
+    @classmethod
+    def from_simple_vector_store(cls, simple_store: SimpleVectorStore, **kwargs: Any) -> "MmapVectorStore":
+        """Migra un SimpleVectorStore (JSON) sin volver a calcular embeddings."""
+        store = cls(**kwargs)
+        data = simple_store.data
+        for node_id, embedding in data.embedding_dict.items():
+            store._append_pending(
+                node_id,
+                embedding,
+                data.text_id_to_ref_doc_id.get(node_id, "None"),
+                (data.metadata_dict or {}).get(node_id, {})
+            )
+        return store
+
+    def _load_sidecar(self) -> Dict[str, Any]:
+        """Lee la tabla lateral (ref_doc_id y metadata por fila) la primera vez que se necesita."""
+        if self._sidecar is None:
+            refs, metadata = [], []
+            if self._vectors is not None:
+                with open(self._files(self._base_path)["sidecar"], "r", encoding="utf-8") as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        refs.append(entry["ref_doc_id"])
+                        metadata.append(entry["metadata"])
+            self._sidecar = {"refs": refs, "metadata": metadata}
+        return self._sidecar
+
+    def _row_index(self) -> Dict[str, int]:
+        if self._id_to_row is None:
+            ids = [] if self._ids is None else np.char.decode(np.asarray(self._ids), "utf-8").tolist()
+            self._id_to_row = {node_id: row for row, node_id in enumerate(ids)}
+        return self._id_to_row
+
+    def _base_count(self) -> int:
+        return 0 if self._vectors is None else len(self._vectors)
+
+    def _live_rows(self):
+        """Retorna (ids, matriz float32, ref_doc_ids, metadata) de todas las filas vigentes."""
+        ids, blocks, refs, metadata = [], [], [], []
+        if self._vectors is not None:
+            sidecar = self._load_sidecar()
+            skip = self._deleted | self._replaced
+            rows = np.array(
+                [row for node_id, row in self._row_index().items() if node_id not in skip],
+                dtype=np.int64
+            )
+            row_ids = np.char.decode(np.asarray(self._ids), "utf-8")
+            for start in range(0, len(rows), SCORE_CHUNK_ROWS):
+                blocks.append(self._dequantize(rows[start:start + SCORE_CHUNK_ROWS]))
+            ids.extend(row_ids[rows].tolist())
+            refs.extend(sidecar["refs"][r] for r in rows)
+            metadata.extend(sidecar["metadata"][r] for r in rows)
+        for i, node_id in enumerate(self._pending_ids):
+            if node_id not in self._deleted:
+                ids.append(node_id)
+                blocks.append(self._pending_vectors[i][None, :])
+                refs.append(self._pending_refs[i])
+                metadata.append(self._pending_metadata[i])
+        matrix = np.vstack(blocks).astype(np.float32) if blocks else None
+        return ids, matrix, refs, metadata
+
+    def _build_ivf(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        nlist = int(max(1, min(4096, np.sqrt(len(vectors)))))
+        rng = np.random.default_rng(0)
+        sample = vectors if len(vectors) <= 100000 else vectors[rng.choice(len(vectors), 100000, replace=False)]
+        centroids = _spherical_kmeans(sample, nlist)
+        assignment = np.concatenate([
+            np.argmax(vectors[i:i + SCORE_CHUNK_ROWS] @ centroids.T, axis=1)
+            for i in range(0, len(vectors), SCORE_CHUNK_ROWS)
+        ])
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+        return {"centroids": centroids, "order": order, "offsets": offsets}
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        """Escribe vectores, IDs, tabla lateral e IVF; reemplaza los archivos de forma atómica."""
+        ids, matrix, refs, metadata = self._live_rows()
+
+        base_path = persist_path[:-len(".json")] if persist_path.endswith(".json") else persist_path
+        os.makedirs(os.path.dirname(os.path.abspath(persist_path)), exist_ok=True)
+        files = self._files(base_path)
+        written = {}
+
+        def _save(name: str, array: np.ndarray):
+            tmp = f"{files[name]}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            written[name] = tmp
+
+        ivf = None
+        if ids:
+            stored, scales = _quantize(matrix, self.dtype)
+            _save("vectors", stored)
+            _save("ids", np.array([i.encode("utf-8") for i in ids]))
+            if scales is not None:
+                _save("scales", scales)
+            if len(ids) >= self.ivf_min_size:
+                ivf = self._build_ivf(matrix)
+                _save("ivf_centroids", ivf["centroids"])
+                _save("ivf_order", ivf["order"])
+                _save("ivf_offsets", ivf["offsets"])
+            tmp = f"{files['sidecar']}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for ref, meta in zip(refs, metadata):
+                    f.write(json.dumps({"ref_doc_id": ref, "metadata": meta}, ensure_ascii=False) + "\n")
+            written["sidecar"] = tmp
+
+        for name, tmp in written.items():
+            os.replace(tmp, files[name])
+        header = {
+            "format": STORE_FORMAT,
+            "version": 1,
+            "dtype": self.dtype,
+            "count": len(ids),
+            "dim": int(matrix.shape[1]) if ids else 0,
+            "ivf": ivf is not None,
+        }
+        with open(persist_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+
+        # A partir de aquí el store trabaja sobre los archivos recién escritos
+        reloaded = self.from_persist_path(persist_path, ivf_min_size=self.ivf_min_size, nprobe=self.nprobe)
+        self.clear()
+        self._vectors, self._scales, self._ids = reloaded._vectors, reloaded._scales, reloaded._ids
+        self._ivf, self._base_path = reloaded._ivf, reloaded._base_path
+        logger.info("MmapVectorStore persistido: %d vectores (%s, IVF: %s)", len(ids), self.dtype, ivf is not None)
+
+    # ------------------------------------------------------------------
+    # API de BasePydanticVectorStore
+    # ------------------------------------------------------------------
+    def _append_pending(self, node_id: str, embedding, ref_doc_id: str, metadata: Dict[str, Any]):
+        vector = _normalize(np.asarray(embedding, dtype=np.float32))
+        position = self._pending_pos.get(node_id)
+        if position is not None:
+            self._pending_vectors[position] = vector
+            self._pending_refs[position] = ref_doc_id
+            self._pending_metadata[position] = metadata
+        else:
+            self._pending_pos[node_id] = len(self._pending_ids)
+            self._pending_ids.append(node_id)
+            self._pending_vectors.append(vector)
+            self._pending_refs.append(ref_doc_id)
+            self._pending_metadata.append(metadata)
+        if self._vectors is not None and node_id in self._row_index():
+            self._replaced.add(node_id)
+        self._deleted.discard(node_id)
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            metadata.pop("_node_content", None)
+            self._append_pending(node.node_id, node.get_embedding(), node.ref_doc_id or "None", metadata)
+        return [node.node_id for node in nodes]
+
+    def get(self, text_id: str) -> List[float]:
+        if text_id in self._deleted:
+            raise KeyError(text_id)
+        position = self._pending_pos.get(text_id)
+        if position is not None:
+            return self._pending_vectors[position].tolist()
+        row = self._row_index().get(text_id)
+        if row is not None:
+            return self._dequantize(np.arange(row, row + 1))[0].tolist()
+        raise KeyError(text_id)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        if self._vectors is not None:
+            refs = self._load_sidecar()["refs"]
+            ids = np.asarray(self._ids)
+            for row, ref in enumerate(refs):
+                if ref == ref_doc_id:
+                    self._deleted.add(ids[row].decode("utf-8"))
+        for node_id, ref in zip(self._pending_ids, self._pending_refs):
+            if ref == ref_doc_id:
+                self._deleted.add(node_id)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        metadata = self._metadata_lookup()
+        filter_fn = _build_metadata_filter_fn(lambda node_id: metadata[node_id], filters)
+        candidates = set(node_ids) if node_ids is not None else set(metadata)
+        for node_id in candidates:
+            if node_id in metadata and filter_fn(node_id):
+                self._deleted.add(node_id)
+
+    def clear(self) -> None:
+        self._vectors = self._scales = self._ids = self._ivf = None
+        self._sidecar = self._id_to_row = None
+        self._deleted, self._replaced, self._pending_pos = set(), set(), {}
+        self._pending_ids, self._pending_vectors = [], []
+        self._pending_refs, self._pending_metadata = [], []
+
+    def _metadata_lookup(self) -> Dict[str, Dict[str, Any]]:
+        lookup = {}
+        if self._vectors is not None:
+            metadata = self._load_sidecar()["metadata"]
+            for node_id, row in self._row_index().items():
+                if node_id not in self._replaced:
+                    lookup[node_id] = metadata[row]
+        lookup.update(zip(self._pending_ids, self._pending_metadata))
+        return lookup
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            block *= np.asarray(self._scales[rows])[:, None]
+        return block
+
+    def _score_rows(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Producto punto del query contra filas del segmento base (todas si rows es None)."""
+        total = self._base_count() if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SCORE_CHUNK_ROWS):
+            stop = min(start + SCORE_CHUNK_ROWS, total)
+            if rows is None:
+                block = np.asarray(self._vectors[start:stop], dtype=np.float32)
+                scale = None if self._scales is None else np.asarray(self._scales[start:stop])
+            else:
+                block = np.asarray(self._vectors[rows[start:stop]], dtype=np.float32)
+                scale = None if self._scales is None else np.asarray(self._scales[rows[start:stop]])
+            block_scores = block @ query
+            if scale is not None:
+                block_scores *= scale
+            scores[start:stop] = block_scores
+        return scores
+
+    def _ivf_candidates(self, query: np.ndarray) -> np.ndarray:
+        centroid_scores = np.asarray(self._ivf["centroids"]) @ query
+        probe = _top_k(centroid_scores, min(self.nprobe, len(centroid_scores)))
+        offsets = self._ivf["offsets"]
+        order = self._ivf["order"]
+        return np.concatenate([np.asarray(order[offsets[c]:offsets[c + 1]]) for c in probe])
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Modo de consulta no soportado por {self.class_name()}: {query.mode}")
+
+        k = query.similarity_top_k or 1
+        q = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        allowed = None
+        if query.filters is not None or query.node_ids is not None:
+            metadata = self._metadata_lookup()
+            filter_fn = _build_metadata_filter_fn(lambda node_id: metadata[node_id], query.filters)
+            candidates = set(query.node_ids) if query.node_ids is not None else set(metadata)
+            allowed = {node_id for node_id in candidates if node_id in metadata and filter_fn(node_id)}
+
+        found_ids, found_scores = [], []
+        # Se piden filas extra para compensar las que estén marcadas como borradas
+        fetch = k + len(self._deleted) + len(self._replaced)
+        if self._vectors is not None:
+            if allowed is not None:
+                index = self._row_index()
+                rows = np.array(sorted(index[n] for n in allowed if n in index), dtype=np.int64)
+            elif self._ivf is not None:
+                rows = self._ivf_candidates(q)
+            else:
+                rows = None
+            if rows is None or len(rows):
+                scores = self._score_rows(q, rows)
+                top = _top_k(scores, min(fetch, len(scores)))
+                base_rows = top if rows is None else rows[top]
+                for node_id, score in zip(np.asarray(self._ids[base_rows]), scores[top].tolist()):
+                    node_id = node_id.decode("utf-8")
+                    if node_id not in self._replaced:
+                        found_ids.append(node_id)
+                        found_scores.append(score)
+
+        if self._pending_ids:
+            # Mismo filtro que en el segmento: el top-k se toma solo entre las filas permitidas
+            if allowed is None:
+                positions = np.arange(len(self._pending_ids))
+            else:
+                positions = np.array([i for i, node_id in enumerate(self._pending_ids) if node_id in allowed],
+                                     dtype=np.int64)
+            if len(positions):
+                pending = np.vstack([self._pending_vectors[i] for i in positions])
+                scores = pending @ q
+                for i in _top_k(scores, min(fetch, len(scores))):
+                    found_ids.append(self._pending_ids[positions[i]])
+                    found_scores.append(float(scores[i]))
+
+        results = sorted(
+            (
+                (score, node_id)
+                for score, node_id in zip(found_scores, found_ids)
+                if node_id not in self._deleted and (allowed is None or node_id in allowed)
+            ),
+            reverse=True,
+        )
+        similarities, ids = [], []
+        for score, node_id in results:
+            similarities.append(float(score))
+            ids.append(node_id)
+            if len(ids) == k:
+                break
+        return VectorStoreQueryResult(similarities=similarities, ids=ids)
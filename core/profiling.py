@@ -0,0 +1,324 @@
+import cProfile
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.tracing import current_trace, set_trace_attributes
+
+logger = logging.getLogger(__name__)
+
+MODE_SAMPLING = "sampling"
+MODE_CPROFILE = "cprofile"
+MODES = (MODE_SAMPLING, MODE_CPROFILE)
+
+# Un header firmado vale por este tiempo (evita reutilizar uno capturado en logs)
+HEADER_MAX_AGE_SECONDS = 300
+# Los handlers viven en querys/; su función más externa en la pila etiqueta el perfil
+HANDLER_PATH_MARKER = os.sep + "querys" + os.sep
+RAG_PATH_MARKER = "rag_engine.py"
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+Frame = Tuple[str, str, int]  # (función, archivo, línea de definición)
+
+
+def sign_profile_request(secret: str, timestamp: int = None, mode: str = MODE_SAMPLING) -> str:
+    """Valor del header X-Profile: "<timestamp>:<modo>:<hmac-sha256 de 'timestamp:modo'>"."""
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    message = f"{timestamp}:{mode}".encode()
+    signature = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}:{mode}:{signature}"
+
+
+def verify_profile_header(value: str, secret: str, now: float = None) -> Optional[str]:
+    """Modo pedido si la firma es válida y reciente; None en otro caso."""
+    if not value or not secret:
+        return None
+    try:
+        timestamp, mode, signature = value.strip().split(":")
+        age = (time.time() if now is None else now) - int(timestamp)
+    except ValueError:
+        return None
+    if mode not in MODES or abs(age) > HEADER_MAX_AGE_SECONDS:
+        return None
+    expected = hmac.new(secret.encode(), f"{timestamp}:{mode}".encode(), hashlib.sha256).hexdigest()
+    return mode if hmac.compare_digest(expected, signature) else None
+
+
+class StackSampler:
+    """
+    Perfilador por muestreo de un hilo: otro hilo lee su pila con sys._current_frames()
+    cada `interval` segundos. El costo para el hilo perfilado es solo la contención
+    del GIL, así que puede quedar activo en producción a una tasa baja.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: List[Tuple[Tuple[Frame, ...], float]] = []  # (pila raíz->hoja, peso en s)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.start_time = None
+        self.end_time = None
+
+    def _stack(self) -> Optional[Tuple[Frame, ...]]:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        return tuple(reversed(stack)) if stack else None
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            stack = self._stack()
+            if stack:
+                # Peso = tiempo real desde la muestra anterior (el intervalo puede estirarse)
+                self.samples.append((stack, now - last))
+            last = now
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.end_time = time.perf_counter()
+
+    def handler_name(self) -> Optional[str]:
+        """Función de querys/ (o el RAG) con más tiempo en las muestras."""
+        totals: Dict[str, float] = {}
+        for stack, weight in self.samples:
+            for name, filename, _ in stack:
+                if HANDLER_PATH_MARKER in filename:
+                    totals[name] = totals.get(name, 0.0) + weight
+                    break
+                if filename.endswith(RAG_PATH_MARKER) and name == "query":
+                    totals["rag"] = totals.get("rag", 0.0) + weight
+                    break
+        return max(totals, key=totals.get) if totals else None
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        frames: List[Frame] = []
+        index: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, weight in self.samples:
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append(frame)
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(round(weight * 1000, 3))
+        total = round(((self.end_time or time.perf_counter()) - self.start_time) * 1000, 3)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "rolplay-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": n, "file": f, "line": line} for n, f, line in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class Profile:
+    """Perfil en curso de una solicitud; `path` queda definido al escribirse."""
+
+    def __init__(self, mode: str, reason: str):
+        self.mode = mode
+        self.reason = reason
+        self.path = None
+        self.handler = None
+        self._sampler: Optional[StackSampler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+
+
+class RequestProfiler:
+    """
+    Perfilado opt-in de solicitudes completas:
+    - muestreo aleatorio (`enabled` y `sample_rate`) para dejarlo activo en producción;
+    - bajo demanda con un header firmado (ver sign_profile_request).
+    Modos: "sampling" (pilas muestreadas, archivo speedscope) o "cprofile"
+    (determinista, archivo .prof de pstats). Como mucho un perfil a la vez por proceso.
+    Los archivos se nombran con fecha, intención, handler e id de traza.
+    """
+
+    def __init__(self, directory: str, enabled: bool = False, sample_rate: float = 0.0,
+                 mode: str = MODE_SAMPLING, interval: float = 0.005, secret: str = "", max_files: int = 200):
+        if mode not in MODES:
+            raise ValueError(f"Modo de perfilado desconocido: {mode} (usa {', '.join(MODES)})")
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval = interval
+        self.secret = secret
+        self.max_files = max_files
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._written = 0
+        self._skipped_busy = 0
+
+    def requested_mode(self, header_value: str = None) -> Tuple[Optional[str], Optional[str]]:
+        """(modo, motivo) si esta solicitud debe perfilarse, (None, None) si no."""
+        mode = verify_profile_header(header_value, self.secret)
+        if mode is not None:
+            return mode, "header"
+        if header_value and self.secret:
+            logger.warning("Header X-Profile inválido o vencido; se ignora")
+        if self.enabled and self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.mode, "sampled"
+        return None, None
+
+    @contextmanager
+    def maybe_profile(self, header_value: str = None):
+        """
+        Perfila el bloque si corresponde y entrega el Profile (o None). Al salir, incluso
+        con excepción, escribe el archivo etiquetado con la intención de la traza actual
+        y deja la ruta en el atributo `profile` de la traza.
+        """
+        mode, reason = self.requested_mode(header_value)
+        if mode is None:
+            yield None
+            return
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                self._skipped_busy += 1
+            yield None
+            return
+        profile = Profile(mode, reason)
+        try:
+            if mode == MODE_SAMPLING:
+                profile._sampler = StackSampler(threading.get_ident(), self.interval)
+                profile._sampler.start()
+            else:
+                profile._cprofile = cProfile.Profile()
+                profile._cprofile.enable()
+            try:
+                yield profile
+            finally:
+                if profile._sampler is not None:
+                    profile._sampler.stop()
+                else:
+                    profile._cprofile.disable()
+                trace = current_trace()
+                trace_id = trace.trace_id if trace is not None else uuid.uuid4().hex
+                intent = trace.attributes.get("query_type") if trace is not None else None
+                path = self.write(profile, trace_id, intent)
+                set_trace_attributes(profile=path, profile_handler=profile.handler, profile_reason=reason)
+        finally:
+            self._busy.release()
+
+    def write(self, profile: Profile, trace_id: str, intent: str = None) -> Optional[str]:
+        """Escribe el perfil en el directorio y aplica la retención; retorna la ruta."""
+        if profile._sampler is not None:
+            profile.handler = profile._sampler.handler_name()
+        else:
+            profile.handler = _cprofile_handler_name(profile._cprofile)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        tag = "_".join(_slug(part or "none") for part in (intent, profile.handler))
+        extension = "speedscope.json" if profile._sampler is not None else "prof"
+        path = os.path.join(self.directory, f"{stamp}_{tag}_{trace_id}.{extension}")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if profile._sampler is not None:
+                name = f"{intent or 'query'} / {profile.handler or '-'} ({trace_id})"
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(profile._sampler.to_speedscope(name), f)
+            else:
+                profile._cprofile.dump_stats(path)
+        except OSError as e:
+            logger.error("No se pudo escribir el perfil %s: %s", path, str(e))
+            return None
+        profile.path = path
+        with self._lock:
+            self._written += 1
+        self._prune()
+        return path
+
+    def _prune(self):
+        try:
+            files = sorted(
+                (os.path.join(self.directory, f) for f in os.listdir(self.directory)
+                 if f.endswith(".speedscope.json") or f.endswith(".prof")),
+                key=os.path.getmtime
+            )
+            for old in files[:max(0, len(files) - self.max_files)]:
+                os.remove(old)
+        except OSError as e:
+            logger.warning("No se pudo aplicar la retención de perfiles: %s", str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "mode": self.mode,
+                "header_enabled": bool(self.secret),
+                "written": self._written,
+                "skipped_busy": self._skipped_busy,
+            }
+
+
+def _cprofile_handler_name(profiler: cProfile.Profile) -> Optional[str]:
+    stats = pstats.Stats(profiler)
+    best, best_time = None, 0.0
+    for (filename, _, name), (_, _, _, cumulative, _) in stats.stats.items():
+        if HANDLER_PATH_MARKER in filename and cumulative > best_time:
+            best, best_time = name, cumulative
+        elif filename.endswith(RAG_PATH_MARKER) and name == "query" and cumulative > best_time:
+            best, best_time = "rag", cumulative
+    return best
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", str(text)).strip("-")[:40] or "none"
+
+
+def create_request_profiler() -> RequestProfiler:
+    from core.config import (
+        PROFILING_DIR,
+        PROFILING_ENABLED,
+        PROFILING_INTERVAL_MS,
+        PROFILING_MAX_FILES,
+        PROFILING_MODE,
+        PROFILING_SAMPLE_RATE,
+        PROFILING_SECRET
+    )
+    return RequestProfiler(
+        PROFILING_DIR,
+        enabled=PROFILING_ENABLED,
+        sample_rate=PROFILING_SAMPLE_RATE,
+        mode=PROFILING_MODE,
+        interval=PROFILING_INTERVAL_MS / 1000,
+        secret=PROFILING_SECRET,
+        max_files=PROFILING_MAX_FILES,
+    )
+
+
+request_profiler = create_request_profiler()
@@ -3,6 +3,8 @@ import os
 import sys
 import traceback
 import logging
+import json
+import time
 
 # 1) Ajustamos el path para que Python encuentre la carpeta principal:
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -25,6 +27,15 @@ from querys.querys_Fact_RolPlay_Sim import (
     get_last_context,
     parse_flexible_date
 )
+from core.session_store import DEFAULT_SESSION_ID
+from core.semantic_cache import normalize_query
+from core.keyword_matcher import QUERY_KEYWORDS
+from core.single_flight import FlightTimeout, SingleFlight
+from core.admission import AdmissionRejected
+from core.metrics import ERRORS, FALLBACKS, HANDLER_DURATION, QUERY_TYPES, time_stage
+from core.tracing import begin_span, set_trace_attributes
+from core.resilience import CircuitBreaker, Deadline, ProviderUnavailable, openai_breaker
+from core.config import SINGLE_FLIGHT_ENABLED
 
 # Importa las funciones de actividades / sucursales / tiempo
 from querys.querys_activities import (
@@ -53,11 +64,115 @@ from querys.querys_users import (
     get_exact_activity_result
 )
 
+# Importa el análisis por criterio de evaluación
+from querys.querys_criteria import get_criterion_analysis
+
+# Importa el ranking de progresión de todos los usuarios
+from querys.querys_progression import get_most_improved
+
 # Importar la clase RolPlayRAG para tipado
 from rag_engine import RolPlayRAG
 
 
-def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) -> str:
+RAG_WARMING_UP_MESSAGE = (
+    "El motor de análisis exploratorio (RAG) se está cargando (RAG warming up). "
+    "Mientras tanto puedo responder consultas específicas sobre usuarios, sucursales, "
+    "actividades, rankings y tendencias. Intenta de nuevo esta consulta en unos momentos."
+)
+
+QUERY_TIMEOUT_MESSAGE = (
+    "Lo siento, una consulta idéntica en curso no terminó a tiempo. "
+    "Intenta de nuevo en unos momentos."
+)
+
+RAG_UNAVAILABLE_MESSAGE = (
+    "Lo siento, el motor de análisis exploratorio (RAG) no está disponible en este momento. "
+    "Puedo responder consultas específicas sobre usuarios, sucursales, actividades, rankings y tendencias."
+)
+
+# Agrupación de consultas idénticas en curso (compartida por todos los hilos del proceso)
+query_single_flight = SingleFlight()
+
+
+def rag_not_ready_message(rag_engine: RolPlayRAG):
+    """
+    Mensaje para el usuario si el RAG no puede atender consultas (índice cargando,
+    con error o circuit breaker de OpenAI abierto); None si está listo.
+    """
+    if openai_breaker.state == CircuitBreaker.OPEN:
+        return RAG_UNAVAILABLE_MESSAGE
+    if rag_engine.index_ready.is_set():
+        return None
+    if rag_engine.index_status == "error":
+        return RAG_UNAVAILABLE_MESSAGE
+    return RAG_WARMING_UP_MESSAGE
+
+
+def single_flight_key(rag_engine: RolPlayRAG, query: str, last_ctx: dict, generate_response_func) -> tuple:
+    """
+    Clave de agrupación: pregunta normalizada + versión de los datos + contexto de la
+    sesión (una pregunta de seguimiento depende de él). Sesiones nuevas comparten el
+    contexto vacío, así que las consultas idénticas al cargar un dashboard se agrupan.
+    """
+    if rag_engine is None:
+        version = None
+    else:
+        version = (id(rag_engine.raw_data), rag_engine.data_version)
+    context = json.dumps(last_ctx, sort_keys=True, default=str)
+    return (normalize_query(query), version, context, id(generate_response_func))
+
+
+def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func,
+                  session_id: str = DEFAULT_SESSION_ID, deadline: Deadline = None) -> str:
+    """
+    Procesa una consulta del usuario. `session_id` identifica la conversación: el
+    contexto de seguimiento ("¿y en esa fecha?") se lee y guarda solo para esa sesión.
+    Las consultas idénticas concurrentes (misma clave de single_flight_key) se
+    resuelven con una sola ejecución; cada una actualiza después su propia sesión.
+    `deadline` es el presupuesto de tiempo de la solicitud; se pasa a cada llamada al LLM.
+    """
+    deadline = deadline or Deadline.none()
+    last_ctx = get_last_context(session_id)
+    # El contexto usado queda en la traza para poder reproducir la consulta
+    set_trace_attributes(context=last_ctx)
+    if not SINGLE_FLIGHT_ENABLED:
+        context_updates = []
+        response = _process_query(rag_engine, query, generate_response_func, last_ctx, context_updates, deadline)
+    else:
+        def compute():
+            updates = []
+            return _process_query(rag_engine, query, generate_response_func, last_ctx, updates, deadline), updates
+
+        key = single_flight_key(rag_engine, query, last_ctx, generate_response_func)
+        # Quien se suma a una consulta en curso espera solo lo que queda de su presupuesto
+        remaining = deadline.remaining()
+        try:
+            (response, context_updates), shared = query_single_flight.do(
+                key, compute, timeout=None if remaining == float("inf") else remaining
+            )
+        except FlightTimeout as e:
+            logger.warning("Consulta agrupada sin respuesta dentro del plazo (%s): %s", e, query)
+            FALLBACKS.inc(kind="single_flight_timeout")
+            set_trace_attributes(coalesced=True)
+            return QUERY_TIMEOUT_MESSAGE
+        set_trace_attributes(coalesced=shared)
+        if shared:
+            logger.info("Consulta agrupada con una idéntica en curso: %s", query)
+
+    # 6. Actualizar el contexto de esta sesión
+    for query_type, values in context_updates:
+        context = update_context(query_type, session_id=session_id, **values)
+        logger.debug("Contexto actualizado (sesión %s): %s", session_id, context)
+    return response
+
+
+def _process_query(rag_engine: RolPlayRAG, query: str, generate_response_func,
+                   last_ctx: dict, context_updates: list, deadline: Deadline) -> str:
+    """
+    Resuelve la consulta usando `last_ctx` como contexto previo. No escribe en la
+    sesión: agrega a `context_updates` el (query_type, valores) a guardar.
+    """
+    handler_span = None
     try:
         # Verificar que rag_engine no sea None
         if rag_engine is None:
@@ -71,16 +186,21 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
             
         # 1. Determinar la intención con determine_intent
         logger.info("Query recibida: %s", query)
-        intent = determine_intent(query)
+        with time_stage("intent"):
+            intent = determine_intent(query, deadline=deadline, gazetteer=rag_engine.gazetteer)
         logger.debug("Intención detectada: %s", intent)
 
         # 2. Si la intención NO requiere datos, es charla general
         if not intent["requires_data"]:
             logger.debug("Consulta de conversación general. No se requieren datos.")
-            return generate_response_func(query)
+            QUERY_TYPES.inc(query_type="conversation")
+            with time_stage("generation"):
+                return generate_response_func(query, deadline=deadline)
         
         query_type = intent["query_type"]
         parameters = intent["parameters"]
+        QUERY_TYPES.inc(query_type=query_type)
+        set_trace_attributes(query_type=query_type, parameters=parameters, use_context=intent.get("use_context"))
         
         # Asegurar que parameters es un diccionario válido
         if parameters is None:
@@ -88,18 +208,26 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
             logger.warning("Parameters era None, inicializado como diccionario vacío")
 
         # 3. Revisar si se usa contexto previo
-        if intent["use_context"]:
-            last_ctx = get_last_context()
-            logger.debug("Usando contexto previo: %s", last_ctx)
-            for key, value in last_ctx.items():
-                if key in parameters and (not parameters[key] or parameters[key] is None):
-                    parameters[key] = value
-                    logger.debug("Aplicando valor de contexto para %s: %s", key, value)
+        with time_stage("context_merge"):
+            if intent["use_context"]:
+                logger.debug("Usando contexto previo: %s", last_ctx)
+                for key, value in last_ctx.items():
+                    if key in parameters and (not parameters[key] or parameters[key] is None):
+                        parameters[key] = value
+                        logger.debug("Aplicando valor de contexto para %s: %s", key, value)
+
+        handler_start = time.perf_counter()
+        handler_span = begin_span("handler", query_type=query_type, dataset_rows=len(rag_engine.raw_data))
 
         # NUEVO: 4. Usar RAG para consultas exploratorias específicas
         if query_type == "exploratory_analysis":
+            not_ready = rag_not_ready_message(rag_engine)
+            if not_ready:
+                logger.info("Índice RAG no disponible (%s) para consulta exploratoria", rag_engine.index_status)
+                FALLBACKS.inc(kind="rag_unavailable")
+                return not_ready
             logger.debug("USANDO RAG para consulta exploratoria: %s", query)
-            response_data = rag_engine.query(query)
+            response_data = rag_engine.query(query, deadline=deadline)
         # 5. Ejecutar la consulta apropiada según query_type
         elif query_type == "specific_date":
             response_data = get_exact_activity_result(
@@ -109,7 +237,7 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
             )
         elif query_type == "user_performance":
             # Verificar si el texto de la consulta contiene "Representante" entre comillas
-            if "representante" in query.lower() and '"' in query:
+            if '"' in query and QUERY_KEYWORDS.has(query, "representante"):
                 import re
                 representante_match = re.search(r'"([^"]*representante[^"]*)"', query, re.IGNORECASE)
                 if representante_match:
@@ -131,7 +259,7 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
                 logger.debug("No se especificó sucursal, usando rankings de sucursales en su lugar")
                 response_data = get_branch_rankings(rag_engine.raw_data)
                 # Si la consulta contiene palabras que indican buscar la peor sucursal
-                if any(word in query.lower() for word in ["peor", "menor", "más bajo", "mas bajo", "mala"]):
+                if QUERY_KEYWORDS.has(query, "worst"):
                     parameters["tipo"] = "peores"
                     if "rankings" in response_data.get("data", {}) and "por_calificacion" in response_data["data"]["rankings"]:
                         peores = sorted(response_data["data"]["rankings"]["por_calificacion"], key=lambda x: x["promedio_calificacion"])
@@ -245,6 +373,20 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
                     usuario,
                     parameters.get("metrica", "calificacion")
                 )
+        elif query_type == "most_improved":
+            # "periodo" también es la granularidad de time_period (hour/day/week/month): no es un rango
+            periodo = parameters.get("fecha") or parameters.get("periodo")
+            if periodo in ("hour", "day", "week", "month"):
+                periodo = None
+            response_data = get_most_improved(
+                rag_engine.raw_data,
+                parameters.get("n", 10),
+                parameters.get("metrica") or parameters.get("metric", "calificacion"),
+                parameters.get("sucursal"),
+                parameters.get("actividad"),
+                periodo,
+                "asc" if parameters.get("tipo") == "peores" else parameters.get("order", "desc")
+            )
         elif query_type == "personalized_recommendations":
             # Verificar que usuario no sea None antes de pasar a get_personalized_recommendations
             usuario = parameters.get("usuario")
@@ -255,6 +397,13 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
                     rag_engine.raw_data,
                     usuario
                 )
+        elif query_type == "criterion_analysis":
+            response_data = get_criterion_analysis(
+                rag_engine.raw_data,
+                parameters.get("usuario"),
+                parameters.get("sucursal"),
+                parameters.get("actividad")
+            )
         elif query_type == "advanced_search":
             # Asegurar que filtros sea un diccionario válido
             filtros = parameters.get("filtros")
@@ -267,25 +416,41 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
             )
         else:
             # Por defecto, delegamos la consulta a rag_engine.query()
+            not_ready = rag_not_ready_message(rag_engine)
+            if not_ready:
+                logger.info("Índice RAG no disponible (%s) para consulta sin handler", rag_engine.index_status)
+                FALLBACKS.inc(kind="rag_unavailable")
+                return not_ready
             logger.debug("USANDO RAG como último recurso para: %s", query)
-            response_data = rag_engine.query(query)
-
-        # 6. Actualizar el contexto
-        update_context(
-            query_type,
-            fecha=parameters.get("fecha"),
-            usuario=parameters.get("usuario"),
-            actividad=parameters.get("actividad"),
-            sucursal=parameters.get("sucursal")
-        )
-        logger.debug("Contexto actualizado: %s", get_last_context())
+            response_data = rag_engine.query(query, deadline=deadline)
+        HANDLER_DURATION.observe(time.perf_counter() - handler_start, query_type=query_type)
+        if handler_span is not None:
+            handler_span.set(payload_bytes=len(json.dumps(response_data, ensure_ascii=False, default=str)))
+            handler_span.end()
+
+        # 6. Contexto a guardar en la sesión (lo aplica process_query)
+        context_updates.append((query_type, {
+            "fecha": parameters.get("fecha"),
+            "usuario": parameters.get("usuario"),
+            "actividad": parameters.get("actividad"),
+            "sucursal": parameters.get("sucursal")
+        }))
 
         # 7. Generar la respuesta final
         logger.info("Generando respuesta para la consulta.")
-        return generate_response_func(query, response_data, query_type)
+        with time_stage("generation"):
+            return generate_response_func(query, response_data, query_type, deadline=deadline)
 
+    except AdmissionRejected:
+        # Sin capacidad para llamar al LLM: la capa HTTP responde 429
+        raise
+    except ProviderUnavailable as e:
+        logger.warning("RAG sin proveedor disponible: %s", str(e))
+        FALLBACKS.inc(kind="rag_unavailable")
+        return RAG_UNAVAILABLE_MESSAGE
     except ValueError as e:
         logger.error("ValueError: %s", str(e), exc_info=True)
+        ERRORS.inc(stage="process_query", error="ValueError")
         if "metric" in str(e).lower() or "tipo" in str(e).lower():
             return ("Lo siento, parece que hay un problema con el tipo de métrica solicitada. "
                     "Puedo proporcionarte rankings por calificación general, por puntos totales "
@@ -305,18 +470,26 @@ def process_query(rag_engine: RolPlayRAG, query: str, generate_response_func) ->
         return f"Hubo un problema con los datos proporcionados: {str(e)}. Por favor, intenta reformular tu pregunta."
     except KeyError as e:
         logger.error("KeyError: %s", str(e), exc_info=True)
+        ERRORS.inc(stage="process_query", error="KeyError")
         return f"Lo siento, no encuentro información sobre {str(e)}. ¿Podrías verificar si el dato es correcto?"
     except IndexError:
         logger.error("IndexError", exc_info=True)
+        ERRORS.inc(stage="process_query", error="IndexError")
         return ("No encontré suficientes datos para responder a tu consulta. "
                 "¿Podrías reformularla o ser más específico?")
     except TypeError as e:
         logger.error("TypeError: %s", str(e), exc_info=True)
+        ERRORS.inc(stage="process_query", error="TypeError")
         if "NoneType" in str(e):
             return ("Lo siento, hay un problema con los datos que estoy intentando procesar. "
                     "Parece ser un error con valores nulos. ¿Podrías reformular tu consulta?")
         return f"Hubo un problema de tipo en los datos: {str(e)}. Por favor, intenta con otra consulta."
     except Exception as e:
         logger.error("Error procesando la consulta: %s", str(e), exc_info=True)
+        ERRORS.inc(stage="process_query", error=type(e).__name__)
         return ("Lo siento, tuve un problema procesando tu consulta. "
                 "Intenta reformularla o hacer una pregunta diferente.")
+    finally:
+        # Si el handler terminó con una excepción o un retorno anticipado, su span sigue abierto
+        if handler_span is not None:
+            handler_span.end()
@@ -0,0 +1,71 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Limitador de tasa tipo token bucket, seguro para hilos.
+    - capacity: máximo de tokens acumulables (tamaño de ráfaga).
+    - refill_rate: tokens repuestos por segundo.
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        if capacity <= 0 or refill_rate <= 0:
+            raise ValueError("capacity y refill_rate deben ser mayores que 0")
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, amount: float, burst: Optional[float] = None) -> "TokenBucket":
+        """Crea un bucket a partir de un límite por minuto (p. ej. RPM/TPM del proveedor)."""
+        return cls(capacity=burst or amount, refill_rate=amount / 60.0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.refill_rate)
+        self._last = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Consume tokens si hay disponibles; no bloquea."""
+        tokens = min(float(tokens), self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """Segundos estimados hasta poder consumir `tokens`."""
+        tokens = min(float(tokens), self.capacity)
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+        return max(0.0, missing / self.refill_rate)
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Bloquea hasta consumir `tokens`. Retorna False si se agota `timeout`
+        (None = esperar indefinidamente).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.try_acquire(tokens):
+                return True
+            wait = self.time_until_available(tokens)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait > remaining:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0.001))
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
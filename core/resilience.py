@@ -0,0 +1,254 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import openai
+
+from core.admission import AdmissionRejected, admission_controller
+from core.config import OPENAI_TIMEOUT, OPENAI_RETRY_BASE_DELAY
+from core.tracing import add_trace_counter, span
+
+logger = logging.getLogger(__name__)
+
+# Por debajo de este margen no tiene sentido iniciar una llamada a la API
+MIN_CALL_SECONDS = 1.0
+
+# Fallos transitorios del proveedor: se reintentan y cuentan para el circuit breaker.
+# El resto (400 por contexto excedido, 401, 404, 422, errores locales del llamador)
+# se propaga de inmediato: reintentarlos no cambia el resultado y no indican que la
+# API esté caída, así que no deben abrir el interruptor compartido.
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class ProviderUnavailable(Exception):
+    """
+    El proveedor no puede atender la llamada (interruptor abierto, presupuesto agotado
+    o reintentos fallidos); el llamador debe usar su alternativa local.
+    """
+
+
+class Deadline:
+    """
+    Presupuesto de tiempo de una solicitud. Se crea en /query y se pasa
+    explícitamente a cada etapa, que lo usa para acotar timeouts, esperas y reintentos.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def none(cls) -> "Deadline":
+        """Sin límite (consola, scripts)."""
+        return cls(float("inf"))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """Timeout para una llamada: el menor entre `cap` y lo que queda del presupuesto."""
+        return min(cap, self.remaining())
+
+    def sleep(self, seconds: float) -> bool:
+        """Duerme si cabe en el presupuesto; retorna False (sin dormir) si no."""
+        if seconds >= self.remaining():
+            return False
+        time.sleep(seconds)
+        return True
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Backoff exponencial con jitter completo: uniforme en [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Interruptor alrededor de un proveedor externo:
+    - closed: las llamadas pasan; `failure_threshold` fallos consecutivos lo abren.
+    - open: allow() retorna False durante `recovery_timeout` segundos, así el
+      llamador usa su alternativa local de inmediato.
+    - half_open: pasado ese tiempo se deja pasar una llamada de prueba; si funciona
+      se cierra, si falla vuelve a abrirse.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Circuit breaker '%s' cerrado: el proveedor respondió", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """La llamada de prueba terminó sin indicar si el proveedor se recuperó: se permite otra."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                    logger.warning(
+                        "Circuit breaker '%s' abierto tras %d fallos; usando alternativa local por %.0fs",
+                        self.name, self._failures, self.recovery_timeout
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "times_opened": self._times_opened,
+                "short_circuited": self._short_circuited,
+            }
+
+
+def create_openai_breaker() -> CircuitBreaker:
+    from core.config import OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RECOVERY_SECONDS
+    return CircuitBreaker("openai", OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RECOVERY_SECONDS)
+
+
+# Un único interruptor para la API de OpenAI, compartido por intención, RAG y generación
+openai_breaker = create_openai_breaker()
+
+
+def call_llm(
+    create: Callable[[float], Any],
+    *,
+    stage: str,
+    deadline: Optional[Deadline] = None,
+    breaker: CircuitBreaker = None,
+    max_attempts: int = 3,
+    timeout_cap: float = OPENAI_TIMEOUT,
+    validate: Callable[[Any], Any] = None,
+) -> Any:
+    """
+    Ejecuta `create(timeout)` (una llamada a la API) con:
+    - control de admisión de la etapa (AdmissionRejected se propaga para responder 429),
+    - timeout por llamada acotado por lo que queda del `deadline`,
+    - reintentos con backoff exponencial y jitter solo si caben en el presupuesto,
+    - el circuit breaker: fallos transitorios de la API (RETRYABLE_ERRORS) lo
+      alimentan y, abierto, no se llama. Un timeout recortado por el `deadline` no
+      cuenta: es falta de presupuesto, no un fallo del proveedor.
+    Cualquier otra excepción de `create` se propaga sin reintentos ni breaker.
+    `validate` transforma la respuesta (p. ej. parsear JSON); si lanza, se reintenta
+    sin contar como fallo del proveedor.
+    Lanza ProviderUnavailable cuando hay que usar la alternativa local.
+    """
+    deadline = deadline or Deadline.none()
+    breaker = breaker or openai_breaker
+    with span("llm", stage=stage) as llm_span:
+        return _call_llm(create, stage, deadline, breaker, max_attempts, timeout_cap, validate, llm_span)
+
+
+def _record_usage(llm_span, response):
+    """Tokens de la respuesta de la API (chat.completions) en el span y en los totales de la traza."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    if llm_span is not None:
+        llm_span.set(model=getattr(response, "model", None), prompt_tokens=prompt_tokens,
+                     completion_tokens=completion_tokens)
+    add_trace_counter("prompt_tokens", prompt_tokens)
+    add_trace_counter("completion_tokens", completion_tokens)
+
+
+def _call_llm(create, stage, deadline, breaker, max_attempts, timeout_cap, validate, llm_span):
+    last_error = None
+    for attempt in range(max_attempts):
+        if llm_span is not None:
+            llm_span.set(attempts=attempt + 1)
+        if breaker.state == CircuitBreaker.OPEN:
+            raise ProviderUnavailable(f"circuit breaker '{breaker.name}' abierto")
+        if deadline.remaining() < MIN_CALL_SECONDS:
+            raise ProviderUnavailable("presupuesto de tiempo agotado")
+        response_received = False
+        try:
+            with admission_controller.admit(stage, deadline):
+                if not breaker.allow():
+                    raise ProviderUnavailable(f"circuit breaker '{breaker.name}' abierto")
+                timeout = deadline.timeout(timeout_cap)
+                try:
+                    response = create(timeout)
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, openai.APITimeoutError) and timeout < timeout_cap:
+                        # Timeout recortado por el deadline: falta de presupuesto, no del proveedor
+                        breaker.release_probe()
+                    else:
+                        breaker.record_failure()
+                    raise
+                except Exception:
+                    breaker.release_probe()
+                    raise
+            response_received = True
+            breaker.record_success()
+            _record_usage(llm_span, response)
+            return response if validate is None else validate(response)
+        except (AdmissionRejected, ProviderUnavailable):
+            raise
+        except Exception as e:
+            if not response_received and not isinstance(e, RETRYABLE_ERRORS):
+                # Error no transitorio (petición inválida, credenciales, error local):
+                # se propaga tal cual, sin reintentos y sin alimentar el breaker
+                raise
+            last_error = e
+            logger.warning("Intento %d/%d de '%s' falló: %s", attempt + 1, max_attempts, stage, str(e))
+            if attempt < max_attempts - 1 and not deadline.sleep(backoff_delay(attempt, OPENAI_RETRY_BASE_DELAY)):
+                break
+    raise ProviderUnavailable(f"'{stage}' falló: {last_error}") from last_error
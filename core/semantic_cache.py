@@ -0,0 +1,141 @@
+import copy
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.text_processing import clean_text
+
+
+def normalize_query(query: str) -> str:
+    """Forma canónica de la pregunta para coincidencias exactas (sin tildes, mayúsculas ni signos)."""
+    return " ".join(re.findall(r"[a-z0-9]+", clean_text(" ".join(query.split()))))
+
+
+def entity_signature(query: str) -> frozenset:
+    """
+    Tokens que identifican entidades concretas (user7, Sucursal 48 -> '48', fechas, años).
+    Dos preguntas casi idénticas sobre entidades distintas tienen similitud coseno muy
+    alta, así que solo se comparan entradas con la misma firma.
+    """
+    return frozenset(t for t in normalize_query(query).split() if any(c.isdigit() for c in t))
+
+
+class SemanticCache:
+    """
+    Caché de respuestas del RAG indexada por el embedding de la pregunta:
+    - Coincidencia exacta sobre la pregunta normalizada (no requiere embedding).
+    - Coincidencia semántica: similitud coseno >= threshold contra las preguntas
+      guardadas con la misma versión de datos y la misma firma de entidades.
+    - Capacidad fija con desalojo LRU; los embeddings viven en una matriz
+      preasignada, así que la búsqueda es un único producto matriz-vector.
+    """
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._lru = OrderedDict()  # slot -> None, del menos al más recientemente usado
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._exact: Dict[tuple, int] = {}
+        self._hits_exact = 0
+        self._hits_semantic = 0
+        self._misses = 0
+        self._evictions = 0
+        self._similarity_sum = 0.0
+
+    def _touch(self, slot: int) -> Any:
+        self._lru.move_to_end(slot)
+        return copy.deepcopy(self._entries[slot]["value"])
+
+    def lookup_exact(self, query: str, version: str) -> Optional[Any]:
+        """Busca la misma pregunta (normalizada); no cuenta como fallo si no está."""
+        with self._lock:
+            slot = self._exact.get((version, normalize_query(query)))
+            if slot is None:
+                return None
+            self._hits_exact += 1
+            return self._touch(slot)
+
+    def lookup(self, query: str, embedding: List[float], version: str) -> Optional[Any]:
+        """Busca una pregunta semánticamente equivalente; registra acierto o fallo."""
+        vector = self._normalize(embedding)
+        signature = entity_signature(query)
+        with self._lock:
+            slots = [
+                slot for slot in self._lru
+                if self._entries[slot]["version"] == version and self._entries[slot]["signature"] == signature
+            ]
+            if slots and self._matrix is not None and self._matrix.shape[1] == vector.shape[0]:
+                similarities = self._matrix[slots] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._hits_semantic += 1
+                    self._similarity_sum += float(similarities[best])
+                    return self._touch(slots[best])
+            self._misses += 1
+            return None
+
+    def store(self, query: str, embedding: List[float], version: str, value: Any):
+        vector = self._normalize(embedding)
+        key = (version, normalize_query(query))
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._reset(vector.shape[0])
+            slot = self._exact.get(key)
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    slot, _ = self._lru.popitem(last=False)
+                    evicted = self._entries[slot]
+                    self._exact.pop((evicted["version"], evicted["normalized"]), None)
+                    self._evictions += 1
+            self._matrix[slot] = vector
+            self._entries[slot] = {
+                "version": version,
+                "normalized": key[1],
+                "signature": entity_signature(query),
+                "value": copy.deepcopy(value),
+            }
+            self._exact[key] = slot
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _reset(self, dim: int):
+        # Cambio de modelo de embeddings (otra dimensión): se descarta todo
+        self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._lru.clear()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._entries = [None] * self.max_entries
+        self._exact.clear()
+
+    def clear(self):
+        with self._lock:
+            self._reset(0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._hits_exact + self._hits_semantic
+            total = hits + self._misses
+            return {
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": hits,
+                "hits_exact": self._hits_exact,
+                "hits_semantic": self._hits_semantic,
+                "misses": self._misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "evictions": self._evictions,
+                "avg_hit_similarity": round(self._similarity_sum / self._hits_semantic, 4) if self._hits_semantic else None,
+            }
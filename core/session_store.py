@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sesión usada cuando no hay un session_id (consola, llamadas internas)
+DEFAULT_SESSION_ID = "default"
+
+CONTEXT_KEYS = ("fecha", "usuario", "actividad", "sucursal", "tipo_consulta")
+
+
+def empty_context() -> Dict[str, Any]:
+    return {key: None for key in CONTEXT_KEYS}
+
+
+class LRUSessionBackend:
+    """
+    Backend en proceso: OrderedDict con desalojo LRU (máximo `max_sessions`)
+    y expiración por inactividad. get/set son O(1).
+    """
+
+    name = "memory"
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 7200):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            expires_at, context = entry
+            if expires_at < time.monotonic():
+                del self._data[session_id]
+                return None
+            self._data.move_to_end(session_id)
+            return dict(context)
+
+    def set(self, session_id: str, context: Dict[str, Any]):
+        with self._lock:
+            self._data[session_id] = (time.monotonic() + self.ttl_seconds, dict(context))
+            self._data.move_to_end(session_id)
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": self.name, "sessions": len(self._data),
+                    "max_sessions": self.max_sessions, "evictions": self._evictions}
+
+
+class InMemoryKVClient:
+    """
+    Sustituto en memoria de un cliente clave-valor tipo Redis (get / set con `ex`).
+    Sirve para pruebas y desarrollo del backend compartido sin levantar un servidor.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ex: Optional[int] = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+
+class KeyValueSessionBackend:
+    """
+    Backend compartido entre procesos/nodos sobre cualquier cliente con la interfaz
+    get(key) / set(key, value, ex=segundos) (redis.Redis, InMemoryKVClient, ...).
+    La memoria queda acotada por el TTL de cada clave.
+    """
+
+    name = "kv"
+
+    def __init__(self, client, prefix: str = "rolplay:session:", ttl_seconds: int = 7200):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = int(ttl_seconds)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+
+    def set(self, session_id: str, context: Dict[str, Any]):
+        self.client.set(self.prefix + session_id, json.dumps(context, default=str), ex=self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "client": type(self.client).__name__, "ttl_seconds": self.ttl_seconds}
+
+
+class SessionContextStore:
+    """Contexto conversacional (última fecha, usuario, actividad, sucursal) por sesión."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, session_id: str = DEFAULT_SESSION_ID) -> Dict[str, Any]:
+        context = empty_context()
+        context.update(self.backend.get(session_id or DEFAULT_SESSION_ID) or {})
+        return context
+
+    def update(self, session_id: str, tipo: str, **kwargs) -> Dict[str, Any]:
+        """Actualiza el tipo de consulta y los valores no nulos; retorna el contexto resultante."""
+        session_id = session_id or DEFAULT_SESSION_ID
+        context = self.get(session_id)
+        context["tipo_consulta"] = tipo
+        for key, value in kwargs.items():
+            if value is not None:
+                context[key] = value
+        self.backend.set(session_id, context)
+        return context
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+def create_session_store(backend: str = "memory", max_sessions: int = 10000,
+                         ttl_seconds: int = 7200, redis_url: str = None) -> SessionContextStore:
+    """
+    backend:
+    - "memory": LRU en proceso (cada worker tiene el suyo).
+    - "redis": compartido entre workers/nodos; requiere el paquete `redis` y redis_url.
+    - "kv-memory": backend compartido sobre InMemoryKVClient (pruebas).
+    Si redis no está disponible se usa el backend en memoria y se registra el error.
+    """
+    if backend == "redis":
+        try:
+            import redis
+            client = redis.Redis.from_url(redis_url, decode_responses=True)
+            return SessionContextStore(KeyValueSessionBackend(client, ttl_seconds=ttl_seconds))
+        except Exception as e:
+            logger.error("No se pudo usar Redis para sesiones (%s); usando backend en memoria", str(e))
+    elif backend == "kv-memory":
+        return SessionContextStore(KeyValueSessionBackend(InMemoryKVClient(), ttl_seconds=ttl_seconds))
+    return SessionContextStore(LRUSessionBackend(max_sessions=max_sessions, ttl_seconds=ttl_seconds))
+
+
+_store: Optional[SessionContextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionContextStore:
+    """Store del proceso, creado a partir de la configuración en el primer uso (después del fork)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from core.config import (
+                    SESSION_BACKEND,
+                    SESSION_MAX_ENTRIES,
+                    SESSION_TTL_SECONDS,
+                    SESSION_REDIS_URL
+                )
+                _store = create_session_store(SESSION_BACKEND, SESSION_MAX_ENTRIES,
+                                              SESSION_TTL_SECONDS, SESSION_REDIS_URL)
+    return _store
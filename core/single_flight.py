@@ -0,0 +1,90 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class FlightTimeout(TimeoutError):
+    """Quien esperaba una llamada en curso agotó su propio tiempo antes de que terminara."""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera ejecuta la función
+    y las que llegan mientras está en curso esperan y reciben el mismo resultado.
+    Cada una espera como máximo su propio `timeout`, y si la llamada en curso falla
+    no hereda la excepción (p. ej. un 429 de admisión o el deadline del líder):
+    ejecuta la función por su cuenta. No guarda resultados: al terminar, la clave se libera.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._executions = 0
+        self._coalesced = 0
+        self._timeouts = 0
+        self._retried = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Retorna (resultado, compartido); compartido=True si se reutilizó una llamada en curso.
+        `timeout`: espera máxima si ya hay una llamada en curso (None: sin límite);
+        vencida, lanza FlightTimeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    call.waiters -= 1
+                    self._timeouts += 1
+                raise FlightTimeout(f"la llamada en curso no terminó en {timeout:.1f}s")
+            if call.error is None:
+                return call.result, True
+            # La llamada en curso falló: se ejecuta con los recursos (y el plazo) propios
+            with self._lock:
+                self._retried += 1
+                self._executions += 1
+            return fn(), False
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._executions + self._coalesced
+            return {
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "coalesced_rate": round(self._coalesced / total, 4) if total else 0.0,
+                "wait_timeouts": self._timeouts,
+                "retried_after_error": self._retried,
+                "in_flight": len(self._calls),
+                "waiting": sum(call.waiters for call in self._calls.values()),
+            }
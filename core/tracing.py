@@ -0,0 +1,189 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("rolplay_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("rolplay_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "start", "end_time", "attributes", "children", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end_time = None
+        self.attributes = dict(attributes or {})
+        self.children: List["Span"] = []
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        """Cierra un span abierto con begin_span y restaura el span padre."""
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration_ms, 2),
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Trace:
+    """Árbol de spans de una solicitud, con atributos de la consulta (intención, parámetros...)."""
+
+    def __init__(self, name: str, trace_id: str = None, **attributes):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.root = Span(name)
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def server_timing(self) -> str:
+        """Header Server-Timing con los spans de primer nivel (agregados por nombre) y el total."""
+        totals: Dict[str, float] = {}
+        for child in self.root.children:
+            totals[child.name] = totals.get(child.name, 0.0) + child.duration_ms
+        parts = [f"{name.replace(' ', '_')};dur={ms:.1f}" for name, ms in totals.items()]
+        parts.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "duration_ms": round(self.root.duration_ms, 2),
+            "attributes": self.attributes,
+            "counters": self.counters,
+            "spans": [child.to_dict(self.root.start) for child in self.root.children],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name: str, trace_id: str = None, **attributes):
+    """Abre la traza de la solicitud en el contexto actual (hilo/tarea)."""
+    trace = Trace(name, trace_id, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        trace.root.end_time = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+def begin_span(name: str, **attributes) -> Optional[Span]:
+    """
+    Abre un span hijo del actual y lo deja como actual hasta span.end().
+    Sin traza activa retorna None (costo casi nulo fuera de /query).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    span = Span(name, attributes)
+    parent.children.append(span)
+    span._token = _current_span.set(span)
+    return span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    opened = begin_span(name, **attributes)
+    try:
+        yield opened
+    except Exception as e:
+        if opened is not None:
+            opened.set(error=type(e).__name__)
+        raise
+    finally:
+        if opened is not None:
+            opened.end()
+
+
+def set_span_attributes(**attributes):
+    """Agrega atributos al span actual (no hace nada sin traza activa)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def set_trace_attributes(**attributes):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def add_trace_counter(name: str, value: float):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, value)
+
+
+class SlowQueryLog:
+    """
+    Agrega a un archivo JSONL las solicitudes que superan `threshold_ms`, con la
+    consulta, su contexto de sesión, intención, parámetros y el árbol de spans,
+    suficiente para reproducirlas.
+    """
+
+    def __init__(self, path: str, threshold_ms: float):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+
+    def maybe_record(self, trace: Trace, **extra) -> bool:
+        if self.threshold_ms < 0 or trace.root.duration_ms < self.threshold_ms:
+            return False
+        record = {"timestamp": datetime.now(timezone.utc).isoformat(), **trace.to_dict(), **extra}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.error("No se pudo escribir el log de consultas lentas: %s", str(e))
+            return False
+        return True
+
+
+def create_slow_query_log() -> SlowQueryLog:
+    from core.config import SLOW_QUERY_LOG_PATH, SLOW_QUERY_THRESHOLD_MS
+    return SlowQueryLog(SLOW_QUERY_LOG_PATH, SLOW_QUERY_THRESHOLD_MS)
+
+
+slow_query_log = create_slow_query_log()
@@ -0,0 +1,79 @@
+"""
+Configuración de gunicorn para producción:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+- preload_app: el master carga dataset, índice y cachés una sola vez (de forma
+  bloqueante) y luego hace fork; los workers comparten esas páginas copy-on-write.
+- gc.freeze() antes del fork: los objetos precargados pasan a la generación
+  permanente, así el GC de cada worker no los toca y no fuerza copias de páginas.
+- SIGHUP (kill -HUP <pid del master>): recarga dataset e índice en el master y
+  reemplaza los workers de forma gradual (los anteriores terminan sus requests).
+- Al iniciar cada worker se registra su memoria: RSS vs páginas compartidas/privadas.
+
+Variables de entorno: PORT, GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_TIMEOUT,
+GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_MAX_REQUESTS.
+"""
+import gc
+import multiprocessing
+import os
+
+# Los hilos no sobreviven al fork: el índice se carga en el master antes de crear workers
+os.environ.setdefault("RAG_BACKGROUND_STARTUP", "false")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+# Las consultas RAG (recuperación + síntesis) pueden tardar
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def _freeze_heap(server):
+    gc.collect()
+    gc.freeze()
+    server.log.info("gc.freeze: %d objetos en la generación permanente", gc.get_freeze_count())
+
+
+def when_ready(server):
+    from core.memory_report import format_memory_summary, memory_summary
+
+    _freeze_heap(server)
+    server.log.info(format_memory_summary(f"Master {os.getpid()} (precargado)", memory_summary()))
+
+
+def post_fork(server, worker):
+    # Si el master construyó el índice, sus clientes HTTP tienen conexiones abiertas;
+    # cada worker debe abrir las suyas
+    from llama_index.core import Settings
+
+    for model in (Settings.embed_model, Settings.llm):
+        for attr in ("_client", "_aclient"):
+            if getattr(model, attr, None) is not None:
+                setattr(model, attr, None)
+
+
+def post_worker_init(worker):
+    from core.memory_report import format_memory_summary, memory_summary
+
+    worker.log.info(format_memory_summary(f"Worker {worker.pid}", memory_summary()))
+
+
+def on_reload(server):
+    # Se ejecuta en el master antes de crear los workers nuevos: heredan los datos recargados
+    import app as application
+    from core.memory_report import format_memory_summary, memory_summary
+
+    gc.unfreeze()
+    server.log.info("SIGHUP: recargando dataset e índice en el master...")
+    if application.reload_data():
+        server.log.info("Recarga completa")
+    else:
+        server.log.warning("La recarga falló; se mantienen los datos anteriores")
+    _freeze_heap(server)
+    server.log.info(format_memory_summary(f"Master {os.getpid()} (recargado)", memory_summary()))
@@ -16,6 +16,7 @@ SOBRE USUARIOS:
 - user_performance: Cuando preguntan cómo le va a alguien, su desempeño o resultados, en qué sucursal está un usuario, o información general sobre un usuario específico
 - user_ranking: Cuando quieren saber quiénes son los mejores/peores o comparar usuarios
 - user_progression: Cuando preguntan por la mejora o evolución de alguien
+- most_improved: Cuando preguntan quiénes mejoraron (o empeoraron) más, sin nombrar a un usuario; admite sucursal, actividad, periodo (p. ej. "este trimestre", "los últimos 3 meses", "2024") y tipo="peores" para los que más empeoraron
 - personalized_recommendations: Cuando piden consejos o sugerencias para mejorar
 
 SOBRE SUCURSALES:
@@ -29,6 +30,9 @@ SOBRE ACTIVIDADES:
 - activity_ranking: Cuando quieren saber qué actividades son más fáciles/difíciles
 - specific_date: Cuando preguntan por resultados en una fecha específica o utilizan términos temporales relativos como "primera", "última", "reciente", etc.
 
+SOBRE CRITERIOS DE EVALUACIÓN (los puntos 1 a 10 que se califican en cada actividad):
+- criterion_analysis: Cuando preguntan por criterios, puntos o aspectos evaluados: en qué criterio fallan más, cuál aciertan más o el promedio por criterio de un usuario, una sucursal o una actividad
+
 ANÁLISIS AVANZADOS:
 - comparative: Cuando quieren comparar cualquier cosa
 - trend: Cuando preguntan por cambios o evolución en el tiempo
@@ -46,6 +50,7 @@ EJEMPLOS DE INTERPRETACIÓN NATURAL:
 "¿Qué usuarios hay en la sucursal 3?" → users_by_branch
 "¿Quiénes están en la sucursal 3?" → users_by_branch
 "¿María ha mejorado?" → user_progression
+"¿Quién mejoró más este trimestre?" → most_improved con periodo="este trimestre"
 "¿Qué tal les fue ayer?" → specific_date
 "¿Qué ayudaría a mejorar a Pedro?" → personalized_recommendations
 "¿Qué actividades cuestan más?" → activity_ranking
@@ -59,6 +64,8 @@ EJEMPLOS DE INTERPRETACIÓN NATURAL:
 "¿Cuál fue la última ronda?" → specific_date con fecha="ultima" y actividad="ronda"
 "¿Cuál fue la primera actividad registrada?" → specific_date con fecha="primera"
 "Quiero ver la actividad más antigua" → specific_date con fecha="primera"
+"¿En qué criterio falla más la sucursal 3?" → criterion_analysis con sucursal="Sucursal 3"
+"Promedio por criterio del usuario 12" → criterion_analysis con usuario="12"
 
 CASOS ESPECIALES CON FECHAS RELATIVAS:
 Cualquier pregunta que haga referencia a términos como "reciente", "último", "primera", "más nuevo", "más antiguo", "actual" debe clasificarse como specific_date, definiendo el parámetro fecha con el valor del término relativo. Ejemplos:
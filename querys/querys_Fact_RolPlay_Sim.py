@@ -1,18 +1,14 @@
+import weakref
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 import traceback
 from core.config import FACT_FILE_PATH, DEBUG_MODE, log_config
+from core.session_store import DEFAULT_SESSION_ID, get_session_store
+from core.date_parsing import in_date_range, parse_date, resolve_date_range
 import re
 
-last_context = {
-    "fecha": None,
-    "usuario": None,
-    "actividad": None,
-    "sucursal": None,
-    "tipo_consulta": None
-}
-
 def handle_error(e: Exception, context: str) -> Dict[str, Any]:
     if isinstance(e, ValueError):
         return {"error": f"Error de valor en {context}: {str(e)}", "data": None}
@@ -21,43 +17,50 @@ def handle_error(e: Exception, context: str) -> Dict[str, Any]:
     else:
         return {"error": f"Error inesperado en {context}: {str(e)}", "data": None}
 
-def update_context(tipo: str, **kwargs):
-    global last_context
-    last_context["tipo_consulta"] = tipo
-    for key, value in kwargs.items():
-        if value is not None:
-            last_context[key] = value
+def update_context(tipo: str, session_id: str = DEFAULT_SESSION_ID, **kwargs):
+    """Guarda el contexto de la última consulta de la sesión (solo valores no nulos)"""
+    return get_session_store().update(session_id, tipo, **kwargs)
+
+def get_last_context(session_id: str = DEFAULT_SESSION_ID) -> Dict[str, Any]:
+    return get_session_store().get(session_id)
+
+# Estructuras derivadas de un DataFrame (matriz de criterios, progresiones), por tipo y
+# por identidad del DataFrame; se descartan cuando el DataFrame se libera
+_frame_cache: Dict[Tuple[str, int], Any] = {}
+
+def frame_cache(df: pd.DataFrame, kind: str, builder: Callable[[pd.DataFrame], Any]) -> Any:
+    """Resultado de builder(df), construido en el primer uso y reutilizado mientras df viva."""
+    key = (kind, id(df))
+    entry = _frame_cache.get(key)
+    if entry is None or entry[0] != len(df):
+        entry = (len(df), builder(df))
+        _frame_cache[key] = entry
+        weakref.finalize(df, _frame_cache.pop, key, None)
+    return entry[1]
 
-def get_last_context() -> Dict[str, Any]:
-    return last_context
+def frame_cache_entries() -> Dict[str, List[Any]]:
+    """Estructuras vivas de frame_cache agrupadas por tipo (para /admin/memory)."""
+    entries: Dict[str, List[Any]] = {}
+    for (kind, _), (_, value) in list(_frame_cache.items()):
+        entries.setdefault(kind, []).append(value)
+    return entries
+
+def value_mask(column: pd.Series, value: str, exact_first: bool = True) -> np.ndarray:
+    """
+    Coincidencia exacta (sin mayúsculas) si el valor existe; si no, por contenido
+    (exact_first=False: siempre por contenido, como str.contains).
+    Se compara contra los valores distintos y se expande con los códigos de factorize.
+    """
+    codes, uniques = pd.factorize(column)
+    text = pd.Series(uniques, dtype=object).astype(str).str.lower()
+    matched = (text == str(value).strip().lower()).to_numpy() if exact_first else np.zeros(len(text), dtype=bool)
+    if not matched.any():
+        matched = text.str.contains(str(value).strip().lower(), regex=False).to_numpy()
+    return np.append(matched, False)[codes]
 
 def parse_flexible_date(fecha_str: str) -> pd.Timestamp:
-    formatos = [
-        '%d/%m/%y %H:%M','%d/%m/%Y %H:%M','%Y-%m-%d %H:%M:%S','%d/%m/%y','%d/%m/%Y',
-        '%Y-%m-%d','%d-%m-%Y %H:%M','%Y/%m/%d %H:%M','%d.%m.%Y %H:%M'
-    ]
-    for formato in formatos:
-        try:
-            return pd.to_datetime(fecha_str, format=formato)
-        except:
-            continue
-    try:
-        fecha_str = fecha_str.lower()
-        fecha_str = re.sub(r'del?', '', fecha_str)
-        fecha_str = re.sub(r'año', '', fecha_str)
-        fecha_str = re.sub(r'a las', '', fecha_str)
-        fecha_str = fecha_str.strip()
-        if 'pm' in fecha_str or 'p.m' in fecha_str:
-            fecha_str = re.sub(r'pm|p.m', '', fecha_str).strip()
-            hora_obj = pd.to_datetime(fecha_str)
-            if hora_obj.hour < 12:
-                hora_obj += timedelta(hours=12)
-            return hora_obj
-        else:
-            fecha_str = re.sub(r'am|a.m', '', fecha_str).strip()
-            return pd.to_datetime(fecha_str)
-    except Exception as e:
-        raise ValueError(f"No se pudo interpretar la fecha: {fecha_str}")
+    """Fecha de un texto en los formatos habituales o libre (ver core/date_parsing.py)"""
+    return parse_date(fecha_str)
 
 
 
@@ -128,8 +131,8 @@ def get_top_performances(raw_data: pd.DataFrame, n: int = 5, metric: str = "cali
             for columna, valor in filtros.items():
                 if valor:
                     if columna == 'fecha':
-                        fecha_dt = parse_flexible_date(valor)
-                        data = data[pd.to_datetime(data['Fecha_y_Hora']).dt.date == fecha_dt.date()]
+                        rango = resolve_date_range(valor, raw_data)
+                        data = data[in_date_range(pd.to_datetime(data['Fecha_y_Hora']), rango)]
                     else:
                         data = data[data[columna].astype(str).str.contains(str(valor), case=False, na=False)]
         
@@ -9,7 +9,8 @@ from typing import Dict, Any, List, Optional
 
 # Importa (o define) las mismas utilidades que usabas antes
 from core.config import FACT_FILE_PATH, DEBUG_MODE, log_config
-from querys.querys_Fact_RolPlay_Sim import last_context, update_context, get_last_context, handle_error, parse_flexible_date
+from querys.querys_Fact_RolPlay_Sim import update_context, get_last_context, handle_error
+from core.date_parsing import in_date_range, parse_dates, resolve_date_range
 
 def get_activity_stats(raw_data: pd.DataFrame, actividad: str) -> Dict[str, Any]:
     try:
@@ -328,7 +329,7 @@ def get_comparative_analysis(raw_data: pd.DataFrame, usuarios: List[str] = None,
                    data['Usuario Nombre'].str.contains('|'.join(usuarios), case=False, na=False)
             data = data[mask]
         if fechas:
-            fechas_dt = [parse_flexible_date(f) for f in fechas]
+            fechas_dt = parse_dates(fechas)
             mask = pd.to_datetime(data['Fecha_y_Hora']).dt.date.isin([f.date() for f in fechas_dt])
             data = data[mask]
         if len(data) == 0:
@@ -441,8 +442,8 @@ def get_top_performances(raw_data: pd.DataFrame, n: int = 5, metric: str = "cali
             for columna, valor in filtros.items():
                 if valor:
                     if columna == 'fecha':
-                        fecha_dt = parse_flexible_date(valor)
-                        data = data[pd.to_datetime(data['Fecha_y_Hora']).dt.date == fecha_dt.date()]
+                        rango = resolve_date_range(valor, raw_data)
+                        data = data[in_date_range(pd.to_datetime(data['Fecha_y_Hora']), rango)]
                     else:
                         data = data[data[columna].astype(str).str.contains(str(valor), case=False, na=False)]
         
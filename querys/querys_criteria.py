@@ -0,0 +1,148 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from querys.querys_Fact_RolPlay_Sim import frame_cache, handle_error, value_mask
+
+# Criterios evaluados en cada actividad: Info_Correcta{i} (SI/NO) y Puntos{i}
+CRITERIA = list(range(1, 11))
+NOT_APPLICABLE = "No aplica"
+
+
+class CriterionMatrix:
+    """
+    Criterios de evaluación de un DataFrame como matrices densas (filas x 10):
+    - points: Puntos{i} numérico (NaN si no aplica o no es válido).
+    - correct: 1.0 si Info_Correcta{i} es "SI", 0.0 si es "NO", NaN en otro caso.
+    - valid: criterio evaluado (información presente, distinta de "No aplica", y
+      puntaje numérico).
+    Se construye una vez por DataFrame (ver criterion_matrix) y las consultas por
+    usuario/sucursal/actividad son reducciones enmascaradas sobre subconjuntos de filas.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        rows = len(df)
+        self.points = np.full((rows, len(CRITERIA)), np.nan, dtype=np.float32)
+        self.correct = np.full((rows, len(CRITERIA)), np.nan, dtype=np.float32)
+        self.valid = np.zeros((rows, len(CRITERIA)), dtype=bool)
+        for j, i in enumerate(CRITERIA):
+            info_col, puntos_col = f"Info_Correcta{i}", f"Puntos{i}"
+            if info_col not in df.columns or puntos_col not in df.columns:
+                continue
+            # Pocos valores distintos por columna: se interpretan los únicos y se expanden
+            # con los códigos de factorize, sin operaciones de texto por fila
+            codes, uniques = pd.factorize(df[info_col])
+            answers = pd.Series(uniques, dtype=object).astype(str).str.strip().str.upper()
+            info_valid = np.append((answers != NOT_APPLICABLE.upper()).to_numpy(), False)
+            info_correct = np.append(np.where(answers == "SI", 1.0, np.where(answers == "NO", 0.0, np.nan)), np.nan)
+            codes_p, uniques_p = pd.factorize(df[puntos_col])
+            puntos = np.append(pd.to_numeric(pd.Series(uniques_p, dtype=object), errors="coerce")
+                               .to_numpy(dtype=np.float64), np.nan)[codes_p]
+            # factorize marca los nulos con -1: apuntan al último elemento agregado
+            valid = info_valid[codes] & ~np.isnan(puntos)
+            correct = info_correct[codes]
+            self.valid[:, j] = valid
+            self.points[:, j] = np.where(valid, puntos, np.nan)
+            self.correct[:, j] = np.where(valid, correct, np.nan)
+
+    def summary(self, rows: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """
+        Por criterio (vectores de 10): evaluaciones, promedio de puntos, tasa de
+        respuestas correctas. `rows` es una máscara booleana de filas (None: todas).
+        """
+        valid = self.valid if rows is None else self.valid[rows]
+        points = self.points if rows is None else self.points[rows]
+        correct = self.correct if rows is None else self.correct[rows]
+        count = valid.sum(axis=0)
+        answered = (~np.isnan(correct)).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_points = np.nansum(points, axis=0) / count
+            correct_rate = np.nansum(correct, axis=0) / answered
+        return {"count": count, "mean_points": mean_points, "correct_rate": correct_rate}
+
+
+def criterion_matrix(df: pd.DataFrame) -> CriterionMatrix:
+    """Matriz de criterios del DataFrame, construida en el primer uso y reutilizada."""
+    return frame_cache(df, "criterios", CriterionMatrix)
+
+
+def _user_mask(raw_data: pd.DataFrame, usuario: str) -> np.ndarray:
+    usuario = str(usuario).strip()
+    if usuario.isdigit():
+        # Mismo criterio que get_user_activity_history: "userN" o "Representante N"
+        return ((raw_data['Usuario'] == f"user{usuario}") |
+                (raw_data['Usuario Nombre'] == f"Representante {usuario}")).to_numpy()
+    return value_mask(raw_data['Usuario'], usuario) | value_mask(raw_data['Usuario Nombre'], usuario)
+
+
+def _round(value: float, digits: int = 2) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def get_criterion_analysis(raw_data: pd.DataFrame, usuario: str = None, sucursal: str = None,
+                           actividad: str = None) -> Dict[str, Any]:
+    """
+    Desempeño por criterio de evaluación (Info_Correcta1..10 / Puntos1..10) para un
+    usuario, una sucursal y/o una actividad, comparado con el promedio global:
+    promedio de puntos, tasa de respuestas correctas y criterio más fallado/acertado.
+    """
+    try:
+        matrix = criterion_matrix(raw_data)
+        rows = np.ones(len(raw_data), dtype=bool)
+        filtros = {}
+        if usuario:
+            rows &= _user_mask(raw_data, usuario)
+            filtros["usuario"] = usuario
+        if sucursal:
+            rows &= value_mask(raw_data['Sucursal'], sucursal)
+            filtros["sucursal"] = sucursal
+        if actividad:
+            rows &= value_mask(raw_data['Actividad_Nombre'], actividad)
+            filtros["actividad"] = actividad
+
+        total = int(rows.sum())
+        if total == 0:
+            descripcion = ", ".join(f"{k} {v}" for k, v in filtros.items()) or "los filtros indicados"
+            return {"message": f"No se encontraron actividades para {descripcion}", "data": None}
+
+        subset = matrix.summary(rows)
+        overall = matrix.summary()
+        criterios: List[Dict[str, Any]] = []
+        sin_datos = []
+        for j, i in enumerate(CRITERIA):
+            if subset["count"][j] == 0:
+                sin_datos.append(i)
+                continue
+            tasa = subset["correct_rate"][j]
+            criterios.append({
+                "criterio": i,
+                "evaluaciones": int(subset["count"][j]),
+                "promedio_puntos": _round(subset["mean_points"][j]),
+                "tasa_correcta": _round(tasa * 100, 1),
+                "tasa_fallo": _round((1 - tasa) * 100, 1),
+                "promedio_puntos_global": _round(overall["mean_points"][j]),
+                "tasa_correcta_global": _round(overall["correct_rate"][j] * 100, 1),
+                "diferencia_puntos_vs_global": _round(subset["mean_points"][j] - overall["mean_points"][j]),
+            })
+
+        if not criterios:
+            return {"message": "Las actividades encontradas no tienen criterios evaluados", "data": None}
+
+        # Más fallado: mayor tasa de fallo; a igualdad, menor promedio de puntos
+        con_tasa = [c for c in criterios if c["tasa_fallo"] is not None]
+        ordenados = sorted(con_tasa or criterios,
+                           key=lambda c: (c["tasa_fallo"] or 0, -(c["promedio_puntos"] or 0)))
+        return {
+            "message": f"Análisis por criterio de {total} actividades",
+            "data": {
+                "filtros": filtros,
+                "total_actividades": total,
+                "criterios": criterios,
+                "criterio_mas_fallado": ordenados[-1],
+                "criterio_mas_acertado": ordenados[0],
+                "criterios_sin_datos": sin_datos,
+            }
+        }
+    except Exception as e:
+        return handle_error(e, "get_criterion_analysis")
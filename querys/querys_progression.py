@@ -0,0 +1,264 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from querys.querys_Fact_RolPlay_Sim import frame_cache, handle_error, value_mask
+from core.date_parsing import in_date_range, resolve_date_range
+
+# Las semanas cierran el domingo (pd.Grouper(freq='W')); se numeran desde un domingo
+WEEK_EPOCH = pd.Timestamp("1970-01-04")
+# Columna semanal de cada métrica de progresión
+METRIC_COLUMNS = {"calificacion": "calif_mean", "puntos": "puntos"}
+MIN_ACTIVITIES = 3
+
+
+class ProgressionEngine:
+    """
+    Progresión semanal de todos los usuarios a la vez:
+    - Serie semanal por usuario (promedio y máximo de calificación, actividades, puntos),
+      de su primera a su última semana, con las semanas sin actividad incluidas.
+    - Pendiente por mínimos cuadrados de cada métrica sobre el índice de semana. Las
+      semanas sin calificación no participan (antes anulaban la pendiente); en puntos
+      cuentan como 0.
+    - Mejora porcentual entre la primera y la última semana y estadísticas del último
+      mes (desde un mes antes de la última actividad del usuario).
+    Todo se calcula con agrupaciones y bincount sobre arreglos; consultar un usuario
+    es indexar posiciones. `keys` agrupa las filas (por defecto, la columna Usuario).
+    """
+
+    def __init__(self, df: pd.DataFrame, keys: pd.Series = None):
+        keys = df['Usuario'] if keys is None else keys
+        known = keys.notna().to_numpy()
+        codes, self.keys = pd.factorize(keys[known], sort=False)
+        users = len(self.keys)
+        fecha = pd.to_datetime(df['Fecha_y_Hora'])[known]
+        calif = pd.to_numeric(df['Calificacion'], errors="coerce")[known].to_numpy(dtype=np.float64)
+        puntos = pd.to_numeric(df['Puntos_Totales'], errors="coerce")[known].to_numpy(dtype=np.float64)
+        self.rows = np.bincount(codes, minlength=users)
+
+        # Identidad mostrada: primera fila en orden cronológico (sin fecha al final)
+        order = np.argsort(fecha.to_numpy(), kind="stable")
+        first_row = np.full(users, -1)
+        first_row[codes[order][::-1]] = order[::-1]
+        self.usuario = df['Usuario'][known].to_numpy()[first_row]
+        self.nombre = df['Usuario Nombre'][known].to_numpy()[first_row]
+
+        dated = fecha.notna().to_numpy()
+        fecha, codes_d = fecha[dated], codes[dated]
+        calif_d, puntos_d = calif[dated], puntos[dated]
+        day = fecha.dt.normalize()
+        week = ((day + pd.to_timedelta(6 - fecha.dt.weekday, unit="D") - WEEK_EPOCH).dt.days // 7).to_numpy()
+
+        weekly = pd.DataFrame({"code": codes_d, "week": week, "calif": calif_d, "puntos": puntos_d}) \
+            .groupby(["code", "week"], sort=True) \
+            .agg(calif_mean=("calif", "mean"), calif_max=("calif", "max"),
+                 actividades=("calif", "count"), puntos=("puntos", "sum")) \
+            .round(2).reset_index()
+
+        # Rejilla densa: cada usuario con fecha ocupa [offset, offset + semanas)
+        w_code = weekly["code"].to_numpy()
+        w_week = weekly["week"].to_numpy()
+        span = weekly.groupby("code")["week"].agg(["min", "max"]).reindex(range(users))
+        self.first_week = span["min"].fillna(0).to_numpy(dtype=np.int64)
+        self.weeks = (span["max"] - span["min"] + 1).fillna(0).to_numpy(dtype=np.int64)
+        self.offset = np.cumsum(self.weeks) - self.weeks
+        total = int(self.weeks.sum())
+        grid_code = np.repeat(np.arange(users), self.weeks)
+        self.grid_x = np.arange(total) - self.offset[grid_code]
+        self.grid_week = self.first_week[grid_code] + self.grid_x
+        position = self.offset[w_code] + (w_week - self.first_week[w_code])
+        self.grid = {
+            "calif_mean": np.full(total, np.nan),
+            "calif_max": np.full(total, np.nan),
+            "actividades": np.zeros(total),
+            "puntos": np.zeros(total),
+        }
+        for column, values in self.grid.items():
+            values[position] = weekly[column].to_numpy(dtype=np.float64)
+
+        self.slope = {column: self._slopes(grid_code, users, self.grid_x, self.grid[column])
+                      for column in METRIC_COLUMNS.values()}
+
+        # Último mes de cada usuario
+        latest = pd.Series(fecha.to_numpy()).groupby(codes_d).max().reindex(range(users))
+        cutoff = latest - pd.DateOffset(months=1)
+        in_month = fecha.to_numpy() >= cutoff.to_numpy()[codes_d]
+        month = pd.DataFrame({"code": codes_d[in_month], "calif": calif_d[in_month]}).groupby("code")["calif"] \
+            .agg(["size", "max", "min"]).reindex(range(users))
+        self.latest = latest.to_numpy()
+        self.cutoff = cutoff.to_numpy()
+        self.month = {column: month[column].to_numpy() for column in month.columns}
+        # Suma acumulada en el orden de las filas, como Series.mean en la versión por usuario
+        # (el promedio de groupby compensa la suma y puede redondear distinto en x.xx5)
+        month_sum = np.bincount(codes_d[in_month], np.nan_to_num(calif_d[in_month]), minlength=users)
+        month_count = np.bincount(codes_d[in_month], ~np.isnan(calif_d[in_month]), minlength=users)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.month["mean"] = month_sum / month_count
+
+    @staticmethod
+    def _slopes(codes: np.ndarray, users: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Pendiente de mínimos cuadrados por grupo ignorando NaN; 0 con menos de dos puntos."""
+        present = ~np.isnan(y)
+        x = np.where(present, x, 0.0)
+        y = np.where(present, y, 0.0)
+        n = np.bincount(codes, present, minlength=users)
+        sum_x = np.bincount(codes, x, minlength=users)
+        sum_y = np.bincount(codes, y, minlength=users)
+        sum_xy = np.bincount(codes, x * y, minlength=users)
+        sum_x2 = np.bincount(codes, x * x, minlength=users)
+        denominator = n * sum_x2 - sum_x ** 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (n * sum_xy - sum_x * sum_y) / denominator
+        return np.where(denominator != 0, slope, 0.0)
+
+    def index_of(self, key: Any) -> Optional[int]:
+        matches = np.flatnonzero(self.keys == key)
+        return int(matches[0]) if len(matches) else None
+
+    def metric_summary(self, metric_col: str) -> Dict[str, np.ndarray]:
+        """Pendiente, primera/última semana y mejora porcentual de todos los usuarios."""
+        has_weeks = self.weeks > 0
+        start = np.where(has_weeks, self.offset, 0)
+        end = np.where(has_weeks, self.offset + self.weeks - 1, 0)
+        values = self.grid[metric_col]
+        first = np.where(has_weeks, values[start] if len(values) else np.nan, np.nan)
+        last = np.where(has_weeks, values[end] if len(values) else np.nan, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            improvement = np.where(first != 0, (last / first - 1) * 100, 0.0)
+        return {"slope": self.slope[metric_col], "first": first, "last": last, "improvement": improvement}
+
+    def progression(self, index: int, metric_col: str) -> Dict[str, Any]:
+        """Bloque "progresion" de get_user_progression para un usuario."""
+        summary = self.metric_summary(metric_col)
+        slope = float(summary["slope"][index])
+        progreso = {
+            "tendencia": "positiva" if slope > 0 else "negativa",
+            "velocidad": "rápida" if abs(slope) > 2 else "moderada" if abs(slope) > 0.5 else "lenta",
+            "valor_pendiente": slope,
+            "primera_semana": float(summary["first"][index]),
+            "ultima_semana": float(summary["last"][index]),
+            "mejora_porcentual": float(summary["improvement"][index])
+        }
+        if not np.isnan(self.month["size"][index]):
+            progreso["ultimo_mes"] = {
+                "actividades": int(self.month["size"][index]),
+                "promedio": float(np.round(self.month["mean"][index], 2)),
+                "mejor": float(self.month["max"][index]),
+                "peor": float(self.month["min"][index]),
+                "fecha_inicio": pd.Timestamp(self.cutoff[index]).strftime('%d/%m/%y'),
+                "fecha_fin": pd.Timestamp(self.latest[index]).strftime('%d/%m/%y')
+            }
+        return progreso
+
+    def weekly(self, index: int) -> List[Dict[str, Any]]:
+        start, stop = self.offset[index], self.offset[index] + self.weeks[index]
+        return [{
+            "semana": (WEEK_EPOCH + pd.Timedelta(weeks=int(week))).strftime('%d/%m/%y'),
+            "promedio": float(mean),
+            "maximo": float(maximum),
+            "actividades": int(count),
+            "puntos": float(points)
+        } for week, mean, maximum, count, points in zip(
+            self.grid_week[start:stop], self.grid["calif_mean"][start:stop], self.grid["calif_max"][start:stop],
+            self.grid["actividades"][start:stop], self.grid["puntos"][start:stop]
+        )]
+
+
+def progression_engine(raw_data: pd.DataFrame) -> ProgressionEngine:
+    """Motor de progresión del dataset completo, construido en el primer uso y reutilizado."""
+    return frame_cache(raw_data, "progresion", ProgressionEngine)
+
+
+def user_progression(raw_data: pd.DataFrame, user_mask: np.ndarray, metrica: str) -> Dict[str, Any]:
+    """
+    Progresión de las filas de un usuario. Si coinciden con un único usuario se
+    consulta el motor del dataset; si la búsqueda abarca varios (p. ej. texto parcial)
+    se analizan juntas, como una sola serie.
+    """
+    user_rows = raw_data[user_mask]
+    metric_col = METRIC_COLUMNS.get(metrica, "calif_mean")
+    distinct = user_rows['Usuario'].dropna().unique()
+    engine = progression_engine(raw_data) if len(distinct) == 1 else None
+    index = engine.index_of(distinct[0]) if engine is not None else None
+    if index is None or engine.rows[index] != len(user_rows):
+        engine = ProgressionEngine(user_rows, pd.Series(0, index=user_rows.index))
+        index = 0
+    return {
+        "message": f"Análisis de progresión para {engine.nombre[index]}",
+        "data": {
+            "usuario": engine.usuario[index],
+            "nombre": engine.nombre[index],
+            "progresion": engine.progression(index, metric_col),
+            "metrica_analizada": metrica,
+            "datos_semanales": engine.weekly(index)
+        }
+    }
+
+
+def get_most_improved(raw_data: pd.DataFrame, n: int = 10, metrica: str = 'calificacion', sucursal: str = None,
+                      actividad: str = None, periodo: str = None, order: str = "desc",
+                      min_actividades: int = MIN_ACTIVITIES) -> Dict[str, Any]:
+    """
+    Ranking de los usuarios que más mejoraron (order="asc": los que más empeoraron),
+    por la pendiente semanal de la métrica. Con `periodo` (p. ej. "los últimos 3 meses",
+    "este mes") solo cuentan las actividades de ese rango. Requiere al menos
+    `min_actividades` actividades y dos semanas con datos por usuario.
+    """
+    try:
+        metric_col = METRIC_COLUMNS.get(metrica or 'calificacion')
+        if metric_col is None:
+            raise ValueError(f"Métrica no soportada: {metrica}. Usa 'calificacion' o 'puntos'")
+        n = int(n or 10)
+
+        filtros = {}
+        mask = np.ones(len(raw_data), dtype=bool)
+        if sucursal:
+            mask &= value_mask(raw_data['Sucursal'], sucursal)
+            filtros["sucursal"] = sucursal
+        if actividad:
+            mask &= value_mask(raw_data['Actividad_Nombre'], actividad)
+            filtros["actividad"] = actividad
+        if periodo:
+            rango = resolve_date_range(periodo, raw_data)
+            mask &= in_date_range(pd.to_datetime(raw_data['Fecha_y_Hora']), rango).to_numpy()
+            filtros["periodo"] = f"{rango[0].strftime('%d/%m/%y')} - {rango[1].strftime('%d/%m/%y')}"
+
+        # Sin filtros se usa el motor del dataset (ya calculado); con filtros, uno del subconjunto
+        engine = progression_engine(raw_data) if mask.all() else ProgressionEngine(raw_data[mask])
+        summary = engine.metric_summary(metric_col)
+        weeks_with_data = np.bincount(
+            np.repeat(np.arange(len(engine.keys)), engine.weeks),
+            ~np.isnan(engine.grid[metric_col]), minlength=len(engine.keys)
+        ) if len(engine.keys) else np.zeros(0)
+        eligible = np.flatnonzero((engine.rows >= min_actividades) & (weeks_with_data >= 2))
+        if len(eligible) == 0:
+            return {"message": f"No hay usuarios con al menos {min_actividades} actividades en dos semanas distintas"
+                               + (f" para {filtros}" if filtros else ""), "data": None}
+
+        slopes = summary["slope"][eligible]
+        ranked = eligible[np.argsort(slopes if order == "asc" else -slopes, kind="stable")][:n]
+        ranking = [{
+            "posicion": position,
+            "usuario": engine.usuario[i],
+            "nombre": engine.nombre[i],
+            "pendiente_semanal": round(float(summary["slope"][i]), 3),
+            "primera_semana": float(summary["first"][i]),
+            "ultima_semana": float(summary["last"][i]),
+            "mejora_porcentual": round(float(summary["improvement"][i]), 2),
+            "actividades": int(engine.rows[i]),
+            "semanas": int(engine.weeks[i])
+        } for position, i in enumerate(ranked, start=1)]
+        return {
+            "message": f"Usuarios que más {'empeoraron' if order == 'asc' else 'mejoraron'} "
+                       f"({len(eligible)} usuarios evaluados)",
+            "data": {
+                "ranking": ranking,
+                "metrica": metrica or 'calificacion',
+                "filtros": filtros,
+                "usuarios_evaluados": int(len(eligible)),
+                "pendiente_promedio": round(float(np.mean(summary["slope"][eligible])), 3)
+            }
+        }
+    except Exception as e:
+        return handle_error(e, "get_most_improved")
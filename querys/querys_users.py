@@ -1,5 +1,6 @@
 # querys_users.py
 
+import numpy as np
 import pandas as pd
 import traceback
 import re
@@ -7,7 +8,9 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 
 from core.config import FACT_FILE_PATH, DEBUG_MODE, log_config
-from querys.querys_Fact_RolPlay_Sim import last_context, update_context, get_last_context, handle_error, parse_flexible_date
+from querys.querys_Fact_RolPlay_Sim import update_context, get_last_context, handle_error, parse_flexible_date, value_mask
+from core.date_parsing import in_date_range, relative_range_in
+from querys.querys_progression import MIN_ACTIVITIES, user_progression
 
 def get_user_activity_history(raw_data: pd.DataFrame, usuario: str) -> Dict[str, Any]:
     try:
@@ -104,19 +107,18 @@ def get_user_activity_history(raw_data: pd.DataFrame, usuario: str) -> Dict[str,
         return handle_error(e, "get_user_activity_history")
     
 def get_user_progression(raw_data: pd.DataFrame, usuario: str, metrica: str = 'calificacion') -> Dict[str, Any]:
-    """Analiza la progresión de un usuario a lo largo del tiempo"""
+    """
+    Analiza la progresión de un usuario a lo largo del tiempo. La serie semanal, la
+    pendiente y el último mes salen del motor de progresión del dataset
+    (querys/querys_progression.py), que calcula todos los usuarios de una vez.
+    """
     try:
-        # Agregar prints para depuración
-        print(f"DEBUG: get_user_progression iniciando con usuario={usuario}, metrica={metrica}")
-        
         # Validar parámetros de entrada
         if usuario is None:
-            print("DEBUG: Error - usuario es None")
             return {"message": "Se requiere especificar un usuario para analizar su progresión", "data": None}
             
         # Asegurar que metrica siempre tenga un valor válido
         if metrica is None:
-            print("DEBUG: metrica es None, usando valor predeterminado 'calificacion'")
             metrica = 'calificacion'
         
         # Mejora en la búsqueda de usuario por número
@@ -125,132 +127,19 @@ def get_user_progression(raw_data: pd.DataFrame, usuario: str, metrica: str = 'c
             usuario_pattern = f"Representante {usuario}$"  # $ asegura que coincida con el final
             mask = raw_data['Usuario Nombre'].str.match(usuario_pattern, case=False, na=False) | \
                    (raw_data['Usuario'] == f"user{usuario}")
-            print(f"DEBUG: Búsqueda por número: usuario={usuario}, patrón={usuario_pattern}")
         else:
             # Para otros patrones, usar contains
-            mask = (raw_data['Usuario'].astype(str).str.contains(usuario, case=False, na=False)) | \
-                   (raw_data['Usuario Nombre'].str.contains(usuario, case=False, na=False))
-            print(f"DEBUG: Búsqueda por texto: usuario={usuario}")
-        
-        user_data = raw_data[mask].sort_values('Fecha_y_Hora')
-        print(f"DEBUG: Encontradas {len(user_data)} actividades para el usuario")
-        
-        # Imprimir para depuración
-        if len(user_data) > 0:
-            print(f"DEBUG: Usuario encontrado: {user_data['Usuario Nombre'].iloc[0]}")
+            mask = value_mask(raw_data['Usuario'], usuario, exact_first=False) | \
+                   value_mask(raw_data['Usuario Nombre'], usuario, exact_first=False)
         
-        if len(user_data) == 0:
+        actividades = int(mask.sum())
+        if actividades == 0:
             return {"message": f"No se encontró al usuario {usuario}", "data": None}
         
-        if len(user_data) < 3:
-            return {"message": f"Datos insuficientes para analizar progresión. Se requieren al menos 3 actividades, pero el usuario {usuario} solo tiene {len(user_data)}.", "data": None}
-            
-        # Preparar series temporal
-        user_data['fecha'] = pd.to_datetime(user_data['Fecha_y_Hora'])
-        
-        # Agrupar por semana
-        weekly_data = user_data.groupby(pd.Grouper(key='fecha', freq='W')).agg({
-            'Calificacion': ['mean', 'max', 'count'],
-            'Puntos_Totales': 'sum'
-        }).round(2)
-        
-        weekly_data.columns = ['calif_mean', 'calif_max', 'actividades', 'puntos']
-        weekly_data = weekly_data.reset_index()
-        print(f"DEBUG: Datos semanales agrupados: {len(weekly_data)} semanas")
-        
-        # Calcular métrica de progresión
-        if metrica == 'calificacion':
-            metric_col = 'calif_mean'
-        elif metrica == 'puntos':
-            metric_col = 'puntos'
-        else:
-            print(f"DEBUG: Métrica '{metrica}' no reconocida, usando 'calificacion' como predeterminada")
-            metric_col = 'calif_mean'
-            
-        print(f"DEBUG: Usando métrica: {metrica} (columna: {metric_col})")
-            
-        # Calcular tendencia (regresión lineal simple)
-        x_vals = list(range(len(weekly_data)))  # Convertir a lista en lugar de range
-        y_vals = weekly_data[metric_col].values.tolist()  # Convertir a lista también
-        
-        print(f"DEBUG: Valores para regresión: x={x_vals}, y={y_vals}")
-        
-        if len(x_vals) < 2:
-            slope = 0
-            print("DEBUG: No hay suficientes puntos para calcular la pendiente")
-        else:
-            # Calcular pendiente (m en y = mx + b) con valores explícitos para evitar problemas de tipo
-            n = len(x_vals)
-            # Calcular los productos y sumas manualmente
-            x_times_y = sum(x_vals[i] * y_vals[i] for i in range(n))
-            sum_x = sum(x_vals)
-            sum_y = sum(y_vals)
-            sum_x_squared = sum(x**2 for x in x_vals)
-            
-            print(f"DEBUG: Cálculos para pendiente: n={n}, x_times_y={x_times_y}, sum_x={sum_x}, sum_y={sum_y}, sum_x_squared={sum_x_squared}")
-            
-            # Aplicar la fórmula de la pendiente
-            if (n * sum_x_squared - sum_x**2) != 0:  # Evitar división por cero
-                slope = (n * x_times_y - sum_x * sum_y) / (n * sum_x_squared - sum_x**2)
-                print(f"DEBUG: Pendiente calculada: {slope}")
-            else:
-                slope = 0
-                print("DEBUG: Denominador es cero, usando pendiente=0")
-        
-        # Evitar división por cero en mejora porcentual
-        mejora_porcentual = 0.0
-        if weekly_data[metric_col].iloc[0] != 0:
-            mejora_porcentual = float(((weekly_data[metric_col].iloc[-1] / weekly_data[metric_col].iloc[0]) - 1) * 100)
-            print(f"DEBUG: Mejora porcentual calculada: {mejora_porcentual}%")
-        else:
-            print("DEBUG: Primera semana en 0, no se puede calcular mejora porcentual")
-            
-        progreso = {
-            "tendencia": "positiva" if slope > 0 else "negativa",
-            "velocidad": "rápida" if abs(slope) > 2 else "moderada" if abs(slope) > 0.5 else "lenta",
-            "valor_pendiente": float(slope),
-            "primera_semana": float(weekly_data[metric_col].iloc[0]),
-            "ultima_semana": float(weekly_data[metric_col].iloc[-1]),
-            "mejora_porcentual": mejora_porcentual
-        }
-        
-        # Filtrar por último mes si es posible
-        current_date = pd.to_datetime(user_data['fecha'].max())
-        one_month_ago = current_date - pd.DateOffset(months=1)
-        
-        last_month_data = user_data[user_data['fecha'] >= one_month_ago]
-        
-        has_last_month_data = len(last_month_data) > 0
-        print(f"DEBUG: Datos del último mes: {len(last_month_data)} actividades")
-        
-        # Agrega información específica del último mes
-        if has_last_month_data:
-            progreso["ultimo_mes"] = {
-                "actividades": len(last_month_data),
-                "promedio": float(last_month_data['Calificacion'].mean().round(2)),
-                "mejor": float(last_month_data['Calificacion'].max()),
-                "peor": float(last_month_data['Calificacion'].min()),
-                "fecha_inicio": one_month_ago.strftime('%d/%m/%y'),
-                "fecha_fin": current_date.strftime('%d/%m/%y')
-            }
-        
-        print("DEBUG: Análisis completado exitosamente")
-        return {
-            "message": f"Análisis de progresión para {user_data.iloc[0]['Usuario Nombre']}",
-            "data": {
-                "usuario": user_data.iloc[0]['Usuario'],
-                "nombre": user_data.iloc[0]['Usuario Nombre'],
-                "progresion": progreso,
-                "metrica_analizada": metrica,  # Añadido para claridad
-                "datos_semanales": [{
-                    "semana": row['fecha'].strftime('%d/%m/%y'),
-                    "promedio": float(row['calif_mean']),
-                    "maximo": float(row['calif_max']),
-                    "actividades": int(row['actividades']),
-                    "puntos": float(row['puntos'])
-                } for _, row in weekly_data.iterrows()]
-            }
-        }
+        if actividades < MIN_ACTIVITIES:
+            return {"message": f"Datos insuficientes para analizar progresión. Se requieren al menos 3 actividades, pero el usuario {usuario} solo tiene {actividades}.", "data": None}
+
+        return user_progression(raw_data, np.asarray(mask), metrica)
     except Exception as e:
         print(f"ERROR en get_user_progression: {str(e)}")
         traceback.print_exc()
@@ -633,13 +522,19 @@ def advanced_search(raw_data: pd.DataFrame, filtros: Dict[str, Any]) -> Dict[str
             filtros_aplicados['actividad'] = filtros['actividad']
             
         # Procesar fecha
+        # (una fecha relativa cuenta desde su primer día / hasta el final de su último día)
         if 'fecha_inicio' in filtros and filtros['fecha_inicio']:
-            fecha_inicio = parse_flexible_date(filtros['fecha_inicio'])
+            rango = relative_range_in(raw_data, filtros['fecha_inicio'])
+            fecha_inicio = rango[0] if rango else parse_flexible_date(filtros['fecha_inicio'])
             data = data[pd.to_datetime(data['Fecha_y_Hora']) >= fecha_inicio]
             filtros_aplicados['fecha_inicio'] = fecha_inicio.strftime('%d/%m/%Y')
             
         if 'fecha_fin' in filtros and filtros['fecha_fin']:
-            fecha_fin = parse_flexible_date(filtros['fecha_fin'])
+            rango = relative_range_in(raw_data, filtros['fecha_fin'])
+            if rango:
+                fecha_fin = rango[1] + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+            else:
+                fecha_fin = parse_flexible_date(filtros['fecha_fin'])
             data = data[pd.to_datetime(data['Fecha_y_Hora']) <= fecha_fin]
             filtros_aplicados['fecha_fin'] = fecha_fin.strftime('%d/%m/%Y')
             
@@ -746,8 +641,12 @@ def get_general_stats(raw_data: pd.DataFrame) -> Dict[str, Any]:
     
 def get_exact_activity_result(raw_data: pd.DataFrame, fecha: str, actividad: str = None) -> Dict[str, Any]:
     try:
+        # Expresiones relativas ("ayer", "la semana pasada", "hace 3 días"), contadas
+        # desde la fecha más reciente del dataset
+        rango = relative_range_in(raw_data, fecha)
+
         # Manejar casos especiales de fechas relativas
-        if fecha and isinstance(fecha, str):
+        if rango is None and fecha and isinstance(fecha, str):
             fecha_lower = fecha.lower()
             
             # Manejar caso de "primera" fecha
@@ -776,7 +675,6 @@ def get_exact_activity_result(raw_data: pd.DataFrame, fecha: str, actividad: str
                     "sucursal": str(result['Sucursal'].iloc[0])
                 }]
                 
-                update_context("specific_date", fecha=fecha, actividad=actividad)
                 return {
                     "message": f"Primera actividad encontrada ({actividades[0]['fecha']})",
                     "data": actividades[0]
@@ -808,27 +706,31 @@ def get_exact_activity_result(raw_data: pd.DataFrame, fecha: str, actividad: str
                     "sucursal": str(result['Sucursal'].iloc[0])
                 }]
                 
-                update_context("specific_date", fecha=fecha, actividad=actividad)
                 return {
                     "message": f"Última actividad encontrada ({actividades[0]['fecha']})",
                     "data": actividades[0]
                 }
         
-        # Comportamiento original para fechas específicas
-        fecha_dt = parse_flexible_date(fecha)
-        if fecha_dt.hour == 0 and fecha_dt.minute == 0:
-            mask = pd.to_datetime(raw_data['Fecha_y_Hora']).dt.date == fecha_dt.date()
+        if rango is not None:
+            mask = in_date_range(pd.to_datetime(raw_data['Fecha_y_Hora']), rango)
+            descripcion = rango[0].strftime('%d/%m/%y') if rango[0] == rango[1] else \
+                f"{rango[0].strftime('%d/%m/%y')} - {rango[1].strftime('%d/%m/%y')}"
         else:
-            fecha_inicio = fecha_dt - timedelta(minutes=5)
-            fecha_fin = fecha_dt + timedelta(minutes=5)
-            mask = (pd.to_datetime(raw_data['Fecha_y_Hora']) >= fecha_inicio) & \
-                   (pd.to_datetime(raw_data['Fecha_y_Hora']) <= fecha_fin)
+            # Comportamiento original para fechas específicas
+            fecha_dt = parse_flexible_date(fecha)
+            if fecha_dt.hour == 0 and fecha_dt.minute == 0:
+                mask = pd.to_datetime(raw_data['Fecha_y_Hora']).dt.date == fecha_dt.date()
+            else:
+                fecha_inicio = fecha_dt - timedelta(minutes=5)
+                fecha_fin = fecha_dt + timedelta(minutes=5)
+                mask = (pd.to_datetime(raw_data['Fecha_y_Hora']) >= fecha_inicio) & \
+                       (pd.to_datetime(raw_data['Fecha_y_Hora']) <= fecha_fin)
+            descripcion = fecha_dt.strftime('%d/%m/%y %H:%M')
         if actividad:
             mask &= raw_data['Actividad_Nombre'].str.contains(actividad, case=False, na=False)
         result = raw_data[mask]
         if len(result) == 0:
-            update_context("specific_date", fecha=fecha, actividad=actividad)
-            return {"message": f"No se encontraron actividades para {fecha_dt.strftime('%d/%m/%y %H:%M')}", "data": None}
+            return {"message": f"No se encontraron actividades para {descripcion}", "data": None}
         actividades = [{
             "hora": pd.to_datetime(row['Fecha_y_Hora']).strftime('%H:%M'),
             "actividad": row['Actividad_Nombre'],
@@ -856,7 +758,6 @@ def get_exact_activity_result(raw_data: pd.DataFrame, fecha: str, actividad: str
                 "message": "Actividad encontrada",
                 "data": actividades[0]
             }
-        update_context("specific_date", fecha=fecha, actividad=actividad)
         return response_data
     except Exception as e:
         return handle_error(e, "get_exact_activity_result")
\ No newline at end of file
@@ -1,10 +1,13 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import gc
 import hashlib
 import json
 import os
+import threading
+import time
 import traceback
 from llama_index.core import (
     VectorStoreIndex,
@@ -13,21 +16,178 @@ from llama_index.core import (
     StorageContext,
     load_index_from_storage
 )
+from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
 from llama_index.llms.openai import OpenAI
 from llama_index.embeddings.openai import OpenAIEmbedding
 
+from core.config import (
+    OPENAI_TIMEOUT,
+    OPENAI_BASE_URL,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_CONCURRENCY,
+    EMBED_REQUESTS_PER_MINUTE,
+    EMBED_TOKENS_PER_MINUTE,
+    VECTOR_STORE_DTYPE,
+    VECTOR_STORE_IVF_MIN_SIZE,
+    VECTOR_STORE_NPROBE,
+    RAG_SUMMARY_TOP_K,
+    RAG_CHILDREN_PER_SUMMARY,
+    RAG_MAX_CHILDREN,
+    RAG_MAX_CHILD_IDS,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD
+)
+from core.admission import STAGE_RAG
+from core.embedding_pipeline import EmbeddingBuildPipeline
+from core.hierarchical_retriever import CHILD_IDS_KEY, HierarchicalRetriever
+from core.gazetteer import Gazetteer
+from core.fingerprint import (
+    changed_row_ranges,
+    compute_fingerprint,
+    file_signature,
+    same_file_signature
+)
+from core.metrics import CACHE_EVENTS, time_stage
+from core.mmap_vector_store import MmapVectorStore
+from core.resilience import MIN_CALL_SECONDS, Deadline, ProviderUnavailable, call_llm
+from core.semantic_cache import SemanticCache
+from core.tracing import add_trace_counter, set_span_attributes
+from querys.querys_criteria import CRITERIA, criterion_matrix
+
+# Formato de los documentos indexados; si cambia, el índice se reconstruye
+INDEX_LAYOUT = "jerarquico-1"
+
+# Valores por defecto de un TextNode, tomados una vez de un nodo validado
+_TEXT_NODE_DEFAULTS = dict(TextNode(id_="plantilla", text="").__dict__)
+_ACTIVITY_NODE_FIELDS = frozenset({"id_", "text", "metadata"})
+
+
+def _with_timeout(model, timeout: float):
+    """
+    Copia de un LLM o modelo de embeddings de llama-index (OpenAI) con otro timeout
+    por llamada. El cliente sale de with_options: comparte el pool de conexiones
+    del original. Modelos sin cliente OpenAI (p. ej. embeddings locales) se usan tal cual.
+    """
+    if not hasattr(model, "_get_client") or not hasattr(model, "timeout"):
+        return model
+    clone = model.model_copy(update={"timeout": timeout})
+    clone._client = model._get_client().with_options(timeout=timeout)
+    clone._aclient = None
+    return clone
+
+
+def _activity_node(node_id: str, text: str, metadata: Dict[str, Any]) -> TextNode:
+    """
+    TextNode de detalle de actividad sin validación de pydantic (una por fila es
+    el costo dominante con datasets grandes; model_construct es aún más lento porque
+    inspecciona las default_factory en cada llamada). id, texto y metadata ya vienen
+    con sus tipos; los contenedores mutables son nuevos para cada nodo.
+    """
+    node = TextNode.__new__(TextNode)
+    object.__setattr__(node, "__dict__", {
+        **_TEXT_NODE_DEFAULTS,
+        "id_": node_id,
+        "text": text,
+        "metadata": metadata,
+        "excluded_embed_metadata_keys": [],
+        "excluded_llm_metadata_keys": [],
+        "relationships": {},
+    })
+    object.__setattr__(node, "__pydantic_fields_set__", set(_ACTIVITY_NODE_FIELDS))
+    object.__setattr__(node, "__pydantic_extra__", None)
+    object.__setattr__(node, "__pydantic_private__", None)
+    return node
+
 class RolPlayRAG:
     def __init__(self, persist_dir: str = "./storage"):
         self.persist_dir = persist_dir
         self.raw_data = None
+        # Entidades conocidas del dataset para extraer parámetros del texto libre
+        self.gazetteer = None
         self.metadata_path = os.path.join(persist_dir, "index_metadata.json")
+        self.embedding_checkpoint_path = os.path.join(persist_dir, "embedding_checkpoint.jsonl")
+        self.changed_row_ranges = []
+        # Versión de los datos indexados (huella + formato); invalida la caché semántica
+        self.data_version = None
+        self.semantic_cache = SemanticCache(
+            max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+            threshold=SEMANTIC_CACHE_THRESHOLD
+        ) if SEMANTIC_CACHE_ENABLED else None
         os.makedirs(self.persist_dir, exist_ok=True)
         
-        self.llm = OpenAI(model="gpt-4", temperature=0.7)
+        # Sin reintentos internos: en consultas los controla call_llm dentro del
+        # presupuesto de la solicitud, y en la construcción EmbeddingBuildPipeline
+        self.llm = OpenAI(model="gpt-4", temperature=0.7, api_base=OPENAI_BASE_URL,
+                          timeout=OPENAI_TIMEOUT, max_retries=0)
         Settings.llm = self.llm
-        Settings.embed_model = OpenAIEmbedding()
+        Settings.embed_model = OpenAIEmbedding(
+            embed_batch_size=min(EMBED_BATCH_SIZE, 2048),
+            api_base=OPENAI_BASE_URL,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=0
+        )
         self.index = None
 
+        # Estado del arranque por etapas: los datos se cargan primero y el índice
+        # vectorial se construye/carga después (posiblemente en segundo plano).
+        self.index_status = "pending"
+        self.index_error = None
+        self.index_ready = threading.Event()
+        self._index_thread = None
+        self._index_started_at = None
+        self._index_seconds = None
+
+    def load_data(self, df: pd.DataFrame):
+        """Deja disponibles los datos crudos para los handlers estructurados (no requiere índice)."""
+        self.raw_data = df.copy()
+        self.gazetteer = Gazetteer.from_dataframe(self.raw_data)
+
+    def build_index_async(self, df: pd.DataFrame, rebuild: bool = False, source_path: str = None) -> threading.Thread:
+        """
+        Construye o carga el índice en un hilo de fondo. Mientras tanto, `raw_data`
+        ya está disponible y `index_ready` permanece sin marcar.
+        """
+        if self.raw_data is None:
+            self.load_data(df)
+
+        def _run():
+            try:
+                # El hilo trabaja sobre raw_data: no retiene el DataFrame recibido
+                self.build_index(self.raw_data, rebuild=rebuild, source_path=source_path)
+            except Exception:
+                # build_index ya registró el error y dejó index_status = "error"
+                pass
+
+        self._index_thread = threading.Thread(target=_run, name="rag-index-loader", daemon=True)
+        self._index_thread.start()
+        return self._index_thread
+
+    def readiness(self) -> Dict[str, Any]:
+        """Estado de cada componente, para los endpoints de salud."""
+        elapsed = self._index_seconds
+        if elapsed is None and self._index_started_at is not None:
+            elapsed = time.monotonic() - self._index_started_at
+        return {
+            "dataset": {
+                "status": "ready" if self.raw_data is not None else "pending",
+                "rows": int(len(self.raw_data)) if self.raw_data is not None else 0
+            },
+            "structured_handlers": {
+                "status": "ready" if self.raw_data is not None else "pending"
+            },
+            "rag_index": {
+                "status": self.index_status,
+                "error": self.index_error,
+                "seconds": round(elapsed, 2) if elapsed is not None else None
+            }
+        }
+
     def _convert_to_serializable(self, obj):
         """Convierte objetos a formatos serializables"""
         if isinstance(obj, (np.int8, np.int16, np.int32, np.int64)):
@@ -40,18 +200,28 @@ class RolPlayRAG:
             return obj.strftime('%Y-%m-%d %H:%M:%S')
         return obj
 
-    def _calculate_data_hash(self, df: pd.DataFrame) -> str:
-        """Calcula un hash del DataFrame para detectar cambios"""
-        # Convertimos el DataFrame a una representación consistente
-        df_string = df.to_json(orient='records', date_format='iso')
-        return hashlib.sha256(df_string.encode()).hexdigest()
+    def _calculate_fingerprint(self, df: pd.DataFrame, source_signature: Dict = None) -> Dict:
+        """
+        Huella del DataFrame para detectar cambios. Si el archivo fuente tiene el mismo
+        tamaño y mtime que cuando se guardó la metadata, se reutiliza la huella guardada
+        sin volver a hashear los datos.
+        """
+        metadata = self._load_metadata()
+        stored = metadata.get("fingerprint")
+        if stored and stored.get("rows") == len(df) and \
+           same_file_signature(metadata.get("source"), source_signature):
+            return stored
+        return compute_fingerprint(df)
 
-    def _save_metadata(self, data_hash: str):
+    def _save_metadata(self, fingerprint: Dict, source_signature: Dict = None):
         """Guarda metadata del índice"""
         metadata = {
-            "data_hash": data_hash,
+            "data_hash": fingerprint["data_hash"],
+            "fingerprint": fingerprint,
+            "source": source_signature,
+            "layout": INDEX_LAYOUT,
             "creation_date": datetime.now().isoformat(),
-            "version": "1.0"
+            "version": "2.0"
         }
         with open(self.metadata_path, 'w') as f:
             json.dump(metadata, f)
@@ -63,72 +233,167 @@ class RolPlayRAG:
                 return json.load(f)
         return {}
 
-    def _should_rebuild_index(self, current_hash: str) -> bool:
+    def _should_rebuild_index(self, fingerprint: Dict, source_signature: Dict = None) -> bool:
         """Determina si el índice debe ser reconstruido"""
         if not os.path.exists(os.path.join(self.persist_dir, "docstore.json")) or \
            not os.path.exists(os.path.join(self.persist_dir, "index_store.json")):
             return True
 
         metadata = self._load_metadata()
-        return metadata.get("data_hash", "") != current_hash
+        if metadata.get("layout") != INDEX_LAYOUT:
+            print(f"Formato de índice {metadata.get('layout', 'plano')} -> {INDEX_LAYOUT}: se reconstruye.")
+            return True
 
-    def _create_detailed_activity_document(self, activity_data: pd.DataFrame) -> Document:
-        """Crea un documento detallado para una actividad específica"""
-        first_row = activity_data.iloc[0]
-        
-        content = f"""
-        Actividad Específica:
-        Nombre: {first_row['Actividad_Nombre']}
-        Fecha y Hora: {first_row['Fecha_y_Hora']}
-        Caso de Uso: {first_row['Caso_de_Uso_Nombre']}
-        Calificación: {first_row['Calificacion']}
-        Puntos Totales: {first_row['Puntos_Totales']}
-        Usuario: {first_row['Usuario']} ({first_row['Usuario Nombre']})
-        Sucursal: {str(first_row['Sucursal'])}
-        
-        Detalles de Puntuación:
+        if metadata.get("data_hash", "") == fingerprint["data_hash"]:
+            if not same_file_signature(metadata.get("source"), source_signature):
+                # Mismo contenido con otro mtime: se actualiza la firma para el próximo arranque
+                self._save_metadata(fingerprint, source_signature)
+            return False
+
+        self.changed_row_ranges = changed_row_ranges(metadata.get("fingerprint"), fingerprint)
+        print(f"Rangos de filas modificados: {self.changed_row_ranges}")
+        return True
+
+    def _create_activity_documents(self, df: pd.DataFrame) -> List[TextNode]:
         """
-        
-        for i in range(1, 11):
-            info_correcta = first_row.get(f'Info_Correcta{i}', 'No disponible')
-            puntos = first_row.get(f'Puntos{i}', 'No disponible')
-            if pd.notna(info_correcta) and pd.notna(puntos) and info_correcta != 'No aplica' and puntos != 'No aplica':
-                content += f"- Punto {i}: {info_correcta} (Puntos: {puntos})\n"
-        
-        metadata = {
-            "actividad": str(first_row['Actividad_Nombre']),
-            "fecha": str(first_row['Fecha_y_Hora']),
-            "usuario": str(first_row['Usuario']),
-            "sucursal": str(first_row['Sucursal']),
-            "calificacion": self._convert_to_serializable(first_row['Calificacion']),
-            "document_type": "activity_detail"
-        }
-        
-        return Document(text=content, metadata=metadata)
+        Crea los nodos de detalle de actividad para todas las filas a la vez.
+        Los textos se arman columna por columna (una sola concatenación vectorizada
+        por campo), en lugar de construir un DataFrame por fila.
+        Son TextNode (no Document) porque van directo a la docstore sin pasar por
+        el splitter, y el motor de consulta los expone como nodos fuente.
+        """
+        text_columns = {}
+
+        def as_text(column: str, default: str = 'No disponible') -> pd.Series:
+            if column not in text_columns:
+                if column in df.columns:
+                    # Se convierten a texto solo los valores distintos (los nulos incluidos,
+                    # como "nan"/"NaT") y se expanden con los códigos de factorize
+                    codes, uniques = pd.factorize(df[column], use_na_sentinel=False)
+                    text = pd.Series(uniques).astype(str).to_numpy(dtype=object)
+                    text_columns[column] = pd.Series(text[codes], index=df.index)
+                else:
+                    text_columns[column] = pd.Series(default, index=df.index)
+            return text_columns[column]
+
+        texts = (
+            "\n        Actividad Específica:\n        Nombre: " + as_text('Actividad_Nombre') +
+            "\n        Fecha y Hora: " + as_text('Fecha_y_Hora') +
+            "\n        Caso de Uso: " + as_text('Caso_de_Uso_Nombre') +
+            "\n        Calificación: " + as_text('Calificacion') +
+            "\n        Puntos Totales: " + as_text('Puntos_Totales') +
+            "\n        Usuario: " + as_text('Usuario') + " (" + as_text('Usuario Nombre') + ")" +
+            "\n        Sucursal: " + as_text('Sucursal') +
+            "\n        \n        Detalles de Puntuación:\n        "
+        )
+
+        # Detalle por criterio: solo los puntos con información y puntaje válidos
+        criterios = criterion_matrix(df)
+        for j, i in enumerate(CRITERIA):
+            info_col, puntos_col = f'Info_Correcta{i}', f'Puntos{i}'
+            valid = pd.Series(criterios.valid[:, j], index=df.index)
+            detail = f"- Punto {i}: " + as_text(info_col) + " (Puntos: " + as_text(puntos_col) + ")\n"
+            texts = texts + detail.where(valid, "")
+
+        metadata = [
+            {
+                "actividad": actividad,
+                "fecha": fecha,
+                "usuario": usuario,
+                "sucursal": sucursal,
+                "calificacion": calificacion,
+                "document_type": "activity_detail"
+            }
+            for actividad, fecha, usuario, sucursal, calificacion in zip(
+                as_text('Actividad_Nombre').tolist(),
+                as_text('Fecha_y_Hora').tolist(),
+                as_text('Usuario').tolist(),
+                as_text('Sucursal').tolist(),
+                df['Calificacion'].tolist()
+            )
+        ]
+        # IDs deterministas por posición: evitan generar un uuid por fila. El recolector
+        # se pausa mientras tanto: con millones de contenedores nuevos y ninguno
+        # liberado, sus pasadas por generación no recuperan nada y cuestan ~40%
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return [
+                _activity_node(f"actividad-{i}", text, meta)
+                for i, (text, meta) in enumerate(zip(texts.tolist(), metadata))
+            ]
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _summary_document(self, text: str, metadata: Dict, child_ids: List[str] = None) -> Document:
+        """
+        Documento de resumen (se indexa con embedding). Las actividades hijas quedan
+        referenciadas en metadata, fuera del texto de embedding y del prompt.
+        """
+        if child_ids:
+            metadata[CHILD_IDS_KEY] = child_ids
+        return Document(
+            text=text,
+            metadata=metadata,
+            excluded_embed_metadata_keys=[CHILD_IDS_KEY],
+            excluded_llm_metadata_keys=[CHILD_IDS_KEY]
+        )
+
+    def _children_by_group(self, df: pd.DataFrame, keys: List[pd.Series]) -> Dict[Any, List[str]]:
+        """
+        IDs de las actividades hijas de cada grupo, de la más reciente a la más antigua,
+        con un máximo de RAG_MAX_CHILD_IDS por grupo. Los grupos con clave nula se omiten.
+        """
+        key_columns = [f"clave_{i}" for i in range(len(keys))]
+        frame = pd.DataFrame({column: key.to_numpy() for column, key in zip(key_columns, keys)})
+        frame['fecha'] = df['Fecha_y_Hora'].to_numpy()
+        frame['posicion'] = np.arange(len(df))
+        recientes = (
+            frame.sort_values('fecha', ascending=False, na_position='last', kind='stable')
+            .groupby(key_columns, sort=False)
+            .head(RAG_MAX_CHILD_IDS)
+        )
+        grouping = key_columns[0] if len(key_columns) == 1 else key_columns
+        return (
+            recientes.groupby(grouping, sort=False)['posicion']
+            .agg(lambda posiciones: [f"actividad-{i}" for i in posiciones])
+            .to_dict()
+        )
+
+    def _create_user_documents(self, df: pd.DataFrame, children: Dict = None) -> List[Document]:
+        """Crea los resúmenes de usuario a partir de un único groupby"""
+        grouped = df.groupby('Usuario')
+        stats = grouped.agg(
+            total_actividades=('Calificacion', 'size'),
+            calificacion_promedio=('Calificacion', 'mean'),
+            puntos_totales=('Puntos_Totales', 'sum')
+        )
+        nombres = df.drop_duplicates('Usuario').set_index('Usuario')['Usuario Nombre']
+        # Sucursales distintas de cada usuario, en orden de aparición
+        sucursales_por_usuario = (
+            df.dropna(subset=['Sucursal'])
+            .drop_duplicates(['Usuario', 'Sucursal'])
+            .groupby('Usuario')['Sucursal']
+            .agg(lambda s: [str(suc) for suc in s])
+        )
 
-    def _create_documents(self, df: pd.DataFrame) -> List[Document]:
-        """Crea documentos para indexación"""
         documents = []
-        self.raw_data = df.copy()
-        
-        # Documentos de actividades
-        for _, activity in df.iterrows():
-            documents.append(self._create_detailed_activity_document(pd.DataFrame([activity])))
-        
-        # Documentos de usuarios
-        for usuario, user_data in df.groupby('Usuario'):
-            sucursales = [str(suc) for suc in user_data['Sucursal'].dropna().unique()]
-            
+        for usuario, total, promedio, puntos in zip(
+            stats.index, stats['total_actividades'].tolist(),
+            stats['calificacion_promedio'].tolist(), stats['puntos_totales'].tolist()
+        ):
+            sucursales = sucursales_por_usuario.get(usuario, [])
             user_metrics = {
-                "total_actividades": self._convert_to_serializable(len(user_data)),
-                "calificacion_promedio": self._convert_to_serializable(user_data['Calificacion'].mean()),
-                "puntos_totales": self._convert_to_serializable(user_data['Puntos_Totales'].sum()),
+                "total_actividades": total,
+                "calificacion_promedio": promedio,
+                "puntos_totales": puntos,
                 "sucursales": sucursales
             }
             
             content = f"""
             Perfil de Usuario: {usuario}
-            Nombre Completo: {user_data['Usuario Nombre'].iloc[0]}
+            Nombre Completo: {nombres[usuario]}
             
             Resumen:
             - Total Actividades: {user_metrics['total_actividades']}
@@ -137,23 +402,30 @@ class RolPlayRAG:
             - Sucursales: {', '.join(sucursales) if sucursales else 'No especificadas'}
             """
             
-            documents.append(Document(
-                text=content,
-                metadata={
+            documents.append(self._summary_document(
+                content,
+                {
                     "usuario": str(usuario),
                     "metrics": user_metrics,
                     "document_type": "user_summary"
-                }
+                },
+                (children or {}).get(usuario)
             ))
-        
-        # Documentos de sucursales
-        for sucursal in df['Sucursal'].dropna().unique():
-            branch_data = df[df['Sucursal'] == sucursal]
+        return documents
+
+    def _create_branch_documents(self, df: pd.DataFrame, children: Dict = None) -> List[Document]:
+        """Crea los resúmenes de sucursal a partir de un único groupby (en orden de aparición)"""
+        stats = df.groupby('Sucursal', sort=False).agg(
+            total_usuarios=('Usuario', 'nunique'),
+            total_actividades=('Calificacion', 'size'),
+            calificacion_promedio=('Calificacion', 'mean'),
+            puntos_totales=('Puntos_Totales', 'sum')
+        )
+
+        documents = []
+        for sucursal, row in zip(stats.index, stats.to_dict(orient='records')):
             branch_metrics = {
-                "total_usuarios": len(branch_data['Usuario'].unique()),
-                "total_actividades": len(branch_data),
-                "calificacion_promedio": self._convert_to_serializable(branch_data['Calificacion'].mean()),
-                "puntos_totales": self._convert_to_serializable(branch_data['Puntos_Totales'].sum())
+                key: self._convert_to_serializable(value) for key, value in row.items()
             }
             
             content = f"""
@@ -166,14 +438,171 @@ class RolPlayRAG:
             - Puntos Totales: {branch_metrics['puntos_totales']}
             """
             
-            documents.append(Document(
-                text=content,
-                metadata={
+            documents.append(self._summary_document(
+                content,
+                {
                     "sucursal": str(sucursal),
                     "metrics": branch_metrics,
                     "document_type": "branch_summary"
-                }
+                },
+                (children or {}).get(sucursal)
+            ))
+        return documents
+
+    def _create_user_month_documents(self, df: pd.DataFrame, meses: pd.Series, children: Dict = None) -> List[Document]:
+        """
+        Resúmenes usuario-mes. Solo para usuarios con actividad en más de un mes;
+        si no, el resumen de usuario ya cubre ese periodo.
+        """
+        meses_por_usuario = meses.groupby(df['Usuario']).nunique()
+        multimes = meses_por_usuario.index[meses_por_usuario > 1]
+        mask = df['Usuario'].isin(multimes) & meses.notna()
+        if not mask.any():
+            return []
+        subset, meses = df[mask], meses[mask]
+
+        stats = subset.groupby(['Usuario', meses]).agg(
+            total_actividades=('Calificacion', 'size'),
+            calificacion_promedio=('Calificacion', 'mean'),
+            puntos_totales=('Puntos_Totales', 'sum')
+        )
+        actividades = {}
+        for (usuario, mes, actividad), total in subset.groupby(['Usuario', meses, 'Actividad_Nombre']).size().items():
+            actividades.setdefault((usuario, mes), []).append(f"{actividad} ({total})")
+        nombres = df.drop_duplicates('Usuario').set_index('Usuario')['Usuario Nombre']
+
+        documents = []
+        for (usuario, mes), row in zip(stats.index, stats.to_dict(orient='records')):
+            metrics = {key: self._convert_to_serializable(value) for key, value in row.items()}
+            content = f"""
+            Resumen Mensual de Usuario: {usuario} ({nombres[usuario]})
+            Mes: {mes}
+            
+            - Actividades: {metrics['total_actividades']}
+            - Calificación Promedio: {metrics['calificacion_promedio']:.2f}
+            - Puntos Totales: {metrics['puntos_totales']}
+            - Actividades realizadas: {', '.join(actividades.get((usuario, mes), []))}
+            """
+            documents.append(self._summary_document(
+                content,
+                {
+                    "usuario": str(usuario),
+                    "mes": str(mes),
+                    "metrics": metrics,
+                    "document_type": "user_month_summary"
+                },
+                (children or {}).get((usuario, mes))
+            ))
+        return documents
+
+    def _create_branch_month_documents(self, df: pd.DataFrame, meses: pd.Series, children: Dict = None) -> List[Document]:
+        """Resúmenes sucursal-mes, solo para sucursales con actividad en más de un mes"""
+        meses_por_sucursal = meses.groupby(df['Sucursal']).nunique()
+        multimes = meses_por_sucursal.index[meses_por_sucursal > 1]
+        mask = df['Sucursal'].isin(multimes) & meses.notna()
+        if not mask.any():
+            return []
+        subset, meses = df[mask], meses[mask]
+
+        stats = subset.groupby(['Sucursal', meses], sort=False).agg(
+            total_usuarios=('Usuario', 'nunique'),
+            total_actividades=('Calificacion', 'size'),
+            calificacion_promedio=('Calificacion', 'mean'),
+            puntos_totales=('Puntos_Totales', 'sum')
+        )
+        # Mejor usuario del mes por calificación promedio
+        promedio_usuario = subset.groupby(['Sucursal', meses, 'Usuario'])['Calificacion'].mean()
+        mejores = promedio_usuario.loc[promedio_usuario.groupby(level=[0, 1]).idxmax().dropna()]
+        mejor_por_grupo = {(suc, mes): (usuario, valor) for (suc, mes, usuario), valor in mejores.items()}
+
+        documents = []
+        for (sucursal, mes), row in zip(stats.index, stats.to_dict(orient='records')):
+            metrics = {key: self._convert_to_serializable(value) for key, value in row.items()}
+            mejor = mejor_por_grupo.get((sucursal, mes))
+            content = f"""
+            Resumen Mensual de Sucursal: {sucursal}
+            Mes: {mes}
+            
+            - Usuarios Activos: {metrics['total_usuarios']}
+            - Actividades: {metrics['total_actividades']}
+            - Calificación Promedio: {metrics['calificacion_promedio']:.2f}
+            - Puntos Totales: {metrics['puntos_totales']}
+            - Mejor Usuario del Mes: {f"{mejor[0]} ({mejor[1]:.2f})" if mejor else 'No disponible'}
+            """
+            documents.append(self._summary_document(
+                content,
+                {
+                    "sucursal": str(sucursal),
+                    "mes": str(mes),
+                    "metrics": metrics,
+                    "document_type": "branch_month_summary"
+                },
+                (children or {}).get((sucursal, mes))
             ))
+        return documents
+
+    def _create_activity_summary_documents(self, df: pd.DataFrame, children: Dict = None) -> List[Document]:
+        """Resumen por tipo de actividad (Actividad_Nombre)"""
+        stats = df.groupby('Actividad_Nombre', sort=False).agg(
+            total_realizaciones=('Calificacion', 'size'),
+            total_usuarios=('Usuario', 'nunique'),
+            total_sucursales=('Sucursal', 'nunique'),
+            calificacion_promedio=('Calificacion', 'mean'),
+            calificacion_minima=('Calificacion', 'min'),
+            calificacion_maxima=('Calificacion', 'max'),
+            puntos_promedio=('Puntos_Totales', 'mean'),
+            primera_fecha=('Fecha_y_Hora', 'min'),
+            ultima_fecha=('Fecha_y_Hora', 'max')
+        )
+
+        documents = []
+        for actividad, row in zip(stats.index, stats.to_dict(orient='records')):
+            metrics = {key: self._convert_to_serializable(value) for key, value in row.items()}
+            content = f"""
+            Resumen de Actividad: {actividad}
+            
+            - Realizaciones: {metrics['total_realizaciones']}
+            - Usuarios Distintos: {metrics['total_usuarios']}
+            - Sucursales Distintas: {metrics['total_sucursales']}
+            - Calificación Promedio: {metrics['calificacion_promedio']:.2f}
+            - Calificación Mínima / Máxima: {metrics['calificacion_minima']} / {metrics['calificacion_maxima']}
+            - Puntos Totales Promedio: {metrics['puntos_promedio']:.2f}
+            - Periodo: {metrics['primera_fecha']} a {metrics['ultima_fecha']}
+            """
+            documents.append(self._summary_document(
+                content,
+                {
+                    "actividad": str(actividad),
+                    "metrics": metrics,
+                    "document_type": "activity_summary"
+                },
+                (children or {}).get(actividad)
+            ))
+        return documents
+
+    def _create_documents(self, df: pd.DataFrame) -> Tuple[List[Document], List[TextNode]]:
+        """
+        Crea los documentos para indexación en dos niveles:
+        - Resúmenes (usuario, usuario-mes, sucursal, sucursal-mes, actividad, generales):
+          son los únicos que se embeben y se buscan por similitud.
+        - Detalles de actividad (uno por fila): se guardan solo en la docstore y se
+          recuperan a través de los `child_ids` del resumen seleccionado.
+        Retorna (resúmenes, detalles).
+        """
+        activity_documents = self._create_activity_documents(df)
+        meses = df['Fecha_y_Hora'].dt.to_period('M').rename('Mes')
+
+        documents = self._create_user_documents(df, self._children_by_group(df, [df['Usuario']]))
+        documents.extend(self._create_user_month_documents(
+            df, meses, self._children_by_group(df, [df['Usuario'], meses])
+        ))
+        documents.extend(self._create_branch_documents(df, self._children_by_group(df, [df['Sucursal']])))
+        documents.extend(self._create_branch_month_documents(
+            df, meses, self._children_by_group(df, [df['Sucursal'], meses])
+        ))
+        documents.extend(self._create_activity_summary_documents(
+            df, self._children_by_group(df, [df['Actividad_Nombre']])
+        ))
         
         # NUEVO: Documento de estadísticas generales
         summary_stats = {
@@ -239,64 +668,226 @@ class RolPlayRAG:
         except Exception as e:
             print(f"Error al crear documento de correlaciones: {str(e)}")
         
-        return documents
+        return documents, activity_documents
+
+    def _new_vector_store(self) -> MmapVectorStore:
+        return MmapVectorStore(
+            dtype=VECTOR_STORE_DTYPE,
+            ivf_min_size=VECTOR_STORE_IVF_MIN_SIZE,
+            nprobe=VECTOR_STORE_NPROBE
+        )
+
+    def _load_vector_store(self) -> MmapVectorStore:
+        """
+        Abre el vector store binario (memmap). Si el índice fue persistido con el
+        SimpleVectorStore en JSON, lo migra una sola vez sin recalcular embeddings.
+        """
+        vector_store_path = os.path.join(self.persist_dir, "default__vector_store.json")
+        if MmapVectorStore.is_mmap_store(vector_store_path):
+            return MmapVectorStore.from_persist_path(
+                vector_store_path,
+                ivf_min_size=VECTOR_STORE_IVF_MIN_SIZE,
+                nprobe=VECTOR_STORE_NPROBE
+            )
 
-    def build_index(self, df: pd.DataFrame, rebuild: bool = False):
-        """Construye o carga el índice vectorial"""
+        print("Migrando vector store JSON a formato binario (memmap)...")
+        vector_store = MmapVectorStore.from_simple_vector_store(
+            SimpleVectorStore.from_persist_path(vector_store_path),
+            dtype=VECTOR_STORE_DTYPE,
+            ivf_min_size=VECTOR_STORE_IVF_MIN_SIZE,
+            nprobe=VECTOR_STORE_NPROBE
+        )
+        vector_store.persist(vector_store_path)
+        return vector_store
+
+    def _embedding_pipeline(self) -> EmbeddingBuildPipeline:
+        return EmbeddingBuildPipeline(
+            Settings.embed_model,
+            checkpoint_path=self.embedding_checkpoint_path,
+            batch_size=EMBED_BATCH_SIZE,
+            max_concurrency=EMBED_MAX_CONCURRENCY,
+            requests_per_minute=EMBED_REQUESTS_PER_MINUTE,
+            tokens_per_minute=EMBED_TOKENS_PER_MINUTE
+        )
+
+    def _build_vector_index(self, documents: List[Document], storage_context: StorageContext) -> VectorStoreIndex:
+        """
+        Equivalente a VectorStoreIndex.from_documents, pero los embeddings se calculan
+        antes con el pipeline por lotes (concurrente, con rate limit y checkpoint).
+        Los nodos llegan al índice con embedding, así que no se vuelven a embeber.
+        """
+        for doc in documents:
+            storage_context.docstore.set_document_hash(doc.get_doc_id(), doc.hash)
+        nodes = run_transformations(documents, Settings.transformations)
+        self._embedding_pipeline().embed_nodes(nodes)
+        return VectorStoreIndex(nodes=nodes, storage_context=storage_context)
+
+    def build_index(self, df: pd.DataFrame, rebuild: bool = False, source_path: str = None):
+        """
+        Construye o carga el índice vectorial.
+        source_path: archivo del que se leyó df; permite saltar el hash si no cambió.
+        Si load_data ya dejó los datos en raw_data se trabaja sobre ese mismo DataFrame:
+        reemplazarlo cambiaría su id (clave de frame_cache, single-flight y caché
+        semántico) bajo las consultas en curso y retendría una segunda copia.
+        """
+        if self.raw_data is None:
+            self.load_data(df)
+        df = self.raw_data
+        self.index_status = "loading"
+        self.index_error = None
+        self.index_ready.clear()
+        self._index_started_at = time.monotonic()
+        self._index_seconds = None
         try:
-            current_hash = self._calculate_data_hash(df)
+            source_signature = file_signature(source_path)
+            fingerprint = self._calculate_fingerprint(df, source_signature)
             
-            if rebuild or self._should_rebuild_index(current_hash):
+            if rebuild or self._should_rebuild_index(fingerprint, source_signature):
                 print("\n⚠️ AVISO DE COSTOS ⚠️")
                 print("Se va a crear un nuevo índice de embeddings (esto generará costos de API).")
                 print("Motivo: Primera ejecución o cambios detectados en los datos.")
                 
-                documents = self._create_documents(df)
-                storage_context = StorageContext.from_defaults()
-                self.index = VectorStoreIndex.from_documents(
-                    documents,
-                    storage_context=storage_context
-                )
+                documents, activity_documents = self._create_documents(df)
+                print(f"Documentos: {len(documents)} resúmenes indexados, {len(activity_documents)} actividades en docstore.")
+                storage_context = StorageContext.from_defaults(vector_store=self._new_vector_store())
+                self.index = self._build_vector_index(documents, storage_context)
+                storage_context.docstore.add_documents(activity_documents)
                 storage_context.persist(persist_dir=self.persist_dir)
-                self._save_metadata(current_hash)
+                self._save_metadata(fingerprint, source_signature)
+                self._embedding_pipeline().clear_checkpoint()
                 
                 print("✅ Embeddings generados y guardados exitosamente.")
             else:
                 print("\n💰 AHORRO DE COSTOS 💰")
                 print("Usando índice de embeddings existente (sin costo adicional).")
                 
-                storage_context = StorageContext.from_defaults(persist_dir=self.persist_dir)
+                storage_context = StorageContext.from_defaults(
+                    persist_dir=self.persist_dir,
+                    vector_store=self._load_vector_store()
+                )
                 self.index = load_index_from_storage(storage_context)
-                self.raw_data = df.copy()
+
+            self.data_version = f"{INDEX_LAYOUT}:{fingerprint['data_hash']}"
+            self.index_status = "ready"
+            self._index_seconds = time.monotonic() - self._index_started_at
+            self.index_ready.set()
                 
         except Exception as e:
+            self.index_status = "error"
+            self.index_error = str(e)
+            self._index_seconds = time.monotonic() - self._index_started_at
             print(f"Error en build_index: {str(e)}")
             traceback.print_exc()
             raise
 
-    def query(self, query_str: str) -> Dict[str, Any]:
-        """Realiza una consulta general al índice"""
+    def hierarchical_retriever(self) -> HierarchicalRetriever:
+        """Retriever sobre los resúmenes que expande a las actividades hijas de cada uno"""
+        return HierarchicalRetriever(
+            self.index.as_retriever(similarity_top_k=RAG_SUMMARY_TOP_K),
+            self.index.docstore,
+            children_per_summary=RAG_CHILDREN_PER_SUMMARY,
+            max_children=RAG_MAX_CHILDREN
+        )
+
+    def query(self, query_str: str, deadline: Deadline = None) -> Dict[str, Any]:
+        """
+        Realiza una consulta general al índice. Si la caché semántica está activa,
+        preguntas equivalentes (misma versión de datos) reutilizan la respuesta.
+        Las llamadas a la API pasan por call_llm (admisión, `deadline`, circuit
+        breaker); lanza ProviderUnavailable si el proveedor no puede atenderlas.
+        """
         if not self.index:
             raise ValueError("El índice no ha sido construido")
-        
+
+        if self.semantic_cache is not None:
+            # Las coincidencias exactas no llaman a la API: no pasan por admisión ni breaker
+            cached = self.semantic_cache.lookup_exact(query_str, self.data_version)
+            if cached is not None:
+                CACHE_EVENTS.inc(cache="semantic_exact", result="hit")
+                return cached
+
+        deadline = deadline or Deadline.none()
+        result, embedding, cache_hit = call_llm(
+            lambda timeout: self._answer(query_str, timeout, deadline),
+            stage=STAGE_RAG,
+            deadline=deadline,
+            max_attempts=2
+        )
+        if self.semantic_cache is not None and not cache_hit:
+            self.semantic_cache.store(query_str, embedding, self.data_version, result)
+        return result
+
+    def _answer(self, query_str: str, timeout: float, deadline: Deadline):
+        """
+        Embedding de la pregunta, caché semántica y, si no hay acierto, recuperación + síntesis.
+        `timeout` es el de call_llm (acotado por el `deadline`) y se aplica al embedding;
+        la síntesis usa lo que quede del presupuesto.
+        """
+        # El embedding se calcula una sola vez: sirve para la caché y para el retriever
+        # (así el retriever no llama a la API con el timeout por defecto)
+        with time_stage("rag_embedding"):
+            embedding = _with_timeout(Settings.embed_model, timeout).get_query_embedding(query_str)
+        if self.semantic_cache is None:
+            return self._query_index(QueryBundle(query_str, embedding=embedding), timeout, deadline), None, False
+
+        cached = self.semantic_cache.lookup(query_str, embedding, self.data_version)
+        CACHE_EVENTS.inc(cache="semantic", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached, embedding, True
+        return self._query_index(QueryBundle(query_str, embedding=embedding), timeout, deadline), embedding, False
+
+    def _record_token_usage(self, token_counter: TokenCountingHandler):
+        """Tokens de la síntesis en el span de call_llm (el actual) y en los totales de la traza."""
+        prompt_tokens = token_counter.prompt_llm_token_count
+        completion_tokens = token_counter.completion_llm_token_count
+        set_span_attributes(model=self.llm.model, prompt_tokens=prompt_tokens,
+                            completion_tokens=completion_tokens)
+        add_trace_counter("prompt_tokens", prompt_tokens)
+        add_trace_counter("completion_tokens", completion_tokens)
+
+    def _query_index(self, query_bundle: QueryBundle, timeout: float, deadline: Deadline) -> Dict[str, Any]:
         try:
-            query_engine = self.index.as_query_engine(
-                response_mode="tree_summarize",
-                streaming=True
+            retriever = self.hierarchical_retriever()
+
+            # Recuperación y síntesis por separado para medir cada etapa; con streaming
+            # la llamada al LLM ocurre al consumir la respuesta (str)
+            with time_stage("rag_retrieval"):
+                nodes = retriever.retrieve(query_bundle)
+            if deadline.remaining() < MIN_CALL_SECONDS:
+                raise ProviderUnavailable("presupuesto de tiempo agotado antes de la síntesis")
+            # Cada llamada de tree_summarize usa como máximo lo que queda del presupuesto.
+            # La copia del LLM lleva su propio contador de tokens: la respuesta de la
+            # síntesis no es un chat.completion y call_llm no puede leer su `usage`
+            llm = _with_timeout(self.llm, deadline.timeout(timeout))
+            token_counter = TokenCountingHandler()
+            callback_manager = CallbackManager([token_counter])
+            # El sintetizador asigna su callback_manager al LLM (por defecto, el global
+            # de Settings): se le pasa explícitamente para que el contador reciba los eventos
+            query_engine = RetrieverQueryEngine.from_args(
+                retriever,
+                response_synthesizer=get_response_synthesizer(
+                    llm=llm,
+                    callback_manager=callback_manager,
+                    response_mode="tree_summarize",
+                    streaming=True
+                ),
+                callback_manager=callback_manager
             )
-            
-            response = query_engine.query(query_str)
+            with time_stage("rag_synthesis"):
+                response = query_engine.synthesize(query_bundle, nodes)
+                response_text = str(response)
+            self._record_token_usage(token_counter)
             
             return {
-                "response": str(response),
+                "response": response_text,
                 "source_nodes": [
                     {
                         "text": node.text,
-                        "metadata": node.metadata
+                        "metadata": {k: v for k, v in node.metadata.items() if k != CHILD_IDS_KEY}
                     } for node in response.source_nodes
                 ] if hasattr(response, 'source_nodes') else []
             }
         except Exception as e:
             print(f"Error en query: {str(e)}")
             traceback.print_exc()
-            raise
\ No newline at end of file
+            raise
@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', function() {
         console.error('Error: marked.js no está cargado. Asegúrate de incluirlo en index.html');
     }
 
+    // Identificador de la conversación: el servidor guarda el contexto por sesión
+    const sessionId = getSessionId();
+
     // Mostrar el chat al hacer clic en el botón flotante
     openChatButton.addEventListener('click', function() {
         chatPopup.style.display = 'flex';
@@ -31,6 +34,25 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    function getSessionId() {
+        const key = 'rolplaySessionId';
+        let id = null;
+        try {
+            id = sessionStorage.getItem(key);
+        } catch (e) {
+            // sessionStorage no disponible (modo privado, iframes): id solo en memoria
+        }
+        if (!id) {
+            id = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+            try {
+                sessionStorage.setItem(key, id);
+            } catch (e) {}
+        }
+        return id;
+    }
+
     function sendMessage() {
         const message = userInput.value.trim();
         if (message === '') return;
@@ -48,7 +70,7 @@ document.addEventListener('DOMContentLoaded', function() {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ query: message })
+            body: JSON.stringify({ query: message, session_id: sessionId })
         })
         .then(response => response.json())
         .then(data => {
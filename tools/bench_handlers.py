@@ -0,0 +1,282 @@
+"""
+Micro-benchmark de los handlers de querys/* sobre datos sintéticos de distintos tamaños.
+
+Para cada tamaño genera una tabla con tools.generate_fact_data (texto como object,
+igual que al leer el Excel) y ejecuta cada handler con parámetros representativos
+(el usuario, la sucursal y la fecha con más filas). Mide por llamada:
+- tiempo de pared (mediana y mínimo de --repeat ejecuciones),
+- pico de memoria y bloques retenidos, en una ejecución aparte con tracemalloc.
+
+Los resultados se guardan como JSON (--save) y se comparan contra una línea base
+(--baseline): si un handler es más lento o usa más memoria que la tolerancia, se
+marca como regresión y el proceso termina con código 1.
+
+Uso (desde la raíz del repo):
+    python -m tools.bench_handlers --sizes 10k,100k --save benchmarks/handlers_baseline.json
+    python -m tools.bench_handlers --sizes 10k,100k --baseline benchmarks/handlers_baseline.json
+    python -m tools.bench_handlers --sizes 1M,10M --handlers get_user_rankings,get_trend_analysis
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tools.generate_fact_data import generate_fact_table
+from querys.querys_Fact_RolPlay_Sim import get_activity_success_factors, get_time_analysis, search_activities
+from querys.querys_activities import (
+    get_activity_rankings,
+    get_activity_stats,
+    get_branch_performance,
+    get_branch_rankings,
+    get_branch_stats,
+    get_comparative_analysis,
+    get_correlation_analysis,
+    get_time_period_analysis,
+    get_top_performances,
+    get_trend_analysis,
+)
+from querys.querys_criteria import get_criterion_analysis
+from querys.querys_progression import get_most_improved
+from querys.querys_users import (
+    advanced_search,
+    get_exact_activity_result,
+    get_general_stats,
+    get_personalized_recommendations,
+    get_user_activity_history,
+    get_user_progression,
+    get_user_rankings,
+    get_users_by_branch,
+)
+
+DEFAULT_SIZES = "10k,100k,1M,10M"
+# Una regresión debe superar la tolerancia relativa y además estos mínimos absolutos
+# (los handlers de pocos ms tienen mucho ruido)
+MIN_TIME_DELTA_MS = 2.0
+MIN_MEMORY_DELTA_MB = 1.0
+
+Case = Tuple[str, Callable[..., Dict[str, Any]], Callable[[Dict[str, Any]], Dict[str, Any]]]
+
+# (nombre, handler, parámetros a partir de los valores representativos del dataset)
+CASES: List[Case] = [
+    ("get_user_activity_history", get_user_activity_history, lambda p: {"usuario": p["usuario"]}),
+    ("get_user_progression", get_user_progression, lambda p: {"usuario": p["usuario"]}),
+    ("get_user_rankings", get_user_rankings, lambda p: {}),
+    ("get_user_rankings_sucursal", get_user_rankings, lambda p: {"sucursal": p["sucursal"]}),
+    ("get_users_by_branch", get_users_by_branch, lambda p: {"sucursal": p["sucursal"]}),
+    ("get_personalized_recommendations", get_personalized_recommendations, lambda p: {"usuario": p["usuario"]}),
+    ("advanced_search", advanced_search, lambda p: {"filtros": {
+        "sucursal": p["sucursal"], "actividad": p["actividad"], "fecha_inicio": p["fecha_inicio"]}}),
+    ("get_general_stats", get_general_stats, lambda p: {}),
+    ("get_exact_activity_result", get_exact_activity_result, lambda p: {"fecha": p["fecha"]}),
+    ("get_activity_stats", get_activity_stats, lambda p: {"actividad": p["actividad"]}),
+    ("get_activity_rankings", get_activity_rankings, lambda p: {}),
+    ("get_branch_performance", get_branch_performance, lambda p: {"sucursal": p["sucursal"]}),
+    ("get_branch_rankings", get_branch_rankings, lambda p: {}),
+    ("get_branch_stats", get_branch_stats, lambda p: {}),
+    ("get_time_period_analysis", get_time_period_analysis, lambda p: {"periodo": "week"}),
+    ("get_trend_analysis", get_trend_analysis, lambda p: {}),
+    ("get_trend_analysis_usuario", get_trend_analysis, lambda p: {"usuario": p["usuario"]}),
+    ("get_comparative_analysis", get_comparative_analysis, lambda p: {"usuarios": p["usuarios"]}),
+    ("get_correlation_analysis", get_correlation_analysis, lambda p: {}),
+    ("get_top_performances", get_top_performances, lambda p: {"n": 10}),
+    ("get_time_analysis", get_time_analysis, lambda p: {"periodo": "day"}),
+    ("search_activities", search_activities, lambda p: {"texto": p["actividad"]}),
+    ("get_activity_success_factors", get_activity_success_factors, lambda p: {}),
+    ("get_criterion_analysis_sucursal", get_criterion_analysis, lambda p: {"sucursal": p["sucursal"]}),
+    ("get_criterion_analysis_usuario", get_criterion_analysis, lambda p: {"usuario": p["usuario"]}),
+    ("get_most_improved", get_most_improved, lambda p: {}),
+    ("get_most_improved_sucursal", get_most_improved, lambda p: {"sucursal": p["sucursal"]}),
+]
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def format_size(rows: int) -> str:
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}M"
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+
+def build_dataset(rows: int, seed: int = 0, categorical: bool = False) -> pd.DataFrame:
+    # ~50 filas por usuario a escala (el original tiene ~2), mínimo como el original
+    df = generate_fact_table(rows, users=max(250, rows // 50), branches=40, seed=seed)
+    if not categorical:
+        df = df.astype({c: "object" for c in df.select_dtypes("category")})
+    return df
+
+
+def representative_params(df: pd.DataFrame) -> Dict[str, Any]:
+    """Valores con más filas: el peor caso habitual de los filtros por usuario/sucursal/fecha."""
+    top_users = df["Usuario"].value_counts().index[:3].astype(str).tolist()
+    fecha = pd.Timestamp(df["Fecha"].value_counts().idxmax())
+    return {
+        "usuario": top_users[0],
+        "usuarios": top_users,
+        "sucursal": str(df["Sucursal"].value_counts().idxmax()),
+        "actividad": str(df["Actividad_Nombre"].value_counts().idxmax()),
+        "fecha": fecha.strftime("%d/%m/%Y"),
+        "fecha_inicio": (fecha - pd.Timedelta(days=7)).strftime("%d/%m/%Y"),
+    }
+
+
+def _call(fn: Callable, df: pd.DataFrame, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # Los handlers imprimen trazas de depuración; no deben contar en la medición
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return fn(df, **kwargs)
+
+
+def measure(fn: Callable, df: pd.DataFrame, kwargs: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    result = _call(fn, df, kwargs)  # calentamiento (cachés de pandas, imports perezosos)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _call(fn, df, kwargs)
+        times.append((time.perf_counter() - start) * 1000)
+
+    # Memoria en una ejecución aparte: tracemalloc enlentece las llamadas
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        _call(fn, df, kwargs)
+        peak = tracemalloc.get_traced_memory()[1] - base
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = after.compare_to(before, "filename")
+
+    status = "ok"
+    if isinstance(result, dict) and "error" in result:
+        status = f"error: {result['error']}"
+    return {
+        "time_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "peak_mb": round(peak / 1e6, 3),
+        "retained_kb": round(sum(s.size_diff for s in retained) / 1e3, 1),
+        "retained_blocks": sum(s.count_diff for s in retained),
+        "status": status,
+    }
+
+
+def run_benchmark(sizes: List[int], repeat: int = 3, handlers: List[str] = None, seed: int = 0,
+                  categorical: bool = False, verbose: bool = True) -> Dict[str, Any]:
+    cases = [c for c in CASES if not handlers or c[0] in handlers]
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "seed": seed,
+            "categorical": categorical,
+        },
+        "results": {},
+    }
+    for rows in sizes:
+        label = format_size(rows)
+        start = time.perf_counter()
+        df = build_dataset(rows, seed, categorical)
+        params = representative_params(df)
+        if verbose:
+            print(f"\n== {label} filas (generadas en {time.perf_counter() - start:.1f}s), parámetros: {params}")
+        size_results = results["results"][label] = {}
+        for name, fn, make_kwargs in cases:
+            r = size_results[name] = measure(fn, df, make_kwargs(params), repeat)
+            if verbose:
+                print(f"{name:<36}{r['time_ms']:>12.2f} ms{r['peak_mb']:>12.1f} MB"
+                      f"{r['retained_blocks']:>10} bloques  {r['status'][:40]}")
+        del df
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], time_tolerance: float,
+            memory_tolerance: float) -> List[Dict[str, Any]]:
+    """Regresiones de tiempo o memoria respecto a la línea base (solo pares presentes en ambas)."""
+    regressions = []
+    for size, handlers in current["results"].items():
+        for name, r in handlers.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            checks = [
+                ("time_ms", time_tolerance, MIN_TIME_DELTA_MS),
+                ("peak_mb", memory_tolerance, MIN_MEMORY_DELTA_MB),
+            ]
+            for metric, tolerance, min_delta in checks:
+                old, new = base[metric], r[metric]
+                if new > old * (1 + tolerance) and new - old > min_delta:
+                    regressions.append({
+                        "size": size, "handler": name, "metric": metric,
+                        "baseline": old, "current": new, "ratio": round(new / old, 2) if old else None,
+                    })
+            if base.get("status") == "ok" and r["status"] != "ok":
+                regressions.append({"size": size, "handler": name, "metric": "status",
+                                    "baseline": base["status"], "current": r["status"], "ratio": None})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Tamaños separados por coma (10k, 1M, ...)")
+    parser.add_argument("--handlers", help="Subconjunto de casos separados por coma (por defecto todos)")
+    parser.add_argument("--repeat", type=int, default=3, help="Ejecuciones cronometradas por handler")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--categorical", action="store_true",
+                        help="Mantener las columnas de texto como category (por defecto object, como el Excel)")
+    parser.add_argument("--save", help="Guardar los resultados en JSON (nueva línea base)")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior contra el que comparar")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Aumento relativo de tiempo tolerado")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Aumento relativo de memoria tolerado")
+    args = parser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    handlers = [h.strip() for h in args.handlers.split(",")] if args.handlers else None
+    if handlers:
+        unknown = set(handlers) - {name for name, _, _ in CASES}
+        if unknown:
+            parser.error(f"Casos desconocidos: {', '.join(sorted(unknown))}")
+
+    results = run_benchmark(sizes, args.repeat, handlers, args.seed, args.categorical)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones respecto a {args.baseline}:")
+            for r in regressions:
+                ratio = f" (x{r['ratio']})" if r["ratio"] else ""
+                print(f"  [{r['size']}] {r['handler']} {r['metric']}: {r['baseline']} -> {r['current']}{ratio}")
+            sys.exit(1)
+        print(f"\nSin regresiones respecto a {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
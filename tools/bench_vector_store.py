@@ -0,0 +1,107 @@
+"""
+Benchmark de carga y consulta: SimpleVectorStore (JSON) vs MmapVectorStore.
+
+Uso (desde la raíz del repo):
+    python -m tools.bench_vector_store --vectors 50000 --dim 1536 --queries 50
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from core.mmap_vector_store import MmapVectorStore
+
+
+def _timed(fn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def run_benchmark(n_vectors: int, dim: int, n_queries: int, top_k: int, nprobe: int = 8, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n_vectors, dim)).astype(np.float32)
+    queries = rng.normal(size=(n_queries, dim)).astype(np.float32)
+    nodes = [
+        TextNode(id_=f"node-{i}", text="", embedding=vectors[i].tolist(), metadata={"grupo": i % 10})
+        for i in range(n_vectors)
+    ]
+    results = {"vectors": n_vectors, "dim": dim, "queries": n_queries, "top_k": top_k, "nprobe": nprobe, "stores": {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        simple_path = os.path.join(tmp, "json__vector_store.json")
+        simple = SimpleVectorStore()
+        simple.add(nodes)
+        simple.persist(simple_path)
+        loaded_simple, load_time = _timed(lambda: SimpleVectorStore.from_persist_path(simple_path))
+
+        exact_ids = []
+        start = time.perf_counter()
+        for q in queries:
+            exact_ids.append(loaded_simple.query(VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k)).ids)
+        results["stores"]["json"] = {
+            "load_s": load_time,
+            "query_ms": (time.perf_counter() - start) / n_queries * 1000,
+            "disk_mb": os.path.getsize(simple_path) / 1e6,
+            "recall": 1.0,
+        }
+
+        variants = [("float32", False), ("float16", False), ("int8", False), ("float32", True), ("int8", True)]
+        for dtype, ivf in variants:
+            name = f"mmap_{dtype}" + ("_ivf" if ivf else "")
+            path = os.path.join(tmp, f"{name}__vector_store.json")
+            store = MmapVectorStore(dtype=dtype, ivf_min_size=1 if ivf else n_vectors + 1, nprobe=nprobe)
+            store.add(nodes)
+            store.persist(path)
+            loaded, load_time = _timed(lambda: MmapVectorStore.from_persist_path(path, nprobe=nprobe), repeat=5)
+
+            hits = 0
+            start = time.perf_counter()
+            for q, expected in zip(queries, exact_ids):
+                found = loaded.query(VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k)).ids
+                hits += len(set(found) & set(expected))
+            disk = sum(
+                os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp) if f.startswith(f"{name}__")
+            )
+            results["stores"][name] = {
+                "load_s": load_time,
+                "query_ms": (time.perf_counter() - start) / n_queries * 1000,
+                "disk_mb": disk / 1e6,
+                "recall": hits / (n_queries * top_k),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8, help="Listas IVF revisadas por consulta")
+    parser.add_argument("--json", help="Ruta opcional para guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.vectors, args.dim, args.queries, args.top_k, args.nprobe)
+    print(f"\n{args.vectors} vectores x {args.dim} dims, top_k={args.top_k}, nprobe={args.nprobe}")
+    print(f"{'store':<20}{'carga (s)':>12}{'consulta (ms)':>16}{'disco (MB)':>14}{'recall':>10}")
+    for name, r in results["stores"].items():
+        print(f"{name:<20}{r['load_s']:>12.4f}{r['query_ms']:>16.2f}{r['disk_mb']:>14.1f}{r['recall']:>10.3f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Evalúa la recuperación del RAG con un conjunto fijo de preguntas: índice plano
+(un vector por actividad + resúmenes de usuario/sucursal, el formato anterior)
+vs índice jerárquico (solo resúmenes con embedding + expansión a actividades hijas).
+
+Para cada pregunta, un acierto es que algún nodo del contexto recuperado tenga
+la metadata esperada (ver tools/eval_questions.json).
+
+Uso (desde la raíz del repo; con --embed-model openai consume API):
+    python -m tools.eval_retrieval --embed-model openai
+    python -m tools.eval_retrieval --embed-model hashing  # sin API: bolsa de palabras con hashing
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llama_index.core import Settings, StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.ingestion import run_transformations
+
+from core.config import (
+    FACT_FILE_PATH,
+    RAG_SUMMARY_TOP_K,
+    RAG_CHILDREN_PER_SUMMARY,
+    RAG_MAX_CHILDREN
+)
+from core.hierarchical_retriever import HierarchicalRetriever
+from core.text_processing import clean_text
+from rag_engine import RolPlayRAG
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_questions.json")
+FLAT_SUMMARY_TYPES = {"user_summary", "branch_summary", "general_summary", "correlation_insights"}
+# Claves de fecha: se comparan por prefijo ("2024-10" coincide con "2024-10-08 04:35:00")
+DATE_KEYS = {"mes": ("mes", "fecha"), "fecha": ("fecha",)}
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Embedding léxico local (bolsa de palabras y bigramas con feature hashing, log-TF,
+    normalizado). No reemplaza a un modelo real, pero permite comparar formatos de
+    índice sin llamar a la API.
+    """
+
+    dim: int = 8192
+
+    def _vector(self, text: str):
+        # clean_text elimina los saltos de línea; se normalizan antes para no pegar palabras
+        tokens = re.findall(r"[a-z0-9]+", clean_text(" ".join(text.split())))
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            bucket = int(hashlib.md5(feature.encode("utf-8")).hexdigest()[:8], 16) % self.dim
+            vector[bucket] += 1.0
+        vector = np.log1p(vector)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str):
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str):
+        return self._vector(text)
+
+    async def _aget_query_embedding(self, query: str):
+        return self._vector(query)
+
+
+def _matches(metadata: dict, expected: dict) -> bool:
+    for key, value in expected.items():
+        if key in DATE_KEYS:
+            if not any(str(metadata.get(k, "")).startswith(value) for k in DATE_KEYS[key]):
+                return False
+        elif str(metadata.get(key, "")) != value:
+            return False
+    return True
+
+
+def _evaluate(retriever, questions: list) -> dict:
+    hits, reciprocal_ranks, context_nodes, context_chars, latencies = 0, [], [], [], []
+    per_type = {}
+    for question in questions:
+        start = time.perf_counter()
+        nodes = retriever.retrieve(question["pregunta"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = next(
+            (i + 1 for i, n in enumerate(nodes) if _matches(n.node.metadata, question["esperado"])), None
+        )
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        context_nodes.append(len(nodes))
+        context_chars.append(sum(len(n.node.get_content()) for n in nodes))
+        stats = per_type.setdefault(question.get("tipo", "otro"), [0, 0])
+        stats[0] += rank is not None
+        stats[1] += 1
+    n = len(questions)
+    return {
+        "hit_rate": hits / n,
+        "mrr": sum(reciprocal_ranks) / n,
+        "avg_context_nodes": sum(context_nodes) / n,
+        "avg_context_chars": sum(context_chars) / n,
+        "avg_retrieval_ms": sum(latencies) / n,
+        "por_tipo": {tipo: f"{ok}/{total}" for tipo, (ok, total) in per_type.items()},
+    }
+
+
+def run_evaluation(df: pd.DataFrame, questions: list, embed_model, flat_top_k: int) -> dict:
+    engine = RolPlayRAG(persist_dir=tempfile.mkdtemp())
+    # RolPlayRAG configura OpenAIEmbedding por defecto; se reemplaza por el modelo elegido
+    Settings.embed_model = embed_model
+    engine.load_data(df)
+    summaries, activities = engine._create_documents(engine.raw_data)
+
+    flat_summaries = [d for d in summaries if d.metadata["document_type"] in FLAT_SUMMARY_TYPES]
+    flat_nodes = activities + run_transformations(flat_summaries, Settings.transformations)
+    flat_index = VectorStoreIndex(nodes=flat_nodes, storage_context=StorageContext.from_defaults())
+
+    storage_context = StorageContext.from_defaults()
+    hierarchical_index = VectorStoreIndex.from_documents(summaries, storage_context=storage_context)
+    storage_context.docstore.add_documents(activities)
+    hierarchical = HierarchicalRetriever(
+        hierarchical_index.as_retriever(similarity_top_k=RAG_SUMMARY_TOP_K),
+        hierarchical_index.docstore,
+        children_per_summary=RAG_CHILDREN_PER_SUMMARY,
+        max_children=RAG_MAX_CHILDREN,
+    )
+
+    return {
+        "rows": len(df),
+        "questions": len(questions),
+        "plano": {"vectors": len(flat_nodes), **_evaluate(flat_index.as_retriever(similarity_top_k=flat_top_k), questions)},
+        "jerarquico": {"vectors": len(summaries), **_evaluate(hierarchical, questions)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=FACT_FILE_PATH, help="Excel/CSV con el dataset")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--embed-model", choices=["openai", "hashing"], default="openai")
+    parser.add_argument(
+        "--flat-top-k", type=int, default=RAG_SUMMARY_TOP_K + RAG_MAX_CHILDREN,
+        help="top_k del índice plano (por defecto, el mismo número máximo de nodos de contexto)"
+    )
+    parser.add_argument("--json", help="Ruta opcional para guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    # En CSV las fechas llegan como texto; _create_documents usa el accessor .dt
+    df = (pd.read_csv(args.data, parse_dates=["Fecha_y_Hora"]) if args.data.endswith(".csv")
+          else pd.read_excel(args.data))
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    if args.embed_model == "hashing":
+        embed_model = HashingEmbedding()
+    else:
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        embed_model = OpenAIEmbedding()
+
+    results = run_evaluation(df, questions, embed_model, args.flat_top_k)
+    print(f"\n{results['rows']} filas, {results['questions']} preguntas")
+    print(f"{'índice':<12}{'vectores':>10}{'hit rate':>10}{'MRR':>8}{'nodos ctx':>11}{'chars ctx':>11}{'ms':>8}")
+    for name in ("plano", "jerarquico"):
+        r = results[name]
+        print(
+            f"{name:<12}{r['vectors']:>10}{r['hit_rate']:>10.2f}{r['mrr']:>8.2f}"
+            f"{r['avg_context_nodes']:>11.1f}{r['avg_context_chars']:>11.0f}{r['avg_retrieval_ms']:>8.1f}"
+        )
+        print(f"{'':<12}por tipo: {r['por_tipo']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
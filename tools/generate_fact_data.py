@@ -0,0 +1,233 @@
+"""
+Generador sintético de Fact_RolPlay_Sim para pruebas de escala.
+
+Produce tablas con las mismas columnas (y tipos) que data/raw/Fact_RolPlay_Sim.xlsx:
+- Actividad por usuario sesgada (ley de Zipf): pocos usuarios concentran muchas actividades.
+- Cada usuario pertenece a una sola sucursal; una fracción de usuarios no tiene sucursal (nulos).
+- Puntos por ítem según la habilidad del usuario, que mejora en rondas posteriores.
+- Generación vectorizada por bloques (memoria acotada para decenas de millones de filas).
+
+Uso (desde la raíz del repo):
+    python -m tools.generate_fact_data --rows 1000000 --users 20000 --branches 300 --output data/synthetic/fact_1m.parquet
+    python -m tools.generate_fact_data --rows 100000 --output data/synthetic/fact_100k.xlsx
+
+El formato sale de la extensión: .xlsx (máx. 1.048.575 filas), .csv / .csv.gz o .parquet
+(requiere pyarrow).
+"""
+import argparse
+import os
+import time
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+
+# Mismo orden que el archivo original
+COLUMNS = [
+    "Actividad_Nombre", "Calificacion", "Caso_de_Uso_Nombre", "Cliente", "Fecha_y_Hora",
+    "ID_Caso_de_Uso", "ID_Sim",
+    "Info_Correcta1", "Info_Correcta10", "Info_Correcta2", "Info_Correcta3", "Info_Correcta4",
+    "Info_Correcta5", "Info_Correcta6", "Info_Correcta7", "Info_Correcta8", "Info_Correcta9",
+    "Puntos1", "Puntos10", "Puntos2", "Puntos3", "Puntos4", "Puntos5", "Puntos6", "Puntos7",
+    "Puntos8", "Puntos9", "Puntos_Totales", "Resp_CorrectaRelevante", "Usuario", "Usuario Nombre",
+    "Venta", "Nombre_y_Usuario", "Fecha", "Hora", "Dia_Relativo", "Actividad_Nombre_Corregida",
+    "Sucursal", "Enlace",
+]
+
+N_ITEMS = 10
+# Como en el original, los ítems 8-10 no aplican al caso de uso
+APPLICABLE_ITEMS = 7
+MAX_POINTS_PER_ITEM = 5
+NOT_APPLICABLE = "No aplica"
+EXCEL_MAX_ROWS = 1_048_575
+# Excel guarda las horas como fechas sobre este día base
+EXCEL_TIME_BASE = pd.Timestamp("1899-12-29")
+
+ORDINALS = {1: "1ra", 2: "2da", 3: "3ra", 4: "4ta", 5: "5ta", 6: "6ta", 7: "7ma", 8: "8va", 9: "9na", 10: "10ma"}
+
+
+def activity_names(n: int) -> List[str]:
+    return [f"{ORDINALS.get(i, f'{i}a')} Ronda" for i in range(1, n + 1)]
+
+
+class FactGenerator:
+    """Estado por usuario (sucursal, habilidad, peso de actividad) y generación por bloques."""
+
+    def __init__(
+        self,
+        users: int = 250,
+        branches: int = 40,
+        activities: int = 2,
+        use_cases: int = 1,
+        start_date: str = "2024-09-24",
+        days: int = 37,
+        null_branch_rate: float = 0.04,
+        zipf_a: float = 1.1,
+        seed: int = 0,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.users = users
+        self.activities = activity_names(activities)
+        self.use_cases = ["Ejercicio Definitivo"] + [f"Caso de Uso {i}" for i in range(2, use_cases + 1)]
+        self.start = pd.Timestamp(start_date)
+        self.days = days
+
+        ids = np.arange(1, users + 1)
+        self.user_labels = np.array([f"user{i}" for i in ids], dtype=object)
+        self.user_names = np.array([f"Representante {i}" for i in ids], dtype=object)
+        self.user_full = np.array([f"Representante {i} user{i}" for i in ids], dtype=object)
+
+        # Sucursal fija por usuario (tamaños desiguales); algunos usuarios sin sucursal
+        branch_weights = self.rng.dirichlet(np.full(branches, 0.7))
+        self.user_branch = self.rng.choice(branches, size=users, p=branch_weights)
+        self.user_branch[self.rng.random(users) < null_branch_rate] = -1
+        self.branch_labels = np.array([f"Sucursal {i}" for i in range(1, branches + 1)], dtype=object)
+
+        # Actividad por usuario ~ Zipf (rango aleatorio para no correlacionar con el id)
+        ranks = self.rng.permutation(users) + 1
+        weights = 1.0 / ranks ** zipf_a
+        self.user_p = weights / weights.sum()
+        self.user_skill = self.rng.beta(2.2, 2.8, size=users)
+        self._next_id = 10_000
+
+    def chunk(self, rows: int) -> pd.DataFrame:
+        rng = self.rng
+        user = rng.choice(self.users, size=rows, p=self.user_p)
+        activity = rng.integers(0, len(self.activities), size=rows)
+        use_case = rng.integers(0, len(self.use_cases), size=rows)
+
+        seconds = rng.integers(0, self.days * 86400, size=rows)
+        fecha_y_hora = (self.start + pd.to_timedelta(seconds // 60 * 60, unit="s")).values
+        fecha = fecha_y_hora.astype("datetime64[D]").astype("datetime64[ns]")
+        time_of_day = fecha_y_hora - fecha
+
+        # Habilidad + mejora por ronda + ruido por intento
+        p = np.clip(self.user_skill[user] + 0.06 * activity + rng.normal(0, 0.08, rows), 0.02, 0.98)
+        points = rng.binomial(MAX_POINTS_PER_ITEM, p[:, None], size=(rows, APPLICABLE_ITEMS)).astype(float)
+        # Ítems sin respuesta registrada (NaN), como en el original
+        points[rng.random((rows, APPLICABLE_ITEMS)) < 0.01] = np.nan
+        answered = ~np.isnan(points)
+        total = np.nansum(points, axis=1)
+        max_total = answered.sum(axis=1) * MAX_POINTS_PER_ITEM
+        calificacion = np.round(np.divide(100 * total, max_total, out=np.zeros(rows), where=max_total > 0), 2)
+        correct = (points == MAX_POINTS_PER_ITEM) | ((points >= 3) & (rng.random(points.shape) < 0.2))
+
+        data = {
+            "Actividad_Nombre": pd.Categorical.from_codes(activity, categories=self.activities),
+            "Calificacion": calificacion,
+            "Caso_de_Uso_Nombre": pd.Categorical.from_codes(use_case, categories=self.use_cases),
+            "Cliente": "Empresa Demo",
+            "Fecha_y_Hora": fecha_y_hora,
+            "ID_Caso_de_Uso": 178 + use_case,
+            "ID_Sim": np.arange(self._next_id, self._next_id + rows),
+            "Puntos_Totales": total.astype(np.int64),
+            "Resp_CorrectaRelevante": np.where(rng.random(rows) < 0.012, "SI", "NO"),
+            "Usuario": pd.Categorical.from_codes(user, categories=self.user_labels),
+            "Usuario Nombre": pd.Categorical.from_codes(user, categories=self.user_names),
+            "Venta": np.where(rng.random(rows) < 0.017, "SI", "NO"),
+            "Nombre_y_Usuario": pd.Categorical.from_codes(user, categories=self.user_full),
+            "Fecha": fecha,
+            "Hora": EXCEL_TIME_BASE.to_datetime64() + time_of_day,
+            "Dia_Relativo": (fecha - self.start.to_datetime64()).astype("timedelta64[D]").astype(np.int64) + 1,
+            # En el original se corrige por el orden de intentos de cada usuario, lo que
+            # requiere ver todas las filas; aquí se conserva la ronda generada
+            "Actividad_Nombre_Corregida": pd.Categorical.from_codes(activity, categories=self.activities),
+            "Sucursal": pd.Categorical.from_codes(self.user_branch[user], categories=self.branch_labels),
+            "Enlace": "https://example.com",
+        }
+        for i in range(1, N_ITEMS + 1):
+            if i <= APPLICABLE_ITEMS:
+                item_points = points[:, i - 1]
+                info = np.where(correct[:, i - 1], "SI", "NO").astype(object)
+                info[np.isnan(item_points)] = np.nan
+                data[f"Puntos{i}"] = item_points
+                data[f"Info_Correcta{i}"] = info
+            else:
+                data[f"Puntos{i}"] = NOT_APPLICABLE
+                data[f"Info_Correcta{i}"] = NOT_APPLICABLE
+
+        self._next_id += rows
+        return pd.DataFrame(data, columns=COLUMNS)
+
+    def chunks(self, rows: int, chunk_rows: int = 1_000_000) -> Iterator[pd.DataFrame]:
+        remaining = rows
+        while remaining > 0:
+            size = min(chunk_rows, remaining)
+            yield self.chunk(size)
+            remaining -= size
+
+
+def generate_fact_table(rows: int, **kwargs) -> pd.DataFrame:
+    """Tabla completa en memoria (para benchmarks); columnas de texto como categorías."""
+    chunk_rows = kwargs.pop("chunk_rows", 1_000_000)
+    return pd.concat(list(FactGenerator(**kwargs).chunks(rows, chunk_rows)), ignore_index=True)
+
+
+def write_output(generator: FactGenerator, rows: int, path: str, chunk_rows: int):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lower = path.lower()
+    if lower.endswith(".xlsx"):
+        if rows > EXCEL_MAX_ROWS:
+            raise ValueError(f"Excel admite como máximo {EXCEL_MAX_ROWS} filas; usa .csv o .parquet")
+        df = pd.concat(list(generator.chunks(rows, chunk_rows)), ignore_index=True)
+        df.to_excel(path, index=False)
+    elif lower.endswith(".csv") or lower.endswith(".csv.gz"):
+        for i, chunk in enumerate(generator.chunks(rows, chunk_rows)):
+            chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=(i == 0))
+    elif lower.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("La salida .parquet requiere pyarrow (pip install pyarrow)")
+        writer = None
+        try:
+            for chunk in generator.chunks(rows, chunk_rows):
+                # Categorías como texto: los diccionarios pueden diferir entre bloques
+                table = pa.Table.from_pandas(chunk.astype({c: "object" for c in chunk.select_dtypes("category")}),
+                                             preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError("Extensión no soportada: usa .xlsx, .csv, .csv.gz o .parquet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--branches", type=int, default=40)
+    parser.add_argument("--activities", type=int, default=2, help="Número de rondas (1ra Ronda, 2da Ronda, ...)")
+    parser.add_argument("--use-cases", type=int, default=1)
+    parser.add_argument("--start-date", default="2024-09-24")
+    parser.add_argument("--days", type=int, default=37)
+    parser.add_argument("--null-branch-rate", type=float, default=0.04, help="Fracción de usuarios sin sucursal")
+    parser.add_argument("--zipf-a", type=float, default=1.1, help="Sesgo de actividad por usuario (0 = uniforme)")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="Archivo de salida (.xlsx, .csv, .csv.gz, .parquet)")
+    args = parser.parse_args()
+
+    generator = FactGenerator(
+        users=args.users,
+        branches=args.branches,
+        activities=args.activities,
+        use_cases=args.use_cases,
+        start_date=args.start_date,
+        days=args.days,
+        null_branch_rate=args.null_branch_rate,
+        zipf_a=args.zipf_a,
+        seed=args.seed,
+    )
+    start = time.perf_counter()
+    write_output(generator, args.rows, args.output, args.chunk_rows)
+    elapsed = time.perf_counter() - start
+    print(f"{args.rows:,} filas -> {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB) en {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
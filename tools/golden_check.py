@@ -0,0 +1,362 @@
+"""
+Verificación diferencial de los handlers de querys/* contra salidas de referencia (goldens).
+
+`record` ejecuta cada handler sobre datasets sintéticos fijos (tools.generate_fact_data
+con semilla) y una grilla de parámetros, incluidos casos borde: usuarios sin sucursal,
+ids numéricos ("12"), nombres ("Representante 12"), valores inexistentes y fechas
+relativas ("primera", "ultima", "reciente", "este trimestre"). Guarda las salidas en JSON (gzip si la
+ruta termina en .gz).
+
+`check` vuelve a ejecutar la grilla y compara con tolerancia para floats; los
+enteros, textos, claves y el orden de las listas deben coincidir exactamente.
+Con --override se prueba una implementación alternativa sin tocar querys/*.
+
+Uso (desde la raíz del repo):
+    python -m tools.golden_check record
+    python -m tools.golden_check check
+    python -m tools.golden_check check --override get_user_rankings=querys.fast_rankings:get_user_rankings
+"""
+import argparse
+import contextlib
+import gzip
+import importlib
+import json
+import math
+import os
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tools.generate_fact_data import generate_fact_table
+from querys.querys_Fact_RolPlay_Sim import get_activity_success_factors, get_time_analysis, search_activities
+from querys.querys_activities import (
+    get_activity_rankings,
+    get_activity_stats,
+    get_branch_performance,
+    get_branch_rankings,
+    get_branch_stats,
+    get_comparative_analysis,
+    get_correlation_analysis,
+    get_time_period_analysis,
+    get_top_performances,
+    get_trend_analysis,
+)
+from querys.querys_users import (
+    advanced_search,
+    get_exact_activity_result,
+    get_general_stats,
+    get_personalized_recommendations,
+    get_user_activity_history,
+    get_user_progression,
+    get_user_rankings,
+    get_users_by_branch,
+)
+from querys.querys_criteria import get_criterion_analysis
+from querys.querys_progression import get_most_improved
+
+DEFAULT_GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "handlers.json.gz")
+GOLDEN_FORMAT = 1
+
+# Datasets fijos: cambiar estos parámetros (o el generador) obliga a regrabar
+DATASETS = {
+    "small": {"rows": 1_500, "users": 120, "branches": 12, "null_branch_rate": 0.1, "seed": 7},
+    "medium": {"rows": 6_000, "users": 400, "branches": 40, "null_branch_rate": 0.04, "seed": 11},
+}
+
+HANDLERS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    fn.__name__: fn for fn in (
+        get_user_activity_history, get_user_progression, get_user_rankings, get_users_by_branch,
+        get_personalized_recommendations, advanced_search, get_general_stats, get_exact_activity_result,
+        get_activity_stats, get_activity_rankings, get_branch_performance, get_branch_rankings,
+        get_branch_stats, get_time_period_analysis, get_trend_analysis, get_comparative_analysis,
+        get_correlation_analysis, get_top_performances, get_time_analysis, search_activities,
+        get_activity_success_factors, get_criterion_analysis, get_most_improved,
+    )
+}
+
+
+def build_dataset(name: str) -> pd.DataFrame:
+    spec = dict(DATASETS[name])
+    df = generate_fact_table(spec.pop("rows"), **spec)
+    # Texto como object, igual que al leer el Excel
+    return df.astype({c: "object" for c in df.select_dtypes("category")})
+
+
+def dataset_values(df: pd.DataFrame) -> Dict[str, Any]:
+    """Valores reales del dataset para la grilla (determinísticos para un dataset fijo)."""
+    counts = df["Usuario"].value_counts()
+    top_user = str(counts.index[0])
+    no_branch = df.loc[df["Sucursal"].isna(), "Usuario"]
+    single = counts[counts == 1]
+    top_branch = str(df["Sucursal"].value_counts().index[0])
+    fecha = pd.Timestamp(df["Fecha"].value_counts().index[0])
+    return {
+        "top_user": top_user,
+        "top_user_number": top_user.replace("user", ""),
+        "no_branch_user": str(no_branch.iloc[0]) if len(no_branch) else top_user,
+        "single_activity_user": str(single.index[0]) if len(single) else top_user,
+        "top_users": [str(u) for u in counts.index[:3]],
+        "top_branch": top_branch,
+        "top_branch_number": top_branch.replace("Sucursal ", ""),
+        "fecha": fecha.strftime("%d/%m/%Y"),
+        "fecha_iso": fecha.strftime("%Y-%m-%d"),
+        "fecha_inicio": (fecha - pd.Timedelta(days=10)).strftime("%d/%m/%Y"),
+        "fecha_texto": f"{fecha.day} de {_MESES[fecha.month - 1]} de {fecha.year}",
+        "mes_texto": f"{_MESES[fecha.month - 1]} de {fecha.year}",
+        "trimestre_texto": f"el {_TRIMESTRES[fecha.quarter - 1]} trimestre de {fecha.year}",
+        "actividad": str(df["Actividad_Nombre"].value_counts().index[0]),
+    }
+
+
+_MESES = ("enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+          "septiembre", "octubre", "noviembre", "diciembre")
+_TRIMESTRES = ("primer", "segundo", "tercer", "cuarto")
+
+
+def parameter_grid(v: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """(handler, kwargs) a ejecutar; el id de cada caso sale del handler y sus kwargs."""
+    users = [v["top_user"], v["top_user_number"], f"Representante {v['top_user_number']}",
+             v["no_branch_user"], v["single_activity_user"], "user999999"]
+    branches = [v["top_branch"], v["top_branch_number"], "Sucursal 9999"]
+    grid: List[Tuple[str, Dict[str, Any]]] = []
+    for usuario in users:
+        grid += [
+            ("get_user_activity_history", {"usuario": usuario}),
+            ("get_user_progression", {"usuario": usuario}),
+            ("get_personalized_recommendations", {"usuario": usuario}),
+        ]
+    grid += [("get_user_progression", {"usuario": v["top_user"], "metrica": "puntos"})]
+    for tipo in ("general", "puntos", "actividades"):
+        grid.append(("get_user_rankings", {"tipo": tipo}))
+    grid += [
+        ("get_user_rankings", {"sucursal": v["top_branch"]}),
+        ("get_user_rankings", {"actividad": v["actividad"]}),
+        ("get_user_rankings", {"order": "asc", "min_activities": 3}),
+    ]
+    for sucursal in branches:
+        grid += [
+            ("get_users_by_branch", {"sucursal": sucursal}),
+            ("get_branch_performance", {"sucursal": sucursal}),
+        ]
+    for fecha in (v["fecha"], v["fecha_iso"], v["fecha_texto"], v["mes_texto"],
+                  "primera", "ultima", "reciente", "01/01/2020"):
+        grid.append(("get_exact_activity_result", {"fecha": fecha}))
+    grid.append(("get_exact_activity_result", {"fecha": v["fecha"], "actividad": v["actividad"]}))
+    grid += [
+        ("advanced_search", {"filtros": {"sucursal": v["top_branch"]}}),
+        ("advanced_search", {"filtros": {"usuario": v["top_user"], "fecha_inicio": v["fecha_inicio"]}}),
+        ("advanced_search", {"filtros": {"actividad": v["actividad"], "fecha_inicio": v["fecha_inicio"],
+                                         "fecha_fin": v["fecha"]}}),
+        ("get_general_stats", {}),
+        ("get_activity_stats", {"actividad": v["actividad"]}),
+        ("get_activity_stats", {"actividad": "Ronda inexistente"}),
+        ("get_activity_rankings", {}),
+        ("get_branch_rankings", {}),
+        ("get_branch_stats", {}),
+        ("get_correlation_analysis", {}),
+        ("get_activity_success_factors", {}),
+        ("get_comparative_analysis", {"usuarios": v["top_users"]}),
+        ("get_comparative_analysis", {"usuarios": v["top_users"][:2], "actividad": v["actividad"]}),
+        ("get_top_performances", {"n": 10}),
+        ("get_top_performances", {"n": 5, "metric": "puntos"}),
+        ("search_activities", {"texto": v["actividad"]}),
+    ]
+    for periodo in ("day", "week", "month"):
+        grid += [
+            ("get_time_period_analysis", {"periodo": periodo}),
+            ("get_trend_analysis", {"periodo": periodo}),
+            ("get_time_analysis", {"periodo": periodo}),
+        ]
+    grid += [
+        ("get_trend_analysis", {"usuario": v["top_user"]}),
+        ("get_trend_analysis", {"sucursal": v["top_branch"], "actividad": v["actividad"]}),
+    ]
+    for usuario in (v["top_user"], v["top_user_number"], "user999999"):
+        grid.append(("get_criterion_analysis", {"usuario": usuario}))
+    grid += [
+        ("get_criterion_analysis", {}),
+        ("get_criterion_analysis", {"sucursal": v["top_branch"]}),
+        ("get_criterion_analysis", {"sucursal": v["top_branch"], "actividad": v["actividad"]}),
+        ("get_criterion_analysis", {"sucursal": "Sucursal 9999"}),
+    ]
+    for periodo in (None, "este trimestre", "el trimestre pasado", "los ultimos 3 meses", v["fecha"][-4:],
+                    v["trimestre_texto"], f"primer trimestre de {v['fecha'][-4:]}", "el segundo trimestre"):
+        grid.append(("get_most_improved", {"periodo": periodo} if periodo else {}))
+    grid += [
+        ("get_most_improved", {"n": 5, "order": "asc"}),
+        ("get_most_improved", {"metrica": "puntos"}),
+        ("get_most_improved", {"sucursal": v["top_branch"]}),
+        ("get_most_improved", {"actividad": v["actividad"], "min_actividades": 2}),
+        ("get_most_improved", {"sucursal": "Sucursal 9999"}),
+        ("get_most_improved", {"periodo": "fecha inventada"}),
+    ]
+    return grid
+
+
+def case_id(handler: str, kwargs: Dict[str, Any]) -> str:
+    return f"{handler}({json.dumps(kwargs, ensure_ascii=False, sort_keys=True)})"
+
+
+def normalize(value: Any) -> Any:
+    """Salida de un handler a JSON estable (numpy/pandas a nativos, NaN a None)."""
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [normalize(v) for v in value]
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray)):
+        return [normalize(v) for v in value.tolist()]
+    if isinstance(value, pd.DataFrame):
+        return normalize(value.to_dict(orient="records"))
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else (str(value) if math.isinf(value) else float(value))
+    if value is None or value is pd.NaT or isinstance(value, str):
+        return None if value is pd.NaT else value
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+
+def run_case(fn: Callable, df: pd.DataFrame, kwargs: Dict[str, Any]) -> Any:
+    # Copia por caso: algunos handlers agregan columnas auxiliares al DataFrame
+    data = df.copy()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            result = fn(data, **kwargs)
+        except Exception as e:
+            result = {"exception": type(e).__name__, "message": str(e)}
+    return normalize(result)
+
+
+def run_all(handlers: Dict[str, Callable], only: List[str] = None) -> Dict[str, Any]:
+    outputs = {}
+    for name in DATASETS:
+        df = build_dataset(name)
+        values = dataset_values(df)
+        cases = {}
+        for handler, kwargs in parameter_grid(values):
+            if only and handler not in only:
+                continue
+            cases[case_id(handler, kwargs)] = run_case(handlers[handler], df, kwargs)
+        outputs[name] = {"values": values, "cases": cases}
+    return outputs
+
+
+def diff(expected: Any, actual: Any, rtol: float, atol: float, path: str = "$") -> List[str]:
+    """Diferencias legibles entre dos salidas normalizadas (vacía si coinciden)."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        problems = []
+        for key in expected.keys() - actual.keys():
+            problems.append(f"{path}.{key}: falta")
+        for key in actual.keys() - expected.keys():
+            problems.append(f"{path}.{key}: clave nueva")
+        for key in expected.keys() & actual.keys():
+            problems += diff(expected[key], actual[key], rtol, atol, f"{path}.{key}")
+        return problems
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [f"{path}: largo {len(expected)} -> {len(actual)}"]
+        problems = []
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            problems += diff(e, a, rtol, atol, f"{path}[{i}]")
+        return problems
+    numeric = (int, float)
+    if (isinstance(expected, float) or isinstance(actual, float)) and \
+            isinstance(expected, numeric) and isinstance(actual, numeric) and \
+            not isinstance(expected, bool) and not isinstance(actual, bool):
+        if math.isclose(expected, actual, rel_tol=rtol, abs_tol=atol):
+            return []
+        return [f"{path}: {expected!r} -> {actual!r}"]
+    if type(expected) is not type(actual) or expected != actual:
+        return [f"{path}: {expected!r} -> {actual!r}"]
+    return []
+
+
+def load_golden(path: str) -> Dict[str, Any]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_golden(path: str, payload: Dict[str, Any]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def resolve_overrides(specs: List[str]) -> Dict[str, Callable]:
+    """"handler=modulo:funcion" reemplaza el handler de la grilla por otra implementación."""
+    handlers = dict(HANDLERS)
+    for spec in specs or []:
+        name, _, target = spec.partition("=")
+        module_name, _, attr = target.partition(":")
+        if name not in HANDLERS or not module_name or not attr:
+            raise SystemExit(f"--override inválido: {spec!r} (handler=modulo:funcion)")
+        handlers[name] = getattr(importlib.import_module(module_name), attr)
+    return handlers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["record", "check"])
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN_PATH, help="Archivo de referencias (.json o .json.gz)")
+    parser.add_argument("--handlers", help="Limitar a estos handlers (separados por coma)")
+    parser.add_argument("--override", action="append", help="handler=modulo:funcion (repetible)")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="Tolerancia relativa para floats")
+    parser.add_argument("--atol", type=float, default=1e-9, help="Tolerancia absoluta para floats")
+    parser.add_argument("--max-diffs", type=int, default=5, help="Diferencias mostradas por caso")
+    args = parser.parse_args()
+
+    only = [h.strip() for h in args.handlers.split(",")] if args.handlers else None
+    handlers = resolve_overrides(args.override)
+    outputs = run_all(handlers, only)
+
+    if args.command == "record":
+        if only or args.override:
+            raise SystemExit("record graba la grilla completa con los handlers actuales (sin --handlers/--override)")
+        save_golden(args.golden, {"format": GOLDEN_FORMAT, "datasets": DATASETS, "outputs": outputs})
+        total = sum(len(d["cases"]) for d in outputs.values())
+        print(f"{total} casos grabados en {args.golden}")
+        return
+
+    golden = load_golden(args.golden)
+    if golden.get("datasets") != json.loads(json.dumps(DATASETS)):
+        raise SystemExit("Los datasets cambiaron desde la grabación; vuelve a ejecutar `record`")
+    failed, checked = 0, 0
+    for name, data in outputs.items():
+        expected_data = golden["outputs"].get(name, {})
+        if expected_data.get("values") != data["values"]:
+            print(f"[{name}] los valores de la grilla cambiaron (¿cambió el generador?): vuelve a grabar")
+            failed += 1
+            continue
+        for cid, actual in data["cases"].items():
+            checked += 1
+            if cid not in expected_data["cases"]:
+                print(f"[{name}] {cid}: sin referencia (caso nuevo)")
+                failed += 1
+                continue
+            problems = diff(expected_data["cases"][cid], actual, args.rtol, args.atol)
+            if problems:
+                failed += 1
+                print(f"[{name}] {cid}: {len(problems)} diferencias")
+                for p in problems[:args.max_diffs]:
+                    print(f"    {p}")
+    print(f"\n{checked - failed}/{checked} casos coinciden con {args.golden}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
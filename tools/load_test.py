@@ -0,0 +1,232 @@
+"""
+Prueba de carga de extremo a extremo contra /query (app.py -> process_query -> handlers -> generate_response).
+
+Lanza solicitudes en lazo abierto a una tasa objetivo (llegadas de Poisson o constantes):
+la tasa no baja cuando el servidor se satura, así las colas y los 429 se ven en los
+resultados. Cada solicitud toma una pregunta de una mezcla ponderada y una sesión de
+un conjunto de sesiones (las preguntas de seguimiento usan el contexto de la sesión).
+
+Reporta p50/p95/p99, throughput y tasa de errores, en total y por etiqueta de pregunta,
+y opcionalmente agrega el resultado (con --label para la configuración) a un JSON.
+
+Uso (desde la raíz del repo, con la app apuntando al mock de OpenAI):
+    python -m tools.mock_openai_server --port 8089 &
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=mock gunicorn app:app -c gunicorn.conf.py &
+    python -m tools.load_test --url http://127.0.0.1:5000 --rps 20 --duration 60 --label "4 workers x 8 hilos"
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Mezcla por defecto: (etiqueta, peso, pregunta); valores del dataset real
+DEFAULT_MIX = [
+    ("user_performance", 14, "¿Cómo le va al usuario user7?"),
+    ("user_performance", 6, "¿En qué sucursal está el representante 65?"),
+    ("user_ranking", 10, "¿Quiénes son los mejores usuarios?"),
+    ("user_ranking", 4, "¿Quiénes son los peores usuarios de la Sucursal 48?"),
+    ("branch_ranking", 8, "¿Cuál es la mejor sucursal?"),
+    ("branch_performance", 8, "¿Qué tal la sucursal 26?"),
+    ("users_by_branch", 5, "¿Qué usuarios hay en la sucursal 48?"),
+    ("user_progression", 6, "¿El usuario user5 ha mejorado?"),
+    ("most_improved", 3, "¿Quién mejoró más en los últimos 3 meses?"),
+    ("personalized_recommendations", 4, "¿Qué recomendaciones tienes para user65?"),
+    ("specific_date", 6, "¿Qué resultados hubo el 15/10/2024?"),
+    ("specific_date", 3, "Muéstrame la actividad más reciente"),
+    ("activity_analysis", 5, "¿Cómo fue la 2da Ronda?"),
+    ("trend", 4, "¿Se nota una tendencia de mejora con el tiempo?"),
+    ("general_stats", 5, "Dame un panorama general de los resultados"),
+    ("follow_up", 6, "¿Y en esa misma sucursal quiénes son los mejores?"),
+    ("criterion_analysis", 3, "¿En qué criterio falla más la Sucursal 48?"),
+    ("exploratory_analysis", 3, "¿Qué insights ves en los patrones de respuesta?"),
+    ("conversation", 3, "Hola, ¿qué puedes hacer?"),
+]
+
+
+def load_mix(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Mezcla desde JSON: [{"question": ..., "weight": 1, "tag": ...}, ...]."""
+    if not path:
+        return [{"tag": tag, "weight": weight, "question": question} for tag, weight, question in DEFAULT_MIX]
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    return [{"tag": i.get("tag", "custom"), "weight": float(i.get("weight", 1)), "question": i["question"]}
+            for i in items]
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class LoadTest:
+    def __init__(self, url: str, mix: List[Dict[str, Any]], rps: float, duration: float,
+                 sessions: int = 50, timeout: float = 120.0, max_in_flight: int = 512,
+                 arrival: str = "poisson", warmup: float = 0.0, seed: Optional[int] = None):
+        self.url = url.rstrip("/") + "/query"
+        self.mix = mix
+        self.weights = [m["weight"] for m in mix]
+        self.rps = rps
+        self.duration = duration
+        self.sessions = [uuid.uuid4().hex for _ in range(sessions)]
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.arrival = arrival
+        self.warmup = warmup
+        self.rng = random.Random(seed)
+        self.results: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def _send(self, item: Dict[str, Any], session_id: str, scheduled: float, measured: bool):
+        payload = json.dumps({"query": item["question"], "session_id": session_id}).encode()
+        request = urllib.request.Request(self.url, data=payload, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        status, error, size = 0, None, 0
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                size = len(response.read())
+        except urllib.error.HTTPError as e:
+            status = e.code
+            size = len(e.read() or b"")
+        except Exception as e:
+            error = type(e).__name__
+        finally:
+            self._in_flight.release()
+        end = time.perf_counter()
+        if measured:
+            with self._lock:
+                self.results.append({
+                    "tag": item["tag"],
+                    "status": status,
+                    "error": error,
+                    "latency_s": end - start,
+                    # Incluye el retraso del propio generador (cliente saturado)
+                    "lag_s": start - scheduled,
+                    "bytes": size,
+                })
+
+    def run(self) -> Dict[str, Any]:
+        total = self.warmup + self.duration
+        start = time.perf_counter()
+        next_at = start
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            while True:
+                next_at += self.rng.expovariate(self.rps) if self.arrival == "poisson" else 1.0 / self.rps
+                if next_at - start >= total:
+                    break
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if not self._in_flight.acquire(blocking=False):
+                    # Cliente al límite de solicitudes abiertas: se cuenta, no se encola
+                    self.dropped += 1
+                    continue
+                item = self.rng.choices(self.mix, weights=self.weights)[0]
+                session_id = self.rng.choice(self.sessions)
+                pool.submit(self._send, item, session_id, next_at, next_at - start >= self.warmup)
+        return self.summary(time.perf_counter() - start - self.warmup)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        def stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+            ok = [r["latency_s"] * 1000 for r in rows if r["status"] == 200]
+            statuses: Dict[str, int] = {}
+            for r in rows:
+                key = str(r["status"]) if r["error"] is None else r["error"]
+                statuses[key] = statuses.get(key, 0) + 1
+            failed = sum(1 for r in rows if r["status"] != 200)
+            return {
+                "requests": len(rows),
+                "ok": len(ok),
+                "error_rate": round(failed / len(rows), 4) if rows else 0.0,
+                "p50_ms": round(percentile(ok, 50), 1),
+                "p95_ms": round(percentile(ok, 95), 1),
+                "p99_ms": round(percentile(ok, 99), 1),
+                "max_ms": round(max(ok), 1) if ok else 0.0,
+                "statuses": statuses,
+            }
+
+        with self._lock:
+            rows = list(self.results)
+        overall = stats(rows)
+        overall["throughput_rps"] = round(overall["ok"] / elapsed, 2) if elapsed > 0 else 0.0
+        overall["offered_rps"] = self.rps
+        overall["dropped_by_client"] = self.dropped
+        overall["client_lag_p99_ms"] = round(percentile([r["lag_s"] * 1000 for r in rows], 99), 1)
+        by_tag = {}
+        for tag in sorted({r["tag"] for r in rows}):
+            by_tag[tag] = stats([r for r in rows if r["tag"] == tag])
+        return {"overall": overall, "by_tag": by_tag}
+
+
+def fetch_server_stats(base_url: str) -> Optional[Dict[str, Any]]:
+    """/stats de la app al terminar (admisión, breaker, single-flight); None si no responde."""
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/stats", timeout=10) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
+
+def print_report(label: str, result: Dict[str, Any]):
+    o = result["overall"]
+    print(f"\n== {label or 'sin etiqueta'}: {o['requests']} solicitudes, {o['throughput_rps']} rps útiles "
+          f"(ofrecidas {o['offered_rps']}), errores {o['error_rate']:.1%}, descartadas por el cliente {o['dropped_by_client']}")
+    print(f"{'etiqueta':<30}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'error':>8}  códigos")
+    rows = [("TOTAL", o)] + list(result["by_tag"].items())
+    for tag, s in rows:
+        print(f"{tag:<30}{s['requests']:>7}{s['p50_ms']:>10.0f}{s['p95_ms']:>10.0f}{s['p99_ms']:>10.0f}"
+              f"{s['error_rate']:>8.1%}  {s['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="URL base de la app")
+    parser.add_argument("--rps", type=float, default=10.0, help="Tasa objetivo de solicitudes por segundo")
+    parser.add_argument("--duration", type=float, default=60.0, help="Segundos medidos")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Segundos iniciales que no se miden")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--sessions", type=int, default=50, help="Sesiones simuladas (contexto por sesión)")
+    parser.add_argument("--mix", help="JSON con la mezcla de preguntas (por defecto una mezcla representativa)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-in-flight", type=int, default=512, help="Solicitudes abiertas máximas del cliente")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--label", default="", help="Nombre de la configuración de servidor probada")
+    parser.add_argument("--json", help="Archivo JSON al que agregar el resultado (lista de ejecuciones)")
+    args = parser.parse_args()
+
+    test = LoadTest(args.url, load_mix(args.mix), args.rps, args.duration, args.sessions, args.timeout,
+                    args.max_in_flight, args.arrival, args.warmup, args.seed)
+    result = test.run()
+    print_report(args.label, result)
+
+    if args.json:
+        runs = []
+        if os.path.exists(args.json):
+            with open(args.json, encoding="utf-8") as f:
+                runs = json.load(f)
+        runs.append({
+            "label": args.label,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {k: getattr(args, k) for k in ("url", "rps", "duration", "warmup", "arrival", "sessions", "mix")},
+            "server_stats": fetch_server_stats(args.url),
+            **result,
+        })
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(runs, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado agregado a {args.json}")
+
+
+if __name__ == "__main__":
+    main()
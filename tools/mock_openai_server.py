@@ -0,0 +1,402 @@
+"""
+Servidor local compatible con la API de OpenAI, para pruebas de carga sin llamadas reales.
+
+Implementa (con y sin prefijo /v1):
+- POST /chat/completions: si el system prompt es el de detección de intención responde un
+  JSON de intención (reglas por palabras clave); si no, un texto de análisis genérico.
+  Soporta "stream": true (SSE, fragmentos con la latencia repartida).
+- POST /embeddings: vectores deterministas (hashing de palabras, normalizados), en
+  formato float o base64 como pide el cliente.
+- GET /models, GET /_mock/stats, POST /_mock/config (cambiar latencias/errores en caliente).
+
+Latencias como "distribución:parámetros" en ms: fixed:50, uniform:200:800,
+lognormal:800:0.5 (mediana, sigma), exponential:300 (media).
+Errores: --error-rate con códigos de --error-codes (429, 500, 503...), y --hang-rate para
+solicitudes que no responden durante --hang-seconds (timeouts del cliente).
+
+Uso (desde la raíz del repo):
+    python -m tools.mock_openai_server --port 8089 --chat-latency lognormal:800:0.5 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=mock gunicorn app:app -c gunicorn.conf.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_EMBEDDING_DIM = 1536
+# Marca del system prompt de prompts/determine_intent_prompt.py
+INTENT_PROMPT_MARKER = "TIPOS DE ANÁLISIS"
+STREAM_CHUNKS = 8
+
+# (tipo de consulta, palabras clave) en orden de prioridad; texto sin acentos y en minúsculas
+INTENT_RULES = [
+    ("criterion_analysis", ["criterio"]),
+    ("users_by_branch", ["que usuarios", "quienes estan en", "usuarios de la sucursal", "usuarios hay en"]),
+    ("personalized_recommendations", ["recomend", "sugerencia", "ayudaria", "consejo"]),
+    ("most_improved", ["mejoro mas", "mas mejoro", "mas ha mejorado", "mas han mejorado", "empeoro mas"]),
+    ("user_progression", ["mejorado", "progres", "evolucion de"]),
+    ("user_ranking", ["mejores usuarios", "peores usuarios", "ranking de usuarios", "quienes son los"]),
+    ("branch_ranking", ["mejor sucursal", "peor sucursal", "ranking de sucursales", "van las sucursales"]),
+    ("branch_stats", ["estadisticas de sucursales", "estadisticas por sucursal"]),
+    ("branch_performance", ["sucursal"]),
+    ("activity_ranking", ["actividades cuestan", "actividad mas dificil", "ranking de actividades"]),
+    ("specific_date", ["reciente", "ultima", "primera", "/"]),
+    ("trend", ["tendencia", "con el tiempo"]),
+    ("correlation", ["correlacion", "relacion entre"]),
+    ("time_period", ["por semana", "por mes", "por dia"]),
+    ("general_stats", ["panorama", "resumen general", "estadisticas generales"]),
+    ("activity_analysis", ["ronda", "actividad"]),
+    ("user_performance", ["user", "representante", "usuario"]),
+    ("exploratory_analysis", ["insight", "patron", "explora"]),
+]
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def classify_intent(query: str) -> Dict[str, Any]:
+    """Intención con el formato de determine_intent (mismas claves que devuelve GPT-4)."""
+    folded = _fold(query)
+    query_type = "conversation"
+    for candidate, keywords in INTENT_RULES:
+        if any(k in folded for k in keywords):
+            query_type = candidate
+            break
+
+    usuario = re.search(r"\b(user\d+|representante \d+)\b", folded)
+    sucursal = re.search(r"\bsucursal (\d+)\b", folded)
+    actividad = re.search(r"\b(\d+(?:ra|da|ta|ma|va|na) ronda)\b", folded)
+    fecha = re.search(r"\b(\d{1,2}/\d{1,2}/\d{2,4})\b", folded)
+    relative = re.search(r"\b(reciente|ultima|primera)\b", folded)
+    parameters = {
+        "usuario": usuario.group(1) if usuario else None,
+        "sucursal": f"Sucursal {sucursal.group(1)}" if sucursal else None,
+        "actividad": actividad.group(1).replace("ronda", "Ronda") if actividad else None,
+        "fecha": fecha.group(1) if fecha else (relative.group(1) if relative else None),
+        "tipo": "peores" if "peor" in folded else "general",
+        "metric": None,
+        "n": None,
+        "periodo": "week" if "semana" in folded else "day",
+        "filtros": None,
+        "metrica": None,
+    }
+    return {
+        "requires_data": query_type != "conversation",
+        "query_type": query_type,
+        "parameters": parameters,
+        "use_context": any(w in folded.split() for w in ("mismo", "misma", "ese", "esa", "anterior")),
+    }
+
+
+def embed_text(text: str, dim: int) -> List[float]:
+    """Bolsa de palabras con hashing: textos con palabras en común quedan cerca."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"\w+", _fold(text)):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class LatencyModel:
+    """Distribución de latencias en ms a partir de "tipo:param[:param]"."""
+
+    def __init__(self, spec: str):
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        self.spec = spec
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "exponential": 1}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Latencia inválida: {spec!r} (fixed:ms, uniform:min:max, lognormal:mediana:sigma, exponential:media)")
+
+    def sample(self, rng: random.Random) -> float:
+        """Segundos."""
+        if self.kind == "fixed":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(*self.params)
+        elif self.kind == "lognormal":
+            ms = self.params[0] * rng.lognormvariate(0.0, self.params[1])
+        else:
+            ms = rng.expovariate(1.0 / self.params[0]) if self.params[0] > 0 else 0.0
+        return max(ms, 0.0) / 1000
+
+
+class MockState:
+    """Configuración (modificable en caliente) y contadores del servidor."""
+
+    def __init__(self, chat_latency: str, embed_latency: str, error_rate: float, error_codes: List[int],
+                 hang_rate: float, hang_seconds: float, embedding_dim: int, seed: Optional[int] = None):
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.chat_latency = LatencyModel(chat_latency)
+        self.embed_latency = LatencyModel(embed_latency)
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.embedding_dim = embedding_dim
+        self.counters: Dict[str, int] = {}
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def draw(self, latency: LatencyModel):
+        """(segundos de latencia, código de error inyectado o None, colgar la respuesta)."""
+        with self.lock:
+            roll = self.rng.random()
+            delay = latency.sample(self.rng)
+            if roll < self.hang_rate:
+                return delay, None, True
+            if roll < self.hang_rate + self.error_rate and self.error_codes:
+                return delay, self.rng.choice(self.error_codes), False
+            return delay, None, False
+
+    def configure(self, changes: Dict[str, Any]):
+        with self.lock:
+            if "chat_latency" in changes:
+                self.chat_latency = LatencyModel(changes["chat_latency"])
+            if "embed_latency" in changes:
+                self.embed_latency = LatencyModel(changes["embed_latency"])
+            for key in ("error_rate", "hang_rate", "hang_seconds"):
+                if key in changes:
+                    setattr(self, key, float(changes[key]))
+            if "error_codes" in changes:
+                self.error_codes = [int(c) for c in changes["error_codes"]]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "chat_latency": self.chat_latency.spec,
+                "embed_latency": self.embed_latency.spec,
+                "error_rate": self.error_rate,
+                "error_codes": self.error_codes,
+                "hang_rate": self.hang_rate,
+                "hang_seconds": self.hang_seconds,
+                "counters": dict(self.counters),
+            }
+
+
+def _usage(prompt: str, completion: str) -> Dict[str, int]:
+    # Aproximación: ~0.75 palabras por token
+    prompt_tokens = int(len(prompt.split()) / 0.75) + 1
+    completion_tokens = int(len(completion.split()) / 0.75) + 1
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def chat_content(messages: List[Dict[str, Any]]) -> str:
+    system = " ".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+    user = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if INTENT_PROMPT_MARKER in system:
+        return json.dumps(classify_intent(user), ensure_ascii=False)
+    return (
+        "Según los datos disponibles, este es el análisis solicitado. "
+        "Los resultados muestran diferencias entre usuarios y sucursales; "
+        "conviene revisar las actividades con menor calificación promedio "
+        "y reforzar los ítems con menos respuestas correctas."
+    )
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+    state: MockState = None  # se asigna en make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _path(self) -> str:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        return path[3:] if path.startswith("/v1/") else path
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        path = self._path()
+        if path == "/models":
+            self._send_json(200, {"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "mock"} for m in ("gpt-4", "text-embedding-ada-002")]})
+        elif path == "/_mock/stats":
+            self._send_json(200, self.state.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Ruta desconocida: {path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        path = self._path()
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": {"message": "JSON inválido", "type": "invalid_request_error"}})
+            return
+        if path == "/_mock/config":
+            try:
+                self.state.configure(body)
+            except (TypeError, ValueError) as e:
+                self._send_json(400, {"error": {"message": str(e), "type": "invalid_request_error"}})
+                return
+            self._send_json(200, self.state.snapshot())
+        elif path == "/chat/completions":
+            self._chat(body)
+        elif path == "/embeddings":
+            self._embeddings(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Ruta desconocida: {path}", "type": "invalid_request_error"}})
+
+    def _inject(self, kind: str, latency: LatencyModel) -> Optional[float]:
+        """Aplica errores/cuelgues; retorna la latencia a simular o None si ya respondió."""
+        delay, error, hang = self.state.draw(latency)
+        self.state.count(f"{kind}_requests")
+        if hang:
+            self.state.count(f"{kind}_hangs")
+            time.sleep(self.state.hang_seconds)
+            self.close_connection = True
+            return None
+        if error is not None:
+            self.state.count(f"{kind}_errors_{error}")
+            time.sleep(min(delay, 0.05))
+            self._send_json(error, {"error": {"message": f"Error inyectado ({error})", "type": "mock_error"}})
+            return None
+        return delay
+
+    def _chat(self, body: Dict[str, Any]):
+        delay = self._inject("chat", self.state.chat_latency)
+        if delay is None:
+            return
+        messages = body.get("messages") or []
+        content = chat_content(messages)
+        model = body.get("model", "gpt-4")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        prompt = " ".join(str(m.get("content") or "") for m in messages)
+
+        if not body.get("stream"):
+            time.sleep(delay)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": _usage(prompt, content),
+            })
+            return
+
+        # Streaming: la mitad de la latencia hasta el primer fragmento y el resto repartido
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        words = content.split(" ")
+        step = max(1, -(-len(words) // STREAM_CHUNKS))
+        pieces = [" ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+                  for i in range(0, len(words), step)]
+        time.sleep(delay / 2)
+        try:
+            for i, piece in enumerate(pieces):
+                delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+                self._sse({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                           "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                time.sleep(delay / 2 / len(pieces))
+            self._sse({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.count("chat_stream_disconnects")
+
+    def _sse(self, payload: Dict[str, Any]):
+        self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode() + b"\n\n")
+        self.wfile.flush()
+
+    def _embeddings(self, body: Dict[str, Any]):
+        delay = self._inject("embeddings", self.state.embed_latency)
+        if delay is None:
+            return
+        inputs = body.get("input")
+        if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = int(body.get("dimensions") or self.state.embedding_dim)
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, item in enumerate(inputs or []):
+            text = item if isinstance(item, str) else " ".join(str(t) for t in item)
+            vector = embed_text(text, dim)
+            embedding = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode() if as_base64 else vector
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        self.state.count("embedded_inputs", len(data))
+        time.sleep(delay)
+        tokens = sum(len(str(item).split()) for item in inputs or [])
+        self._send_json(200, {"object": "list", "data": data, "model": body.get("model", "text-embedding-ada-002"),
+                              "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+
+def make_server(host: str, port: int, state: MockState) -> ThreadingHTTPServer:
+    handler = type("BoundMockOpenAIHandler", (MockOpenAIHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--chat-latency", default="lognormal:800:0.5", help="Latencia de chat (ms)")
+    parser.add_argument("--embed-latency", default="lognormal:60:0.3", help="Latencia de embeddings (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de solicitudes con error HTTP")
+    parser.add_argument("--error-codes", default="429,500,503", help="Códigos de error inyectados (al azar)")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fracción de solicitudes que no responden")
+    parser.add_argument("--hang-seconds", type=float, default=120.0)
+    parser.add_argument("--embedding-dim", type=int, default=DEFAULT_EMBEDDING_DIM)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    state = MockState(
+        args.chat_latency, args.embed_latency, args.error_rate,
+        [int(c) for c in args.error_codes.split(",") if c.strip()],
+        args.hang_rate, args.hang_seconds, args.embedding_dim, args.seed,
+    )
+    server = make_server(args.host, args.port, state)
+    print(f"Mock de OpenAI en http://{args.host}:{args.port}/v1 "
+          f"(chat {args.chat_latency}, embeddings {args.embed_latency}, errores {args.error_rate:.1%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()